@@ -1,7 +1,7 @@
 import os
-import re
-import pandas as pd
 import logging
+from adm_loader import load_adm_csv
+from cleaning import clean_values, normalize_headers
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,20 +12,16 @@ FILE_PATH = os.path.join(DOWNLOAD_DIR, 'ADM_ADA_Detail_Report.csv')
 CLEANED_CSV_PATH = os.path.join(DOWNLOAD_DIR, 'adm_ada_cleaned.csv')
 
 def clean_headers(header):
-    clean_header = header.lower().replace(' ', '_')
-    clean_header = re.sub(r'[^\w_]', '_', clean_header)
-    return clean_header
+    return normalize_headers([header])[0]
 
+# Cleaned all at once and memoized per set of headers (see cleaning.py)
 def process_headers(headers):
-    cleaned_headers = []
-    for header in headers:
-        cleaned_headers.append(clean_headers(header))
-    return cleaned_headers
+    return normalize_headers(headers)
 
 # Function to load, clean, and save the CSV
 def clean_csv():
-    # Load the CSV, skipping rows and setting headers as necessary
-    df = pd.read_csv(FILE_PATH, skiprows=range(1, 36), header=0, index_col=False, engine='python')
+    # Load the CSV; the loader finds where the data starts after IC's preamble
+    df = load_adm_csv(FILE_PATH)
 
     # Log details about the loaded data
     logging.info(f"Loaded CSV with {df.shape[0]} rows and {df.shape[1]} columns.")
@@ -38,6 +34,10 @@ def clean_csv():
 
     logging.info(f"Preview after dropped column:\n{df.head(10)}")
 
+    # Trim values and apply any adm_ada code maps in one pass. Dates are left as IC writes them (MM/DD/YYYY),
+    # the format the loads of adm_ada_cleaned.csv expect.
+    df = clean_values(df, report="adm_ada", dates=False)
+
     df.columns = process_headers(df.columns)
 
     logging.info(f"Preview after cleaning headers:\n{df.head(10)}")
@@ -0,0 +1,115 @@
+"""
+Title: ADM/ADA Detail Report Loader
+File Name: adm_loader.py
+Purpose: Load ADM_ADA_Detail_Report.csv with the fast CSV engines and without a hard-coded preamble length.
+Dependencies: pandas, pyarrow (optional, faster CSV engine)
+Description: IC writes the detail report as a header line, a preamble of report options and summary lines, and
+then the per-student rows under that header. The old read skipped a fixed 35 preamble lines with the python
+engine. That was slow, and if IC changed the preamble it would quietly load summary lines as data.
+find_data_start reads only the first HEADER_SCAN_BYTES of the file. The header is the first line with at least
+MIN_HEADER_FIELDS fields. A later line is a detail row when it has the header's width and its KEY_COLUMNS (the
+first column if the header names none of them) are filled. Widths are compared on the raw field counts as well as
+with trailing empty fields dropped, so detail rows whose last columns are blank still count. The data starts at
+the first of two consecutive detail rows, so a preamble line padded with commas to the header's width is not
+taken for data; a lone detail row only counts at the end of a file the scan read whole. load_adm_csv then parses
+from that line with the pyarrow engine (or the C engine).
+Every column is read as text unless a dtype is given, and usecols can limit which columns are read. If the scan
+does not find the data, the loader falls back to DEFAULT_PREAMBLE_ROWS and logs a warning.
+iter_adm_chunks reads the same rows in chunks of CHUNK_ROWS with the C engine, for callers that should not hold
+the whole season in memory.
+"""
+
+import io
+import os
+import csv
+import logging
+import pandas as pd
+from extract_parser import CSV_ENGINE, read_text_csv
+
+HEADER_SCAN_BYTES = 16 * 1024
+DEFAULT_PREAMBLE_ROWS = 35
+MIN_HEADER_FIELDS = 3
+CHUNK_ROWS = 100_000
+# Columns every detail row fills; preamble and school summary lines leave them blank
+KEY_COLUMNS = ("Student Number", "Date")
+
+
+def scan_lines(path, scan_bytes=HEADER_SCAN_BYTES):
+    """ Parse the complete lines in the first scan_bytes of a CSV into lists of fields. """
+    with open(path, "rb") as f:
+        head = f.read(scan_bytes)
+    if len(head) == scan_bytes:
+        head = head[:head.rfind(b"\n") + 1]  # Drop the line the scan cut in half
+    return list(csv.reader(io.StringIO(head.decode("utf-8-sig", errors="replace"))))
+
+
+def field_count(row):
+    """ Number of fields in a row, ignoring trailing empty fields. """
+    while row and not row[-1].strip():
+        row = row[:-1]
+    return len(row)
+
+
+def same_width(row, header):
+    """ True if a row has the header's number of fields, counted raw or with trailing empty fields dropped. """
+    return len(row) == len(header) or field_count(row) == field_count(header)
+
+
+def key_positions(header):
+    """ Positions of the KEY_COLUMNS in a header, or the first column if it names none of them. """
+    names = [name.strip() for name in header]
+    return [names.index(name) for name in KEY_COLUMNS if name in names] or [0]
+
+
+def is_detail_row(row, header, keys):
+    """ True if a row has the header's width and values in all key positions. """
+    return same_width(row, header) and all(i < len(row) and row[i].strip() for i in keys)
+
+
+def find_data_start(path, scan_bytes=HEADER_SCAN_BYTES):
+    """ Return (header line number, first data line number), or None if the scan did not find both. """
+    lines = scan_lines(path, scan_bytes)
+    header_line = next((i for i, row in enumerate(lines) if field_count(row) >= MIN_HEADER_FIELDS), None)
+    if header_line is None:
+        return None
+    header = lines[header_line]
+    keys = key_positions(header)
+    detail = [is_detail_row(row, header, keys) for row in lines]
+    read_whole = os.path.getsize(path) <= scan_bytes
+    for i in range(header_line + 1, len(lines)):
+        if detail[i] and (i + 1 < len(lines) and detail[i + 1] or i + 1 == len(lines) and read_whole):
+            return header_line, i
+    return None
+
+
+def read_header(path, header_line):
+    """ Column names from a header line, without trailing empty fields. """
+    row = scan_lines(path)[header_line]
+    return row[:field_count(row)]
+
+
+def locate_data(path):
+    """ Return (column names, first data line number), falling back to the fixed preamble if the scan fails. """
+    found = find_data_start(path)
+    if found is None:
+        header_line, data_start = 0, DEFAULT_PREAMBLE_ROWS + 1
+        logging.warning(f"Could not find the data rows in {path}; assuming {DEFAULT_PREAMBLE_ROWS} preamble lines")
+    else:
+        header_line, data_start = found
+        preamble = data_start - header_line - 1
+        if preamble != DEFAULT_PREAMBLE_ROWS:
+            logging.warning(f"ADM/ADA preamble is {preamble} lines instead of {DEFAULT_PREAMBLE_ROWS}")
+    return read_header(path, header_line), data_start
+
+
+def load_adm_csv(path, usecols=None, dtype=None, engine=CSV_ENGINE):
+    """ Load the ADM/ADA detail report. Columns are text unless dtype ({column: type}) says otherwise. """
+    names, data_start = locate_data(path)
+    return read_text_csv(path, skip_rows=data_start, names=names, usecols=usecols, dtype=dtype, engine=engine)
+
+
+def iter_adm_chunks(path, chunk_rows=CHUNK_ROWS, usecols=None):
+    """ Yield the ADM/ADA detail report as text DataFrames of at most chunk_rows rows. """
+    names, data_start = locate_data(path)
+    yield from pd.read_csv(path, header=None, names=names, skiprows=data_start, usecols=usecols, dtype=str,
+                           keep_default_na=False, index_col=False, engine="c", chunksize=chunk_rows)
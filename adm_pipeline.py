@@ -0,0 +1,122 @@
+"""
+Title: ADM/ADA Chunked Pipeline
+File Name: adm_pipeline.py
+Purpose: Clean the ADM/ADA detail report and build its ADM/ADA summaries without holding the season in memory.
+Dependencies: pandas, adm_loader.py, cleaning.py
+Description: The detail report covers every student for every day from the first day of school through
+yesterday, so it grows all year. process_adm_report reads it in chunks of adm_loader.CHUNK_ROWS rows. Each
+chunk is appended to the cleaned detail CSV and reduced to membership and attendance sums per school, grade and
+day, and those sums are added to running totals. Memory is bounded by the chunk size plus the totals, which hold
+one row per school, grade and day.
+The summaries are written next to the cleaned detail:
+ - <name>_daily.csv: membership (ADM), attendance (ADA) and the attendance rate per school, grade and day
+ - <name>_by_grade.csv: average daily membership and attendance per school and grade over the date range
+ - <name>_by_school.csv: the same per school
+The report's column names are in ADM_COLUMNS, and the JSON file ADM_COLUMN_FILE can override them with the same
+shape. If a column is missing, only the cleaned detail is written.
+"""
+
+import os
+import json
+import logging
+import pandas as pd
+from adm_loader import CHUNK_ROWS, iter_adm_chunks
+from cleaning import normalize_headers
+
+ADM_COLUMN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "adm_columns.json")
+
+# Detail report columns the summaries are built from
+ADM_COLUMNS = {
+    "school": "School Name",
+    "grade": "Grade",
+    "date": "Date",
+    "membership": "Membership",
+    "attendance": "Attendance",
+}
+DROP_COLUMNS = ["Student Count"]
+GROUP_KEYS = ["school", "grade", "date"]
+
+
+def get_adm_columns(column_file=ADM_COLUMN_FILE):
+    """ ADM_COLUMNS with any overrides from ADM_COLUMN_FILE. """
+    columns = dict(ADM_COLUMNS)
+    try:
+        with open(column_file) as f:
+            columns.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return columns
+
+
+def daily_sums(chunk, columns):
+    """ Membership and attendance sums per school, grade and day for one chunk. """
+    frame = pd.DataFrame({key: chunk[columns[key]] for key in GROUP_KEYS})
+    for key in ("membership", "attendance"):
+        frame[key] = pd.to_numeric(chunk[columns[key]], errors="coerce").fillna(0)
+    return frame.groupby(GROUP_KEYS, sort=False)[["membership", "attendance"]].sum()
+
+
+def add_sums(totals, sums):
+    """ Add one chunk's sums to the running totals. """
+    return sums if totals is None else totals.add(sums, fill_value=0)
+
+
+def summarize(totals, keys):
+    """ Average daily membership and attendance over the days in the range, per group. """
+    summary = totals.groupby(keys).agg(days=("date", "nunique"), membership=("membership", "sum"),
+                                       attendance=("attendance", "sum"))
+    summary["adm"] = summary["membership"] / summary["days"]
+    summary["ada"] = summary["attendance"] / summary["days"]
+    summary["ada_rate"] = summary["attendance"] / summary["membership"].where(summary["membership"] > 0)
+    return summary.drop(columns=["membership", "attendance"]).reset_index()
+
+
+def write_summaries(totals, output_path):
+    """ Write the daily, per-grade and per-school tables next to output_path. Returns their paths. """
+    base = os.path.splitext(output_path)[0]
+    daily = totals.reset_index()
+    daily["date"] = pd.to_datetime(daily["date"], errors="coerce", format="mixed").dt.strftime("%Y-%m-%d").fillna(daily["date"])
+    daily["ada_rate"] = daily["attendance"] / daily["membership"].where(daily["membership"] > 0)
+    tables = {
+        f"{base}_daily.csv": daily.sort_values(GROUP_KEYS),
+        f"{base}_by_grade.csv": summarize(daily, ["school", "grade"]),
+        f"{base}_by_school.csv": summarize(daily, ["school"]),
+    }
+    for path, table in tables.items():
+        table.to_csv(path, index=False)
+    return list(tables)
+
+
+def process_adm_report(source_path, output_path, clean_headers=False, chunk_rows=CHUNK_ROWS):
+    """ Stream the detail report to a cleaned CSV and write the summary tables.
+
+    Returns {"rows", "columns", "summaries"}; summaries is empty when the report lacks a summary column.
+    """
+    columns = get_adm_columns()
+    totals = None
+    summarizable = True
+    rows = 0
+    width = 0
+    tmp_path = f"{output_path}.part"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as output:
+        for number, chunk in enumerate(iter_adm_chunks(source_path, chunk_rows)):
+            if number == 0:
+                missing = [name for name in columns.values() if name not in chunk.columns]
+                if missing:
+                    logging.warning(f"ADM/ADA report has no {missing} columns; writing the detail without summaries")
+                    summarizable = False
+            if summarizable:
+                totals = add_sums(totals, daily_sums(chunk, columns))
+            chunk = chunk.drop(columns=[c for c in DROP_COLUMNS if c in chunk.columns])
+            if clean_headers:
+                chunk.columns = normalize_headers(chunk.columns)
+            chunk.to_csv(output, index=False, header=number == 0)
+            rows += len(chunk)
+            width = chunk.shape[1]
+    os.replace(tmp_path, output_path)
+    logging.info(f"Cleaned ADM/ADA detail saved to {output_path} ({rows} rows)")
+
+    summaries = write_summaries(totals, output_path) if summarizable and totals is not None else []
+    for path in summaries:
+        logging.info(f"ADM/ADA summary saved to {path}")
+    return {"rows": rows, "columns": width, "summaries": summaries}
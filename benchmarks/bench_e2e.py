@@ -0,0 +1,149 @@
+"""
+Title: End-to-End Bot Benchmark
+File Name: benchmarks/bench_e2e.py
+Purpose: Run the full bots in headless Chrome against the local Infinite Campus stub and time every stage, so
+changes to navigation, waits and parsing can be compared run to run without the live site.
+Dependencies: benchmarks/ic_stub_server.py, tracing.py, Chrome and chromedriver, and the bots' own dependencies
+Description: Starts benchmarks/ic_stub_server.py and writes a credentials file for it to a scratch directory.
+Every path the bots write to (downloads, log, traces, run history, archive, session, Sheets spool and quota,
+frame and report index caches) is pointed into that directory with the IC_* environment variables. Google
+Sheets logging is disabled, so the bots' log rows stay in the scratch spool instead of the production workbook. Each
+scenario then runs as its own process --runs times:
+ - base: ic_base_script.py, clicking through the Data Viewer one report at a time
+ - parallel: ic_base_script.py with IC_MAX_WORKERS=2
+ - http: ic_base_script.py with IC_EXPORT_MODE=http
+ - adm: ic_ada_adm.py (it always sleeps 60 seconds after clicking generate)
+ - sso: ic_base_script.py against the single sign-on login variant
+The saved session is removed before each run, so every run logs in. The script prints the wall time and exit
+code of each run, then the median seconds per trace span for each scenario.
+Usage: python -m benchmarks.bench_e2e [--scenarios base,http] [--runs 3] [--config stub.json] [--keep DIR]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from benchmarks.ic_stub_server import load_stub_config, start_stub_server, stub_credentials
+from tracing import iter_spans
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = {
+    "base": ("ic_base_script.py", {}, {}),
+    "parallel": ("ic_base_script.py", {"IC_MAX_WORKERS": "2"}, {}),
+    "http": ("ic_base_script.py", {"IC_EXPORT_MODE": "http"}, {}),
+    "adm": ("ic_ada_adm.py", {}, {}),
+    "sso": ("ic_base_script.py", {}, {"login_mode": "sso"}),
+}
+RUN_TIMEOUT = 1800  # seconds
+
+
+def bot_environment(work_dir, config_path):
+    """ Environment for a bot process with every output path under work_dir. """
+    env = dict(os.environ)
+    env.update({
+        "IC_CONFIG_FILE": config_path,
+        "IC_DOWNLOAD_DIR": os.path.join(work_dir, "downloads") + os.sep,
+        "IC_LOG_FILE": os.path.join(work_dir, "icampus_reports.log"),
+        "IC_TRACE_FILE": os.path.join(work_dir, "ic_traces.jsonl"),
+        "IC_HISTORY_DB": os.path.join(work_dir, "run_history.db"),
+        "IC_ARCHIVE_DIR": os.path.join(work_dir, "archive") + os.sep,
+        "IC_SESSION_FILE": os.path.join(work_dir, "ic_session.enc"),
+        "IC_SESSION_KEY_FILE": os.path.join(work_dir, "ic_session.key"),
+        "IC_SHEETS_SPOOL_DIR": os.path.join(work_dir, "sheets_spool") + os.sep,
+        "IC_SHEETS_QUOTA_DB": os.path.join(work_dir, "sheets_quota.db"),
+        "IC_SHEETS_DISABLED": "1",
+        "IC_FRAME_CACHE_FILE": os.path.join(work_dir, "frame_paths.json"),
+        "IC_REPORT_INDEX_FILE": os.path.join(work_dir, "report_index.json"),
+    })
+    os.makedirs(env["IC_DOWNLOAD_DIR"], exist_ok=True)
+    return env
+
+
+def run_bot(script, env):
+    """ Run one bot process. Returns (wall seconds, exit code, run ids it added to the trace file). """
+    before = {record.get("run_id") for record in iter_spans(env["IC_TRACE_FILE"])}
+    start = time.perf_counter()
+    try:
+        code = subprocess.run([sys.executable, script], cwd=REPO_DIR, env=env, timeout=RUN_TIMEOUT).returncode
+    except subprocess.TimeoutExpired:
+        code = "timeout"
+    seconds = time.perf_counter() - start
+    run_ids = {record.get("run_id") for record in iter_spans(env["IC_TRACE_FILE"])} - before
+    return seconds, code, run_ids
+
+
+def span_seconds(trace_file, run_ids):
+    """ {span name: total seconds in the run}, summed over the given run ids. """
+    totals = {}
+    for record in iter_spans(trace_file):
+        if record.get("run_id") in run_ids:
+            totals[record["name"]] = totals.get(record["name"], 0) + record.get("seconds", 0)
+    return totals
+
+
+def run_scenario(name, args, work_root):
+    script, extra_env, config_overrides = SCENARIOS[name]
+    config = load_stub_config(args.config)
+    config.update(config_overrides)
+    server, base_url = start_stub_server(config)
+    work_dir = os.path.join(work_root, name)
+    os.makedirs(work_dir, exist_ok=True)
+    config_path = os.path.join(work_dir, "credentials_all.json")
+    with open(config_path, "w") as f:
+        json.dump(stub_credentials(base_url, config), f, indent=2)
+    env = bot_environment(work_dir, config_path)
+    env.update(extra_env)
+
+    per_run = []
+    try:
+        for run in range(args.runs):
+            if os.path.exists(env["IC_SESSION_FILE"]):
+                os.remove(env["IC_SESSION_FILE"])
+            seconds, code, run_ids = run_bot(script, env)
+            print(f"{name:<10} run {run + 1}: {seconds:8.1f}s  exit {code}")
+            per_run.append(span_seconds(env["IC_TRACE_FILE"], run_ids))
+    finally:
+        server.shutdown()
+    return per_run
+
+
+def print_spans(name, per_run):
+    names = sorted({span for run in per_run for span in run}, key=lambda span: -statistics.median(
+        run.get(span, 0) for run in per_run))
+    print(f"\n{name}: median seconds per span over {len(per_run)} runs")
+    for span in names:
+        values = [run.get(span, 0) for run in per_run]
+        print(f"  {span:<24}{statistics.median(values):>9.2f}{max(values):>9.2f} max")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the full bots against the local Infinite Campus stub.")
+    parser.add_argument("--scenarios", default="base,http,adm", help=f"Comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--config", help="Stub config JSON overriding ic_stub_server.DEFAULT_CONFIG")
+    parser.add_argument("--keep", help="Keep downloads, logs and traces in this directory")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    work_root = args.keep or tempfile.mkdtemp(prefix="bench_e2e_")
+    try:
+        results = {name: run_scenario(name, args, work_root) for name in scenarios}
+        for name, per_run in results.items():
+            print_spans(name, per_run)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_root, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
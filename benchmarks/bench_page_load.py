@@ -0,0 +1,76 @@
+"""
+Title: Lean Chrome Profile Page-Load Benchmark
+File Name: benchmarks/bench_page_load.py
+Purpose: Compare page-load time and Chrome memory with and without the navigator lean profile.
+Dependencies: navigator.py, psutil (optional, for Chrome RSS)
+Description: Loads each URL a number of times in a default and a lean Chrome, and reads the browser's
+Navigation Timing (navigationStart to loadEventEnd). When psutil is installed it also sums the resident memory
+of chromedriver's Chrome processes. Prints one row per profile with the median and max load time and peak RSS.
+Usage: python -m benchmarks.bench_page_load URL [URL ...] [--runs 5]
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from navigator import setup_chromedriver
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+LOAD_TIME_SCRIPT = "return performance.timing.loadEventEnd - performance.timing.navigationStart;"
+
+
+def chrome_rss_mb(driver):
+    """ Resident memory of chromedriver and every Chrome process under it, in MB. None without psutil. """
+    if psutil is None:
+        return None
+    try:
+        service = psutil.Process(driver.service.process.pid)
+        processes = [service] + service.children(recursive=True)
+        return sum(p.memory_info().rss for p in processes if p.is_running()) / (1024 * 1024)
+    except psutil.Error:
+        return None
+
+
+def measure(urls, runs, lean):
+    """ Load every URL `runs` times in a fresh Chrome. Returns (load times in ms, peak RSS in MB). """
+    driver = setup_chromedriver(tempfile.mkdtemp(prefix="bench_page_load_"), lean=lean)
+    load_times = []
+    peak_rss = None
+    try:
+        for _ in range(runs):
+            for url in urls:
+                # A blank page between loads keeps the timings from overlapping
+                driver.get("about:blank")
+                driver.get(url)
+                while driver.execute_script("return performance.timing.loadEventEnd;") == 0:
+                    time.sleep(0.05)
+                load_times.append(driver.execute_script(LOAD_TIME_SCRIPT))
+                rss = chrome_rss_mb(driver)
+                if rss is not None:
+                    peak_rss = max(peak_rss or 0, rss)
+    finally:
+        driver.quit()
+    return load_times, peak_rss
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="+", help="Pages to load, e.g. the IC login page")
+    parser.add_argument("--runs", type=int, default=5, help="Loads per URL per profile")
+    args = parser.parse_args(argv)
+
+    print(f"{'profile':<8} {'loads':>5} {'median ms':>10} {'max ms':>8} {'peak RSS MB':>12}")
+    for name, lean in [("default", False), ("lean", True)]:
+        load_times, peak_rss = measure(args.urls, args.runs, lean)
+        rss = f"{peak_rss:.0f}" if peak_rss is not None else "n/a"
+        print(f"{name:<8} {len(load_times):>5} {statistics.median(load_times):>10.0f} {max(load_times):>8.0f} {rss:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
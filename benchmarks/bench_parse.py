@@ -0,0 +1,312 @@
+"""
+Title: Parse Benchmark Suite
+File Name: benchmarks/bench_parse.py
+Purpose: Time and memory-profile every extract and ADM/ADA parse path at sizes from 1k to 5M rows, fail on
+regressions against a stored baseline, and show where each parser stops scaling.
+Dependencies: benchmarks/synthetic_extracts.py, extract_parser.py, adm_loader.py, adm_pipeline.py,
+ada_adm_cleaning.py, pandas, pyarrow (optional), lxml or bs4 + html5lib (required for pd.read_html)
+Description: For each size, synthetic_extracts writes an extract in every format and an ADM/ADA detail report.
+Each case in CASES then runs in its own process, so its peak memory can be read from the process's maximum RSS.
+The peak is reported as the growth over the RSS after imports. A case runs --repeat times, each in a fresh
+process, and keeps the best time and the highest peak. Repeats inside one process would raise the peak, because
+pyarrow's memory pool keeps memory from the earlier runs. The cases:
+ - extract_html, extract_csv, extract_tab: extract_parser.convert_extract run through profile_parse, the
+   parse ic_base_script.wait_for_download runs, so profiling overhead counts too (IC_TRACE_MALLOC is passed on)
+ - pandas_read_html: the pd.read_html(header=1) parse it replaced, run only up to --legacy-max-rows. It needs
+   lxml or bs4 + html5lib; without them the script stops before running anything (leave the case out of --cases
+   to run the others)
+ - adm_clean_csv: ada_adm_cleaning.clean_csv
+ - adm_load: adm_loader.load_adm_csv
+ - adm_pipeline: adm_pipeline.process_adm_report (chunked)
+ - adm_python_engine: the fixed-skip python-engine read that adm_loader replaced, up to --legacy-max-rows
+The results table shows seconds, rows per second and peak MB. Below it, each case gets a scaling line: the size
+where throughput fell under SCALING_FLOOR of the case's best, and MB per 100k rows at the largest size.
+With --save-baseline the results are merged into BASELINE_FILE, and sizes and cases not run keep their entries.
+Otherwise they are compared with it, and the script exits 1 if a case got slower by more than TIME_TOLERANCE,
+used more memory than MEMORY_TOLERANCE allows, parsed a different number of rows, or has a baseline entry but no
+result this run. The baseline depends on
+the machine, so save it on the machine that checks it. The committed baseline covers 1k to 5M rows; the legacy
+cases stop at --legacy-max-rows, except pandas_read_html, which stops at 100k because it needs about 5.5 GB at 1M
+and the baseline machine has 5 GB.
+Usage:
+    python -m benchmarks.bench_parse [--sizes 1k,10k,100k] [--cases extract_html,adm_load] [--repeat 3]
+    python -m benchmarks.bench_parse --sizes 1k,10k,100k,1M,5M --save-baseline
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import importlib.util
+from benchmarks.synthetic_extracts import parse_size, write_adm_report, write_extract
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_FILE = os.path.join(BENCH_DIR, "parse_baseline.json")
+DEFAULT_SIZES = "1k,10k,100k"
+EXTRACT_COLUMNS = 12
+TIME_TOLERANCE = 0.25  # fraction slower than the baseline that fails
+MEMORY_TOLERANCE = 0.25  # fraction more peak memory than the baseline that fails
+MIN_SECONDS_DELTA = 0.25  # timing noise ignored at small sizes
+MIN_MB_DELTA = 5.0  # memory noise ignored at small sizes
+SCALING_FLOOR = 0.5  # throughput under this fraction of the case's best counts as no longer scaling
+LEGACY_MAX_ROWS = 1_000_000
+
+# case: (input file kind, function run in the child process)
+CASES = {
+    "extract_html": ("html", "run_convert"),
+    "extract_csv": ("csv", "run_convert"),
+    "extract_tab": ("tab", "run_convert"),
+    "pandas_read_html": ("html", "run_read_html"),
+    "adm_clean_csv": ("adm", "run_clean_csv"),
+    "adm_load": ("adm", "run_load_adm"),
+    "adm_pipeline": ("adm", "run_adm_pipeline"),
+    "adm_python_engine": ("adm", "run_python_engine"),
+}
+LEGACY_CASES = {"pandas_read_html", "adm_python_engine"}
+INPUT_FILES = {"html": "extract.html", "csv": "extract.csv", "tab": "extract.txt", "adm": "ADM_ADA_Detail_Report.csv"}
+
+
+# Child process: each function parses source, writes any output under work_dir, and returns the data row count
+
+def run_convert(source, work_dir, kind):
+    from extract_parser import convert_extract, profile_parse
+    rows, _, _ = profile_parse(convert_extract, source, os.path.join(work_dir, "out.csv"), kind)
+    return rows or 0
+
+
+def run_read_html(source, work_dir, kind):
+    import pandas as pd
+    df = pd.read_html(source, header=1)[0]
+    df = df[df.iloc[:, 0] != "All Records"]
+    df.to_csv(os.path.join(work_dir, "out.csv"), index=False)
+    return len(df)
+
+
+def run_clean_csv(source, work_dir, kind):
+    import ada_adm_cleaning
+    ada_adm_cleaning.FILE_PATH = source
+    ada_adm_cleaning.CLEANED_CSV_PATH = os.path.join(work_dir, "adm_ada_cleaned.csv")
+    ada_adm_cleaning.clean_csv()
+    with open(ada_adm_cleaning.CLEANED_CSV_PATH, "rb") as f:
+        return sum(1 for _ in f) - 1
+
+
+def run_load_adm(source, work_dir, kind):
+    from adm_loader import load_adm_csv
+    return len(load_adm_csv(source))
+
+
+def run_adm_pipeline(source, work_dir, kind):
+    from adm_pipeline import process_adm_report
+    return process_adm_report(source, os.path.join(work_dir, "adm_ada.csv"))["rows"]
+
+
+def run_python_engine(source, work_dir, kind):
+    import pandas as pd
+    from adm_loader import DEFAULT_PREAMBLE_ROWS
+    return len(pd.read_csv(source, skiprows=range(1, DEFAULT_PREAMBLE_ROWS + 1), header=0, index_col=False, engine="python"))
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def child(case, source, work_dir, repeat):
+    """ Run one case `repeat` times in this process and print {"seconds", "peak_mb", "rows"} as JSON. """
+    import logging
+    logging.disable(logging.CRITICAL)  # clean_csv logs DataFrame previews
+    kind, function = CASES[case]
+    import pandas  # noqa: F401 - imported before the RSS baseline, like in the scripts
+    if importlib.util.find_spec("pyarrow"):
+        import pyarrow.csv  # noqa: F401
+    baseline = max_rss_mb()
+    best = None
+    rows = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = globals()[function](source, work_dir, kind)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    print(json.dumps({"seconds": round(best, 4), "peak_mb": round(max_rss_mb() - baseline, 1), "rows": rows}))
+
+
+# Parent process
+
+def missing_dependency(case):
+    """ None if the case can run here, else what it needs. """
+    if case == "pandas_read_html" and not (importlib.util.find_spec("lxml") or
+                                           (importlib.util.find_spec("bs4") and importlib.util.find_spec("html5lib"))):
+        return "lxml or bs4 + html5lib"
+    return None
+
+
+def write_inputs(data_dir, rows, kinds):
+    """ Write the synthetic inputs for one size, reusing files already there. Returns {kind: path}. """
+    paths = {}
+    for kind in kinds:
+        path = os.path.join(data_dir, f"{rows}_{INPUT_FILES[kind]}")
+        if not os.path.exists(path):
+            if kind == "adm":
+                write_adm_report(f"{path}.tmp", rows)
+            else:
+                write_extract(f"{path}.tmp", rows, EXTRACT_COLUMNS, kind)
+            os.replace(f"{path}.tmp", path)
+        paths[kind] = path
+    return paths
+
+
+def run_case(case, source, repeat):
+    """ Run a case in `repeat` fresh processes; keep the best time and the highest peak. """
+    runs = []
+    for _ in range(repeat):
+        work_dir = tempfile.mkdtemp(prefix=f"bench_parse_{case}_")
+        try:
+            result = subprocess.run([sys.executable, "-m", "benchmarks.bench_parse", "--child", case, source, work_dir,
+                                     "--repeat", "1"], cwd=REPO_DIR, capture_output=True, text=True)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if result.returncode != 0:
+            return {"error": (result.stderr.strip().splitlines() or ["failed"])[-1]}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {"seconds": min(run["seconds"] for run in runs), "peak_mb": max(run["peak_mb"] for run in runs),
+            "rows": runs[-1]["rows"]}
+
+
+def scaling_summary(case, by_size):
+    """ One line on where a case stops scaling: throughput against its best, and memory per row. """
+    measured = sorted((int(size), result) for size, result in by_size.items() if "seconds" in result)
+    if not measured:
+        return f"{case:<20} no results"
+    throughput = [(size, size / max(result["seconds"], 1e-9)) for size, result in measured]
+    best = max(rate for _, rate in throughput)
+    best_size = next(size for size, rate in throughput if rate == best)
+    drop = next((size for size, rate in throughput if size > best_size and rate < SCALING_FLOOR * best), None)
+    largest, result = measured[-1]
+    per_100k = result["peak_mb"] / largest * 100_000
+    if len(measured) == 1:
+        scaling = "one size only"
+    elif drop:
+        scaling = f"throughput under {SCALING_FLOOR:.0%} of best from {drop:,} rows"
+    else:
+        scaling = "scales linearly"
+    return f"{case:<20} best {best:>12,.0f} rows/s at {best_size:,}; {scaling}; {per_100k:.1f} MB per 100k rows at {largest:,}"
+
+
+def compare(results, baseline, expected):
+    """ Regressions of results against baseline, as messages. expected is the (case, size) pairs this run was
+    meant to measure; one with a baseline entry but no result is a failure rather than a pass. """
+    failures = []
+    for case, size in expected:
+        if size in baseline.get("results", {}).get(case, {}) and size not in results.get(case, {}):
+            failures.append(f"{case} at {size} rows: no result, but the baseline has one")
+    for case, by_size in results.items():
+        for size, result in by_size.items():
+            base = baseline.get("results", {}).get(case, {}).get(size)
+            if base is None or "seconds" not in result or "seconds" not in base:
+                continue
+            if result["rows"] != base["rows"]:
+                failures.append(f"{case} at {size} rows: parsed {result['rows']} rows, baseline {base['rows']}")
+            if result["seconds"] > base["seconds"] * (1 + TIME_TOLERANCE) and result["seconds"] - base["seconds"] > MIN_SECONDS_DELTA:
+                failures.append(f"{case} at {size} rows: {result['seconds']:.3f}s, baseline {base['seconds']:.3f}s")
+            if result["peak_mb"] > base["peak_mb"] * (1 + MEMORY_TOLERANCE) + MIN_MB_DELTA:
+                failures.append(f"{case} at {size} rows: peak {result['peak_mb']:.1f} MB, baseline {base['peak_mb']:.1f} MB")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile the extract and ADM/ADA parsers.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated row counts, e.g. 1k,100k,5M")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"Comma-separated, from {', '.join(CASES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case and size; the best time is kept")
+    parser.add_argument("--legacy-max-rows", type=parse_size, default=LEGACY_MAX_ROWS,
+                        help="Largest size for the pandas parsers that were replaced")
+    parser.add_argument("--data-dir", help="Keep the synthetic inputs here and reuse them on the next run")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write these results as the baseline")
+    parser.add_argument("--child", nargs=3, metavar=("CASE", "SOURCE", "WORK_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(*args.child, args.repeat)
+        return 0
+
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(unknown)}")
+    missing = {case: missing_dependency(case) for case in cases if missing_dependency(case)}
+    if missing:
+        parser.error("; ".join(f"{case} needs {needs}" for case, needs in missing.items()) +
+                     " (install it, or leave the case out of --cases)")
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench_parse_data_")
+    os.makedirs(data_dir, exist_ok=True)
+
+    results = {case: {} for case in cases}
+    expected = []
+    print(f"{'case':<20}{'rows':>10}{'seconds':>10}{'rows/s':>12}{'peak MB':>10}")
+    try:
+        for size in sizes:
+            inputs = write_inputs(data_dir, size, {CASES[case][0] for case in cases})
+            for case in cases:
+                if case in LEGACY_CASES and size > args.legacy_max_rows:
+                    print(f"{case:<20}{size:>10,}  skipped: over --legacy-max-rows {args.legacy_max_rows:,}")
+                    continue
+                expected.append((case, str(size)))
+                result = run_case(case, inputs[CASES[case][0]], args.repeat)
+                results[case][str(size)] = result
+                if "error" in result:
+                    print(f"{case:<20}{size:>10,}  error: {result['error']}")
+                else:
+                    rate = size / max(result["seconds"], 1e-9)
+                    print(f"{case:<20}{size:>10,}{result['seconds']:>10.3f}{rate:>12,.0f}{result['peak_mb']:>10.1f}")
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print("\nScaling")
+    for case, by_size in results.items():
+        if by_size:
+            print(scaling_summary(case, by_size))
+
+    errors = [f"{case} at {size} rows: {result['error']}"
+              for case, by_size in results.items() for size, result in by_size.items() if "error" in result]
+    if args.save_baseline:
+        # Sizes and cases not run this time keep their baseline, so large sizes can be added separately
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                saved = json.load(f).get("results", {})
+        for case, by_size in results.items():
+            saved.setdefault(case, {}).update({size: result for size, result in by_size.items() if "error" not in result})
+        baseline = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "host": platform.node(),
+                    "python": platform.python_version(), "results": saved}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 1 if errors else 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return 1 if errors else 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    failures = errors + compare(results, baseline, expected)
+    if failures:
+        print(f"\nRegressions against the baseline from {baseline.get('created')} on {baseline.get('host')}:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"\nNo regressions against the baseline from {baseline.get('created')} on {baseline.get('host')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""
+Title: Infinite Campus Stub Server
+File Name: benchmarks/ic_stub_server.py
+Purpose: Serve local copies of the Infinite Campus pages the bots drive, so full runs can be timed and tested
+without the live district site.
+Dependencies: benchmarks/synthetic_extracts.py (payloads)
+Description: A threaded HTTP server that mimics the pages the bots use:
+ - /campus/portal/login: the login form (#username, #password, #signinbtn) with a single sign-on link above it.
+   With "login_mode" "sso" the sign-in answers with IC's "requires the use of the login button above" alert and
+   only the SSO link logs in. With "error" it shows an error banner.
+ - /campus/home: the "Infinite Campus" home page.
+ - /campus/dataviewer (reports_url): the frame chain frameWorkspace > frameWorkspaceWrapper > frameWorkspaceDetail
+   > reportList. The report list has one tr id="row<ID>" per report, with the report name in the third cell, plus
+   "list_padding" filler rows. Clicking a name puts the settings form (#mode, #calendarID, #next) in
+   frameWorkspaceDetail.
+ - /campus/export/<ID>: the generated extract, sent as an extract.html / extract.csv / extract.txt download after
+   the report's generation delay. The settings form posts here, and so does ic_http_export (export_url).
+ - /campus/adm (ada_adm_url): the "ADM & ADA Report Options" page. #sbutton opens a report window and downloads
+   ADM_ADA_Detail_Report.csv after the ADM generation delay.
+Pages past the login redirect to it without the session cookie, like IC. Delays, report sizes and the login
+variant come from DEFAULT_CONFIG, overridden by a JSON file with the same keys (--config or IC_STUB_CONFIG).
+Payloads are written once per report, format and size to a cache directory and streamed at "download_rate"
+bytes per second (0 for no limit).
+Usage:
+    python -m benchmarks.ic_stub_server [--port 8765] [--config stub.json]
+prints the credentials_all.json "infinitecampus" section that points the bots at it.
+benchmarks/bench_e2e.py starts the server itself.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import secrets
+import argparse
+import tempfile
+import threading
+from html import escape
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.synthetic_extracts import write_adm_report, write_extract
+
+STUB_CONFIG = os.environ.get("IC_STUB_CONFIG")
+SESSION_COOKIE = "JSESSIONID"
+LOGIN_TITLE = "Login | Metro Nashville Public Schools LIVE Site"
+SSO_ALERT = ("This user account requires the use of the login button above the Campus username and password "
+             "text boxes.")
+STREAM_CHUNK = 64 * 1024
+
+DEFAULT_CONFIG = {
+    "username": "bench",
+    "password": "bench",
+    "login_mode": "normal",  # "normal", "sso" or "error"
+    "login_delay": 0.5,  # seconds before the sign-in answers
+    "page_delay": 0.0,  # seconds added to every page
+    "generation_delay": 2.0,  # seconds before an export starts to download
+    "download_rate": 0,  # bytes per second, 0 for no limit
+    "list_padding": 200,  # filler rows in the report list
+    "calendars": ["4163", "4164", "4165", "4166"],
+    # Data Viewer reports: row id, name in the list, data rows and columns of the extract
+    "reports": {
+        "student_data": {"row_id": 84450, "name": "KIPP Student Data", "rows": 2000, "columns": 30},
+        "suspensions": {"row_id": 84451, "name": "KIPP Suspensions", "rows": 300, "columns": 12},
+        "incidents": {"row_id": 84452, "name": "KIPP Incidents", "rows": 500, "columns": 15},
+        "ell_export": {"row_id": 84453, "name": "KIPP ELL Export", "rows": 400, "columns": 10},
+        "attendance_codes": {"row_id": 84454, "name": "KIPP Attendance Codes", "rows": 0, "columns": 8},
+        "section_enrollments": {"row_id": 84455, "name": "KIPP Section Enrollments", "rows": 5000, "columns": 14},
+        "dc_export": {"row_id": 84456, "name": "KIPP DC Export", "rows": 1500, "columns": 20},
+    },
+    # ADM/ADA detail report: students * school days rows
+    "adm": {"students": 500, "days": 20, "generation_delay": 5.0},
+}
+
+EXPORT_FILES = {"html": ("extract.html", "text/html"), "csv": ("extract.csv", "text/csv"),
+                "tab": ("extract.txt", "text/plain")}
+
+
+def load_stub_config(config_path=STUB_CONFIG):
+    """ DEFAULT_CONFIG with the keys of the JSON file at config_path (if any) replacing the defaults. """
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if config_path:
+        with open(config_path) as f:
+            config.update(json.load(f))
+    return config
+
+
+def page(title, body, head=""):
+    return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{escape(title)}</title>{head}</head>"
+            f"<body>{body}</body></html>")
+
+
+def frame_page(name, src):
+    return page("", f'<iframe name="{name}" id="{name}" src="{src}" width="100%" height="900"></iframe>')
+
+
+def login_page(message=""):
+    return page(LOGIN_TITLE, f"""
+<a id="ssoLogin" href="/campus/sso">Log in with District SSO</a>
+{message}
+<form id="loginForm" method="post" action="/campus/verify">
+  <input id="username" name="username" type="text">
+  <input id="password" name="password" type="password">
+  <button id="signinbtn" type="submit">Log In</button>
+</form>""")
+
+
+def report_list_page(config):
+    rows = [(spec["row_id"], spec["name"]) for spec in config["reports"].values()]
+    rows += [(90000 + i, f"Filler Report {i}") for i in range(config["list_padding"])]
+    random.Random(0).shuffle(rows)
+    body = "".join(f'<tr id="row{row_id}"><td><input type="checkbox"></td><td>Student</td>'
+                   f'<td onclick="parent.openReport(\'{row_id}\', \'{escape(name)}\')">{escape(name)}</td></tr>'
+                   for row_id, name in rows)
+    return page("", f'<table id="reportTable"><tbody>{body}</tbody></table>')
+
+
+def detail_page(config):
+    options = "".join(f'<option value="{calendar}">School {calendar}</option>' for calendar in config["calendars"])
+    script = f"""<script>
+function openReport(id, name) {{
+  document.getElementById("settings").innerHTML =
+    '<h3>' + name + '</h3>' +
+    '<form id="settingsForm" method="post" target="downloadFrame" action="/campus/export/' + id + '">' +
+    '<select id="mode" name="mode"><option value="pdf">PDF</option><option value="html">HTML</option>' +
+    '<option value="csv">CSV</option><option value="tab">Tab Delimited</option></select>' +
+    '<select id="calendarID" name="calendarID" multiple>{options}</select>' +
+    '<button id="next" type="submit">Generate Extract</button></form>';
+}}
+</script>"""
+    return page("", '<div id="settings"></div>'
+                    '<iframe name="reportList" id="reportList" src="/campus/frames/report_list" width="100%" height="600"></iframe>'
+                    '<iframe name="downloadFrame" id="downloadFrame" style="display:none"></iframe>', script)
+
+
+def adm_page(config):
+    filler = "".join(f"<tr><td>Option {i}</td></tr>" for i in range(1, 10))
+    options = "".join(f'<option value="{calendar}">School {calendar}</option>' for calendar in config["calendars"])
+    return page("ADM & ADA Report Options", f"""
+<form id="reportOptions" method="post" action="/campus/adm_export" target="admDownload"><table><tbody>
+  <tr><td>End Date <input id="endDate" name="endDate" type="text"></td></tr>
+  <tr><td><input type="radio" name="detail" value="summary" title="summary information only">
+      <input type="radio" name="detail" value="detail" title="summary information + data for each student"></td></tr>
+  <tr><td><select id="format" name="format"><option value="pdf">PDF</option><option value="csv">CSV</option></select></td></tr>
+  <tr><td><table><tbody>{filler}<tr><td><label><input type="radio" name="calc" value="calendar">Calendar</label><label><input type="radio" name="calc" value="calculation">Calculation</label></td></tr></tbody></table></td>
+      <td><select id="calendarID" name="calendarID" multiple>{options}</select></td></tr>
+</tbody></table></form>
+<button id="sbutton" type="button" onclick="document.getElementById('reportOptions').submit(); window.open('/campus/adm_status', '_blank');">Generate Report</button>
+<iframe name="admDownload" id="admDownload" style="display:none"></iframe>""")
+
+
+class StubState:
+    """ Config, logged-in sessions and the payload cache shared by the request handlers. """
+
+    def __init__(self, config, cache_dir=None):
+        self.config = config
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix="ic_stub_")
+        self.sessions = set()
+        self.lock = threading.Lock()
+        self.by_row_id = {str(spec["row_id"]): (name, spec) for name, spec in config["reports"].items()}
+
+    def payload(self, key, writer):
+        """ Path of the cached payload for key, written with writer(path) the first time it is asked for. """
+        path = os.path.join(self.cache_dir, key)
+        with self.lock:
+            if not os.path.exists(path):
+                writer(f"{path}.tmp")
+                os.replace(f"{path}.tmp", path)
+        return path
+
+    def extract_path(self, row_id, output_format):
+        name, spec = self.by_row_id[row_id]
+        key = f"{name}_{spec['rows']}x{spec['columns']}.{output_format}"
+        return self.payload(key, lambda path: write_extract(path, spec["rows"], spec["columns"], output_format))
+
+    def adm_path(self):
+        adm = self.config["adm"]
+        key = f"adm_{adm['students']}x{adm['days']}.csv"
+        return self.payload(key, lambda path: write_adm_report(path, students=adm["students"], days=adm["days"]))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Routes requests to the stub pages. self.server.state is the StubState. """
+
+    protocol_version = "HTTP/1.0"  # Streamed downloads end when the connection closes
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    @property
+    def config(self):
+        return self.server.state.config
+
+    def logged_in(self):
+        cookies = dict(part.strip().split("=", 1) for part in self.headers.get("Cookie", "").split(";") if "=" in part)
+        return cookies.get(SESSION_COOKIE) in self.state.sessions
+
+    def send_page(self, html, status=200, headers=None):
+        body = html.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location, cookie=None):
+        self.send_response(302)
+        self.send_header("Location", location)
+        if cookie:
+            self.send_header("Set-Cookie", f"{SESSION_COOKIE}={cookie}; Path=/")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def start_session(self, location="/campus/home"):
+        token = secrets.token_hex(16)
+        self.state.sessions.add(token)
+        self.redirect(location, token)
+
+    def send_file(self, path, file_name, content_type):
+        """ Stream a payload as an attachment at the configured download rate. """
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Disposition", f'attachment; filename="{file_name}"')
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        rate = self.config["download_rate"]
+        started = time.monotonic()
+        sent = 0
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if rate:
+                    time.sleep(max(sent / rate - (time.monotonic() - started), 0))
+
+    def read_form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return parse_qs(self.rfile.read(length).decode("utf-8"))
+
+    def do_GET(self):
+        time.sleep(self.config["page_delay"])
+        path = urlparse(self.path).path
+        if path in ("/", "/campus/portal/login"):
+            return self.send_page(login_page())
+        if path == "/campus/sso":
+            time.sleep(self.config["login_delay"])
+            return self.start_session()
+        if not self.logged_in():
+            return self.redirect("/campus/portal/login")
+        if path == "/campus/home":
+            return self.send_page(page("Infinite Campus", "<h1>Infinite Campus</h1>"))
+        if path == "/campus/dataviewer":
+            return self.send_page(frame_page("frameWorkspace", "/campus/frames/workspace"))
+        if path == "/campus/frames/workspace":
+            return self.send_page(frame_page("frameWorkspaceWrapper", "/campus/frames/wrapper"))
+        if path == "/campus/frames/wrapper":
+            return self.send_page(frame_page("frameWorkspaceDetail", "/campus/frames/detail"))
+        if path == "/campus/frames/detail":
+            return self.send_page(detail_page(self.config))
+        if path == "/campus/frames/report_list":
+            return self.send_page(report_list_page(self.config))
+        if path == "/campus/adm":
+            return self.send_page(adm_page(self.config))
+        if path == "/campus/adm_status":
+            return self.send_page(page("ADM & ADA Report", "<p>Your report is being generated.</p>"))
+        self.send_page(page("Not Found", "<p>Not found</p>"), status=404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        form = self.read_form()
+        if path == "/campus/verify":
+            time.sleep(self.config["login_delay"])
+            mode = self.config["login_mode"]
+            if mode == "sso":
+                return self.send_page(login_page(f"<script>alert({json.dumps(SSO_ALERT)});</script>"))
+            valid = (form.get("username", [""])[0] == self.config["username"]
+                     and form.get("password", [""])[0] == self.config["password"])
+            if mode == "error" or not valid:
+                return self.send_page(login_page('<div class="alert-danger" role="alert">Invalid username or password.</div>'))
+            return self.start_session()
+        if not self.logged_in():
+            return self.redirect("/campus/portal/login")
+        export = re.fullmatch(r"/campus/export/(\d+)", path)
+        if export and export.group(1) in self.state.by_row_id:
+            output_format = form.get("mode", ["html"])[0]
+            if output_format not in EXPORT_FILES:
+                return self.send_page(page("Error", "<p>Unsupported format</p>"), status=400)
+            name, spec = self.state.by_row_id[export.group(1)]
+            time.sleep(spec.get("generation_delay", self.config["generation_delay"]))
+            file_name, content_type = EXPORT_FILES[output_format]
+            return self.send_file(self.state.extract_path(export.group(1), output_format), file_name, content_type)
+        if path == "/campus/adm_export":
+            time.sleep(self.config["adm"]["generation_delay"])
+            return self.send_file(self.state.adm_path(), "ADM_ADA_Detail_Report.csv", "text/csv")
+        self.send_page(page("Not Found", "<p>Not found</p>"), status=404)
+
+
+def start_stub_server(config=None, port=0, host="127.0.0.1"):
+    """ Start the stub on a background thread. Returns (server, base URL); call server.shutdown() to stop it. """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(config or load_stub_config())
+    threading.Thread(target=server.serve_forever, name="ic-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def stub_credentials(base_url, config, report_keys=None):
+    """ The credentials_all.json contents that point the bots at a stub running at base_url. """
+    reports = {name: spec["name"] for name, spec in config["reports"].items()
+               if report_keys is None or name in report_keys}
+    return {
+        "infinitecampus": {
+            "username": config["username"],
+            "password": config["password"],
+            "ic_url": f"{base_url}/campus/portal/login",
+            "reports_url": f"{base_url}/campus/dataviewer",
+            "ada_adm_url": f"{base_url}/campus/adm",
+            "export_url": f"{base_url}/campus/export/{{report_id}}",
+        },
+        "icampus_reports": reports,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Infinite Campus pages the bots use.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--config", default=STUB_CONFIG, help="JSON file overriding DEFAULT_CONFIG keys")
+    args = parser.parse_args(argv)
+
+    config = load_stub_config(args.config)
+    server, base_url = start_stub_server(config, args.port, args.host)
+    print(f"Infinite Campus stub running at {base_url}")
+    print(json.dumps(stub_credentials(base_url, config), indent=2))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
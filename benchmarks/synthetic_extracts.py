@@ -0,0 +1,163 @@
+"""
+Title: Synthetic Infinite Campus Extracts
+File Name: benchmarks/synthetic_extracts.py
+Purpose: Write Data Viewer extracts and ADM/ADA detail reports shaped like IC's, at any size from a few rows to
+millions, for the parse benchmarks and the stub server.
+Dependencies: adm_loader.py (preamble length)
+Description: write_extract writes a Data Viewer extract in any extract_parser.EXTRACT_FORMATS format. HTML has the
+report title in row 0, the column names in row 1, an "All Records" row, and one <tr> per line after it. CSV and
+tab have the header line, the "All Records" line and the data. A zero-row extract has only the title and header,
+like an empty IC report. write_adm_report writes the ADM/ADA detail CSV: the header line, the
+DEFAULT_PREAMBLE_ROWS lines of report options and per-school summary, and then one row per student per school
+day, in date order.
+Rows are written in batches from small pools of values, so a 5M-row file takes about as long as the disk needs.
+Student numbers are 9-digit strings with leading zeros, so a parser that re-types them is caught.
+Usage:
+    python -m benchmarks.synthetic_extracts extract OUTPUT --rows 100k [--format html] [--columns 12]
+    python -m benchmarks.synthetic_extracts adm OUTPUT --rows 1M [--days 180]
+"""
+
+import sys
+import csv
+import math
+import random
+import argparse
+from html import escape
+from datetime import date, timedelta
+from adm_loader import DEFAULT_PREAMBLE_ROWS
+
+BATCH_ROWS = 10_000
+POOL_SIZE = 1009  # Prime, so the pools do not line up with each other
+EXTRACT_TITLE = "Data Viewer Extract"
+BASE_COLUMNS = ["Student Number", "Last Name", "First Name", "Grade", "School Name", "Date"]
+SCHOOLS = ["KIPP Academy Nashville", "KIPP Nashville College Prep", "KIPP Antioch College Prep", "KIPP Kirkpatrick"]
+ADM_COLUMNS = ["Student Number", "Last Name", "First Name", "School Name", "Grade", "Date",
+               "Membership", "Attendance", "Absent Minutes", "Student Count"]
+FIRST_DAY = date(2024, 8, 6)
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(text):
+    """ "5000", "100k" or "5M" as a row count. """
+    text = text.strip().lower()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def extract_header(columns):
+    return (BASE_COLUMNS + [f"Field {i}" for i in range(len(BASE_COLUMNS), columns)])[:columns]
+
+
+def extract_rows(rows, columns, seed=0):
+    """ Yield `rows` data rows of `columns` text values. """
+    rng = random.Random(seed)
+    last_names = [f"Last{i}" for i in range(POOL_SIZE)]
+    first_names = [f"First{i}" for i in range(POOL_SIZE)]
+    grades = [str(rng.randint(5, 12)) for _ in range(POOL_SIZE)]
+    schools = [rng.choice(SCHOOLS) for _ in range(POOL_SIZE)]
+    dates = [f"{rng.randint(8, 12):02d}/{rng.randint(1, 28):02d}/2024" for _ in range(POOL_SIZE)]
+    numbers = [str(rng.randint(0, 999)) for _ in range(POOL_SIZE)]
+    extra = range(len(BASE_COLUMNS), columns)
+    for i in range(rows):
+        p = i % POOL_SIZE
+        values = [f"{i:09d}", last_names[p], first_names[(i * 7) % POOL_SIZE], grades[p], schools[p], dates[(i * 3) % POOL_SIZE]]
+        values += [numbers[(i + j * 31) % POOL_SIZE] for j in extra]
+        yield values[:columns]
+
+
+def batches(iterable, size=BATCH_ROWS):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_extract(path, rows, columns=12, output_format="html", seed=0):
+    """ Write a Data Viewer extract with `rows` data rows. Returns the number of data rows written. """
+    header = extract_header(columns)
+    summary = ["All Records"] + [""] * (columns - 1)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if output_format == "html":
+            f.write(f'<html><body><table border="1">\n<tr><td colspan="{columns}">{EXTRACT_TITLE}</td></tr>\n')
+            f.write("<tr>" + "".join(f"<th>{escape(name)}</th>" for name in header) + "</tr>\n")
+            if rows:
+                f.write("<tr>" + "".join(f"<td>{value}</td>" for value in summary) + "</tr>\n")
+            for batch in batches(extract_rows(rows, columns, seed)):
+                f.write("".join("<tr><td>" + "</td><td>".join(escape(value) for value in values) + "</td></tr>\n"
+                                for values in batch))
+            f.write("</table></body></html>\n")
+        else:
+            writer = csv.writer(f, delimiter="," if output_format == "csv" else "\t")
+            writer.writerow(header)
+            if rows:
+                writer.writerow(summary)
+            for batch in batches(extract_rows(rows, columns, seed)):
+                writer.writerows(batch)
+    return rows
+
+
+def school_days(first_day, days):
+    """ The first `days` weekdays starting at first_day. """
+    current = first_day
+    while days:
+        if current.weekday() < 5:
+            yield current
+            days -= 1
+        current += timedelta(days=1)
+
+
+def write_adm_report(path, rows=None, students=None, days=180, seed=0):
+    """ Write an ADM/ADA detail report. Give `rows` for an exact row count (students are added to fill the
+    days), or `students` for students * days rows. Returns the number of data rows written. """
+    rng = random.Random(seed)
+    if students is None:
+        students = max(math.ceil(rows / days), 1)
+    limit = students * days if rows is None else rows
+    roster = [f"{200000 + i:09d},Last{i},First{i},{rng.choice(SCHOOLS)},{rng.randint(5, 12)}" for i in range(students)]
+    absent = [rng.random() < 0.06 for _ in range(POOL_SIZE)]
+    written = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(ADM_COLUMNS)
+        writer.writerow(["ADM & ADA Report"])
+        writer.writerow(["Date Range:", "08/06/2024 - 05/23/2025"])
+        for i in range(DEFAULT_PREAMBLE_ROWS - 3):
+            writer.writerow([SCHOOLS[i % len(SCHOOLS)], f"Grade {5 + i % 8}", f"{rng.uniform(80, 100):.2f}"])
+        writer.writerow([])
+        for day in school_days(FIRST_DAY, days):
+            day_text = day.strftime("%m/%d/%Y")
+            count = min(students, limit - written)
+            f.write("".join(f"{roster[s]},{day_text},1,{'0,420' if absent[(s + written) % POOL_SIZE] else '1,0'},1\r\n"
+                            for s in range(count)))
+            written += count
+            if written >= limit:
+                break
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic Infinite Campus extracts and ADM/ADA reports.")
+    parser.add_argument("kind", choices=["extract", "adm"])
+    parser.add_argument("output")
+    parser.add_argument("--rows", type=parse_size, default=1000, help="Data rows, e.g. 1000, 100k, 5M")
+    parser.add_argument("--format", default="html", choices=["html", "csv", "tab"], help="Extract format")
+    parser.add_argument("--columns", type=int, default=12, help="Extract columns")
+    parser.add_argument("--days", type=int, default=180, help="School days in the ADM report")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.kind == "extract":
+        rows = write_extract(args.output, args.rows, args.columns, args.format, args.seed)
+    else:
+        rows = write_adm_report(args.output, args.rows, days=args.days, seed=args.seed)
+    print(f"Wrote {rows} rows to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Title: Report Change Data Capture
+File Name: change_capture.py
+Purpose: Emit only the rows that changed since the last run of a report, so downstream loads move kilobytes.
+Dependencies: None (standard library csv and hashlib)
+Description: capture_changes streams a report CSV and hashes each row. Rows are matched to the previous run
+by their key columns through the hash index saved by that run (<report>.cdc_index.csv). The changes are
+written to the CDC_DIR directory next to the CSV (icampus_downloads/cdc/), away from the report files:
+ - <report>_inserts.csv: full rows whose key is new
+ - <report>_updates.csv: full rows whose key existed but whose contents changed
+ - <report>_deletes.csv: key columns of rows that are gone
+ - <report>_duplicates.csv: full rows dropped because an earlier row had the same key
+The first run has no index, so every row is an insert. Key columns per report are in CDC_KEYS, or in the JSON
+file CDC_KEY_FILE ({"student_data": ["personID"]}). Only reports with key columns are tracked: keyed on the
+whole row, every edit would show up as a delete plus an insert. The key columns are checked against the header
+of every CSV, and a missing one raises KeyColumnError before any change file is written, so a wrong key fails
+the report instead of silently producing changes. When several rows share a key, the first one is kept and the
+others go to the duplicates file and the "duplicates" count. To check the configured keys against the last
+downloads:
+    python change_capture.py --check /home/KIPPNashvilleData/icampus_downloads/
+"""
+
+import os
+import sys
+import csv
+import json
+import hashlib
+import logging
+import argparse
+
+CDC_KEY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cdc_keys.json")
+
+# Reports that get change files, with the columns that identify a row
+CDC_KEYS = {
+    "student_data": ["personID"],
+    "section_enrollments": ["personID", "sectionID"],
+    "attendance_codes": ["calendarID", "code"],
+    "incidents": ["incidentID"],
+}
+
+FIELD_SEPARATOR = "\x1f"
+CDC_DIR = "cdc"  # Under the report CSV's directory
+
+
+class KeyColumnError(Exception):
+    """ A report CSV lacks a configured key column. """
+
+
+def load_key_file(key_file=CDC_KEY_FILE):
+    """ Read the key column overrides, or an empty dict if there are none. """
+    try:
+        with open(key_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def tracks_changes(report, key_file=CDC_KEY_FILE):
+    """ True if CDC_KEYS or CDC_KEY_FILE gives the report key columns. """
+    return bool(get_key_columns(report, key_file))
+
+
+def get_key_columns(report, key_file=CDC_KEY_FILE):
+    """ Key columns for a report: CDC_KEY_FILE overrides CDC_KEYS. """
+    keys = load_key_file(key_file)
+    if report in keys:
+        return keys[report]
+    return CDC_KEYS.get(report)
+
+
+def row_digest(values):
+    """ Stable 128-bit hash of a row's values. """
+    return hashlib.blake2b(FIELD_SEPARATOR.join(values).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_hash_index(index_path):
+    """ Read {key tuple: row hash} and the key column names from a previous run's index. """
+    index = {}
+    if not os.path.exists(index_path):
+        return index, None
+    with open(index_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return index, None
+        for row in reader:
+            index[tuple(row[:-1])] = row[-1]
+    return index, header[:-1]
+
+
+def missing_key_columns(header, key_columns):
+    """ The key columns that are not in a CSV header. """
+    return [column for column in key_columns if column not in header]
+
+
+def read_header(csv_path):
+    """ The header row of a CSV, or [] if it is empty. """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+
+def capture_changes(csv_path, report, key_columns=None, output_dir=None):
+    """ Compare a report CSV with the previous run's hash index and write inserts/updates/deletes files.
+
+    Returns {"inserts": n, "updates": n, "deletes": n, "unchanged": n, "duplicates": n}. Raises KeyColumnError
+    if the CSV lacks a key column.
+    """
+    output_dir = output_dir or os.path.join(os.path.dirname(csv_path), CDC_DIR)
+    key_columns = key_columns or get_key_columns(report)
+    if not key_columns:
+        raise ValueError(f"No key columns configured for {report}; add them to CDC_KEYS or {CDC_KEY_FILE}")
+    os.makedirs(output_dir, exist_ok=True)
+    index_path = os.path.join(output_dir, f"{report}.cdc_index.csv")
+    # Indexes written before the change files moved to CDC_DIR sit next to the CSV
+    legacy_index_path = os.path.join(os.path.dirname(csv_path), f"{report}.cdc_index.csv")
+    if not os.path.exists(index_path) and os.path.exists(legacy_index_path):
+        os.replace(legacy_index_path, index_path)
+    paths = {kind: os.path.join(output_dir, f"{report}_{kind}.csv") for kind in ("inserts", "updates", "deletes", "duplicates")}
+    previous, previous_key_columns = load_hash_index(index_path)
+    counts = {"inserts": 0, "updates": 0, "deletes": 0, "unchanged": 0, "duplicates": 0}
+
+    with open(csv_path, newline="", encoding="utf-8") as source:
+        reader = csv.reader(source)
+        header = next(reader, [])
+        key_names = list(key_columns)
+        missing = missing_key_columns(header, key_names)
+        if missing:
+            raise KeyColumnError(f"Key columns {missing} for {report} are not in {csv_path}; its columns are {header}")
+        if previous and previous_key_columns != key_names:
+            logging.warning(f"Key columns for {report} changed from {previous_key_columns} to {key_names}; treating every row as new")
+            previous = {}
+        key_positions = [header.index(column) for column in key_names]
+
+        tmp_index_path = f"{index_path}.part"
+        with open(paths["inserts"], "w", newline="", encoding="utf-8") as inserts_file, \
+                open(paths["updates"], "w", newline="", encoding="utf-8") as updates_file, \
+                open(paths["duplicates"], "w", newline="", encoding="utf-8") as duplicates_file, \
+                open(tmp_index_path, "w", newline="", encoding="utf-8") as index_file:
+            inserts = csv.writer(inserts_file)
+            updates = csv.writer(updates_file)
+            duplicates = csv.writer(duplicates_file)
+            index = csv.writer(index_file)
+            inserts.writerow(header)
+            updates.writerow(header)
+            duplicates.writerow(header)
+            index.writerow(key_names + ["row_hash"])
+            seen = set()
+            for row in reader:
+                key = tuple(row[i] if i < len(row) else "" for i in key_positions)
+                if key in seen:
+                    duplicates.writerow(row)  # The first row with a key wins
+                    counts["duplicates"] += 1
+                    continue
+                seen.add(key)
+                digest = row_digest(row)
+                index.writerow(list(key) + [digest])
+                previous_digest = previous.pop(key, None)
+                if previous_digest is None:
+                    inserts.writerow(row)
+                    counts["inserts"] += 1
+                elif previous_digest != digest:
+                    updates.writerow(row)
+                    counts["updates"] += 1
+                else:
+                    counts["unchanged"] += 1
+
+    if counts["duplicates"]:
+        logging.warning(f"{counts['duplicates']} rows of {report} repeat the {key_names} key of an earlier row; "
+                        f"they are left out of the changes and written to {paths['duplicates']}")
+
+    # Whatever is left in the previous index was not in this run
+    with open(paths["deletes"], "w", newline="", encoding="utf-8") as deletes_file:
+        deletes = csv.writer(deletes_file)
+        deletes.writerow(key_names)
+        for key in previous:
+            deletes.writerow(key)
+            counts["deletes"] += 1
+
+    os.replace(tmp_index_path, index_path)
+    logging.info(f"Changes for {report}: {counts['inserts']} inserts, {counts['updates']} updates, "
+                 f"{counts['deletes']} deletes, {counts['unchanged']} unchanged, {counts['duplicates']} duplicates")
+    return counts
+
+
+def check_keys(download_dir, key_file=CDC_KEY_FILE):
+    """ Compare every tracked report's key columns with the header of its CSV in download_dir.
+
+    Returns {report: missing columns, or None if the report has no CSV there}.
+    """
+    reports = {**CDC_KEYS, **load_key_file(key_file)}
+    results = {}
+    for report, key_columns in reports.items():
+        csv_path = os.path.join(download_dir, f"{report}.csv")
+        results[report] = missing_key_columns(read_header(csv_path), key_columns) if os.path.exists(csv_path) else None
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the change capture key columns against report CSVs.")
+    parser.add_argument("--check", metavar="DOWNLOAD_DIR", required=True, help="Directory with the report CSVs")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for report, missing in check_keys(args.check).items():
+        if missing is None:
+            print(f"{report}: no {report}.csv in {args.check}")
+        elif missing:
+            failed = True
+            print(f"{report}: MISSING key columns {missing}")
+        else:
+            print(f"{report}: ok")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
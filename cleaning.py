@@ -0,0 +1,109 @@
+"""
+Title: Shared Report Cleaning
+File Name: cleaning.py
+Purpose: One place for cleaning report CSVs: column names and values, done column-wise instead of cell by cell.
+Dependencies: pandas
+Description: normalize_headers lowercases column names, turns spaces into underscores, and replaces any other
+non-word character with an underscore. Like the old clean_headers, \w is Unicode-aware, so "Élève Nº" becomes
+"élève_nº". pandas' str.replace on pyarrow-backed strings treats \w as ASCII only, so the names are cleaned with
+Python's re once per schema instead. The raw-to-clean mapping is memoized per schema (the tuple of raw column
+names), so a report seen before costs a dict lookup. clean_values makes one pass over the columns and applies each column's cleaners as vectorized Series
+ops:
+ - trim: strip surrounding whitespace from text columns
+ - dates: parse columns named like dates (parquet_output.DEFAULT_RULES) and write them as YYYY-MM-DD
+ - codes: map raw codes to clean values with the per-report maps in CODE_MAPS
+CLEANING_METHODS names the combinations. "base" does all of the above, and "headers" only renames the columns.
+clean_csv_file applies a method to a CSV, which is what process_csv_file's cleaning_method selects.
+ada_adm_cleaning.clean_csv runs clean_values on the ADM/ADA detail report.
+"""
+
+import os
+import re
+import logging
+from functools import lru_cache
+import pandas as pd
+from parquet_output import DEFAULT_RULES
+from extract_parser import read_text_csv
+
+# Per-report code maps: {report: {column: {raw value: clean value}}}
+CODE_MAPS = {}
+
+NON_WORD = re.compile(r"[^\w_]")
+
+
+@lru_cache(maxsize=256)
+def _header_mapping(columns):
+    return {column: NON_WORD.sub("_", str(column).lower().replace(" ", "_")) for column in columns}
+
+
+def header_mapping(columns):
+    """ {raw column name: clean column name}, memoized per schema. """
+    return _header_mapping(tuple(columns))
+
+
+def normalize_headers(columns):
+    """ Clean column names: lowercase, spaces and other non-word characters replaced by underscores. """
+    mapping = header_mapping(columns)
+    return [mapping[column] for column in columns]
+
+
+def parse_dates(values):
+    """ Write date-like text as YYYY-MM-DD. Values that do not parse are kept as they were. """
+    parsed = pd.to_datetime(values, errors="coerce", format="mixed")
+    # Leave the column alone if it does not look like dates at all
+    if parsed.notna().sum() < values.replace("", None).notna().sum() / 2:
+        return values
+    return parsed.dt.strftime("%Y-%m-%d").where(parsed.notna(), values)
+
+
+def clean_values(df, report=None, trim=True, dates=True, codes=True):
+    """ Apply the value cleaners to each column of a DataFrame in one pass. """
+    code_maps = CODE_MAPS.get(report, {}) if codes else {}
+    for column in df.columns:
+        values = df[column]
+        is_text = pd.api.types.is_string_dtype(values) or values.dtype == object
+        if trim and is_text:
+            values = values.str.strip()
+        if dates and is_text and DEFAULT_RULES["dates"].search(str(column)):
+            values = parse_dates(values)
+        if column in code_maps:
+            values = values.replace(code_maps[column])
+        df[column] = values
+    return df
+
+
+def clean_base(df, report=None):
+    """ Trim, parse dates, map codes, then normalize the column names. """
+    df = clean_values(df, report)
+    df.columns = normalize_headers(df.columns)
+    return df
+
+
+def clean_headers_only(df, report=None):
+    df.columns = normalize_headers(df.columns)
+    return df
+
+
+CLEANING_METHODS = {
+    "base": clean_base,
+    "headers": clean_headers_only,
+}
+
+
+def clean_dataframe(df, method="base", report=None):
+    """ Clean a report DataFrame with one of CLEANING_METHODS. """
+    if method not in CLEANING_METHODS:
+        raise ValueError(f"Unknown cleaning method '{method}'; expected one of {sorted(CLEANING_METHODS)}")
+    return CLEANING_METHODS[method](df, report)
+
+
+def clean_csv_file(csv_path, method="base", report=None, output_path=None):
+    """ Clean a report CSV, read as text, and write it to output_path (default: in place). Returns the path. """
+    report = report or os.path.splitext(os.path.basename(csv_path))[0]
+    output_path = output_path or csv_path
+    df = clean_dataframe(read_text_csv(csv_path), method, report)
+    tmp_path = f"{output_path}.part"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, output_path)
+    logging.info(f"Cleaned {csv_path} with the '{method}' method and saved it to {output_path}")
+    return output_path
@@ -0,0 +1,311 @@
+"""
+Title: Streaming Extract Parser
+File Name: extract_parser.py
+Purpose: Convert Data Viewer extract.html files to CSV in one pass with bounded memory.
+Dependencies: pandas (delimited extracts), pyarrow (optional, faster CSV engine)
+Description: pd.read_html builds a DOM of the whole extract before it produces a DataFrame, and the download
+check read the whole file again just to count rows. iter_extract_rows feeds the file to an HTMLParser in
+fixed-size chunks and yields each table row as a list of cell strings as soon as the row closes.
+html_extract_to_csv writes those rows straight to CSV, skipping the title row and the "All Records" row
+inline, so memory stays flat however large the extract is.
+open_extract memory-maps a download so probe_row_count can decide keep/delete by looking only as far as the
+third row. The map is closed before the parse, which streams the file in CHUNK_SIZE reads: parsing from the map
+would keep every page of the file resident and undo the bounded memory.
+Reports can also be requested from IC as CSV or tab-delimited (EXTRACT_FORMATS). Those are read with the pyarrow
+engine when it is installed, or the pandas C engine otherwise. convert_extract handles any format, and
+profile_parse/record_parse_stats log parse time, memory and the engine that ran per report and format, so the
+faster format can be picked for each report. The memory logged by default is rss_mb, the resident set size of the
+whole process right after the parse. It covers pyarrow's memory pool and costs nothing to read, but it is
+process-wide: in the worker pool it includes the other threads' parses and everything allocated before. Set
+IC_TRACE_MALLOC=1 to also log peak_mb, the parse's own peak Python allocations from tracemalloc. That slows
+parses several times over and is process-wide too, so it is off by default and one parse is traced at a time.
+Notes:
+ - Only the first table in the file is read, like pd.read_html(...)[0].
+ - Cell text is kept as text. Unlike pd.read_html, numbers are not re-typed, so IDs keep their leading zeros
+   and integer columns with blanks are not written as floats.
+"""
+
+import os
+import re
+import csv
+import json
+import mmap
+import time
+import codecs
+import threading
+import tracemalloc
+import importlib.util
+from itertools import islice
+from contextlib import contextmanager
+from html.parser import HTMLParser
+import pandas as pd
+
+CHUNK_SIZE = 64 * 1024
+HEADER_ROW = 1  # Row 0 of an IC extract is the report title; row 1 holds the column names
+SKIP_VALUE = "All Records"
+ROW_TAG = re.compile(rb"<tr[\s>]", re.IGNORECASE)
+
+# Data Viewer output formats: the value of the "mode" select and the name of the downloaded file
+EXTRACT_FORMATS = {
+    "html": {"mode": "html", "file_name": "extract.html"},
+    "csv": {"mode": "csv", "file_name": "extract.csv", "sep": ","},
+    "tab": {"mode": "tab", "file_name": "extract.txt", "sep": "\t"},
+}
+CSV_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+
+# Opt-in tracemalloc profiling of parses. tracemalloc is process-wide, so only one parse at a time is traced.
+TRACE_MALLOC = os.environ.get("IC_TRACE_MALLOC", "") not in ("", "0")
+_profile_lock = threading.Lock()
+# Engine read_text_csv last used on each thread, after any fallback from pyarrow to the C engine
+_last_engine = threading.local()
+
+
+class TableRowParser(HTMLParser):
+    """ Collects the rows of the first table in the fed HTML. Finished rows are appended to self.rows. """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.tables_seen = 0
+        self.table_depth = 0
+        self.row = None
+        self.cell = None
+
+    def in_first_table(self):
+        return self.tables_seen == 1 and self.table_depth == 1
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            self.table_depth += 1
+            if self.table_depth == 1:
+                self.tables_seen += 1
+        elif not self.in_first_table():
+            return
+        elif tag == "tr":
+            self.end_row()
+            self.row = []
+        elif tag in ("td", "th"):
+            self.end_cell()
+            if self.row is None:
+                self.row = []
+            self.cell = []
+        elif tag == "br" and self.cell is not None:
+            self.cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag == "table":
+            if self.in_first_table():
+                self.end_row()
+            self.table_depth = max(self.table_depth - 1, 0)
+        elif not self.in_first_table():
+            return
+        elif tag in ("td", "th"):
+            self.end_cell()
+        elif tag == "tr":
+            self.end_row()
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+    def end_cell(self):
+        if self.cell is not None:
+            self.row.append(" ".join("".join(self.cell).split()))
+            self.cell = None
+
+    def end_row(self):
+        self.end_cell()
+        if self.row is not None:
+            self.rows.append(self.row)
+            self.row = None
+
+
+@contextmanager
+def open_extract(path):
+    """ Memory-map a downloaded extract read-only. An empty file gives an empty bytes buffer. """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield buffer
+        finally:
+            buffer.close()
+
+
+def probe_row_count(buffer, limit=3):
+    """ Count <tr> tags in a buffer, stopping as soon as `limit` have been seen. """
+    return sum(1 for _ in islice(ROW_TAG.finditer(buffer), limit))
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """ Yield decoded text chunks from a file path or from a bytes-like buffer such as open_extract's mmap. """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "r", encoding="utf-8", errors="replace") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for start in range(0, len(source), chunk_size):
+        yield decoder.decode(source[start:start + chunk_size])
+    yield decoder.decode(b"", final=True)
+
+
+def iter_extract_rows(source, chunk_size=CHUNK_SIZE):
+    """ Yield every row of the first table in an extract (path or buffer) as a list of cell strings. """
+    parser = TableRowParser()
+    for chunk in iter_chunks(source, chunk_size):
+        parser.feed(chunk)
+        if parser.rows:
+            yield from parser.rows
+            parser.rows = []
+    parser.close()
+    parser.end_row()
+    yield from parser.rows
+
+
+def html_extract_to_csv(source, csv_path, header_row=HEADER_ROW, skip_value=SKIP_VALUE):
+    """ Stream an extract to CSV. Returns (table rows seen, data rows written).
+
+    Rows before header_row are dropped, the header_row becomes the CSV header, and data rows whose first cell is
+    skip_value are left out. Short rows are padded to the header width.
+    """
+    rows_seen = 0
+    rows_written = 0
+    width = 0
+    with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        for row in iter_extract_rows(source):
+            rows_seen += 1
+            if rows_seen - 1 < header_row:
+                continue
+            if rows_seen - 1 == header_row:
+                width = len(row)
+                writer.writerow(row)
+                continue
+            if row and row[0] == skip_value:
+                continue
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            writer.writerow(row)
+            rows_written += 1
+    return rows_seen, rows_written
+
+
+def read_text_csv(source, sep=",", skip_rows=0, names=None, usecols=None, dtype=None, engine=CSV_ENGINE):
+    """ Read a delimited file with every column as text, except the columns dtype ({column: type}) converts.
+
+    Without names, the first line after skip_rows is the header. pandas' pyarrow engine infers column types before
+    it applies dtype=str, which drops leading zeros from IDs, so pyarrow's reader is called directly with string
+    column types. Files pyarrow rejects, such as rows with extra trailing fields, are read with the C engine.
+    Blank fields are read as empty strings.
+    """
+    if names is None:
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            names = next(islice(csv.reader(f, delimiter=sep), skip_rows, None), [])
+        skip_rows += 1
+    df = None
+    if engine == "pyarrow":
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        try:
+            table = pa_csv.read_csv(
+                source,
+                read_options=pa_csv.ReadOptions(skip_rows=skip_rows, column_names=names),
+                parse_options=pa_csv.ParseOptions(delimiter=sep, newlines_in_values=True),
+                convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in names},
+                                                      include_columns=usecols),
+            )
+            df = table.to_pandas()
+        except pa.ArrowInvalid:
+            engine = "c"
+    _last_engine.name = engine
+    if df is None:
+        df = pd.read_csv(source, sep=sep, header=None, names=names, skiprows=skip_rows, usecols=usecols, dtype=str,
+                         keep_default_na=False, index_col=False, engine=engine)
+    return df.astype(dtype) if dtype else df
+
+
+def read_delimited_extract(source, sep=",", engine=CSV_ENGINE):
+    """ Read a CSV or tab-delimited extract with every column as text. """
+    return read_text_csv(source, sep=sep, engine=engine)
+
+
+def convert_extract(source, csv_path, output_format="html"):
+    """ Convert a downloaded extract of any EXTRACT_FORMATS format to CSV.
+
+    Returns the number of data rows written, or None when the extract has no records, in which case csv_path is
+    not written.
+    """
+    if output_format == "html":
+        with open_extract(source) as extract:
+            has_records = probe_row_count(extract) > 2
+        if not has_records:
+            return None
+        return html_extract_to_csv(source, csv_path)[1]
+
+    df = read_delimited_extract(source, EXTRACT_FORMATS[output_format]["sep"])
+    if df.empty:
+        return None
+    df = df[df.iloc[:, 0] != SKIP_VALUE]
+    df.to_csv(csv_path, index=False)
+    return len(df)
+
+
+def last_csv_engine():
+    """ The engine the last read_text_csv call on this thread used, or None if it has made none. """
+    return getattr(_last_engine, "name", None)
+
+
+def current_rss_mb():
+    """ Resident set size of the whole process in MB, or None where /proc is not available. """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def profile_parse(func, *args, **kwargs):
+    """ Run func and return (result, seconds, memory).
+
+    memory is {"rss_mb": process RSS after the parse, "peak_mb": peak traced memory of the parse}. peak_mb is only
+    measured with IC_TRACE_MALLOC=1, and is None while another parse holds the tracer.
+    """
+    _last_engine.name = None  # So a parse that never reaches read_text_csv does not log the previous engine
+    traced = TRACE_MALLOC and _profile_lock.acquire(blocking=False)
+    if traced:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start_time
+        peak_mb = None
+        if traced:
+            peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+            _profile_lock.release()
+    return result, seconds, {"rss_mb": current_rss_mb(), "peak_mb": peak_mb}
+
+
+def record_parse_stats(stats_file, report, output_format, source, rows, seconds, memory):
+    """ Append one parse measurement (profile_parse's seconds and memory) as a JSON line. Call it on the thread
+    that parsed, so the engine is the one that ran. """
+    record = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "report": report,
+        "format": output_format,
+        "engine": "html.parser" if output_format == "html" else last_csv_engine(),
+        "bytes": os.path.getsize(source),
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rss_mb": None if memory["rss_mb"] is None else round(memory["rss_mb"], 1),
+        "peak_mb": None if memory["peak_mb"] is None else round(memory["peak_mb"], 1),
+    }
+    with open(stats_file, "a") as f:
+        f.write(json.dumps(record) + "\n")
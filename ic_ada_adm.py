@@ -4,39 +4,30 @@ import time
 import json
 import logging
 from datetime import datetime, timedelta
-import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.select import Select
+from sheets_logger import setup_google_sheets, log_to_google_sheets
 from navigator import setup_chromedriver
+from session_store import restore_session, save_session
+from ic_session import login_to_icampus
+from adm_pipeline import process_adm_report
+from tracing import span
+from run_history import note, run_script
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Constants
-DOWNLOAD_DIR = "/home/KIPPNashvilleData/icampus_downloads/"
-CONFIG_FILE_PATH = "/home/KIPPNashvilleData/credentials_all.json"
+DOWNLOAD_DIR = os.environ.get("IC_DOWNLOAD_DIR", "/home/KIPPNashvilleData/icampus_downloads/")
+CONFIG_FILE_PATH = os.environ.get("IC_CONFIG_FILE", "/home/KIPPNashvilleData/credentials_all.json")
 FILE_PATH = os.path.join(DOWNLOAD_DIR, 'ADM_ADA_Detail_Report.csv')
 CLEANED_CSV_PATH = os.path.join(DOWNLOAD_DIR, 'adm_ada.csv')
 MAX_ATTEMPTS = 5
 WAIT_TIME = 300  # 5 minutes in seconds
 
-# Set up Google Sheets credentials and client
-def setup_google_sheets(spreadsheet_name, sheet_name):
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name('/home/KIPPNashvilleData/creds.json', scope)
-    client = gspread.authorize(creds)
-    sheet = client.open(spreadsheet_name).worksheet(sheet_name)
-    return sheet
-
-# Log to Google Sheets
-def log_to_google_sheets(sheet, message):
-    sheet.append_row([time.strftime("%Y-%m-%d %H:%M:%S"), message])
-
 # Function to get yesterday's date
 def get_yesterday_date():
     current_datetime = datetime.now()
@@ -92,8 +83,7 @@ def main():
         "generate_button": "sbutton"
     }
 
-    # Site names for WebDriverWait: Update if Page Names are changed
-    home_page = "Infinite Campus"
+    # Site names for WebDriverWait: Update if Page Names are changed (home page title: ic_session.HOME_PAGE_TITLE)
     report_page = "ADM & ADA Report Options"
 
     # Infinite Campus School Numbers: If the method for selecting them in report options changes, update here.
@@ -113,89 +103,94 @@ def main():
     log_to_google_sheets(sheet, "INFO: Chromedriver set up and initialized")
 
     logging.info("Opening Chromedriver and navigating to IC site")
-    driver.get(site)
-    logging.info(f"Site Name: {driver.title}")
-    logging.info("Site Open")
-    log_to_google_sheets(sheet, f"INFO: Site opened: {driver.title}")
-
-    logging.info("Logging in to site")
-    WebDriverWait(driver, 60).until(EC.presence_of_element_located((By.ID, "username"))).send_keys(username)
-    WebDriverWait(driver, 60).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password)
-    time.sleep(10)
-    driver.find_element(By.ID, "signinbtn").click()
-    time.sleep(15)
-
-    WebDriverWait(driver, 60).until(EC.title_is(home_page))
-    driver.get(reports)
+    with span("session_restore"):
+        restored = restore_session(driver, site, reports)
+    if restored:
+        log_to_google_sheets(sheet, "INFO: Restored saved IC session")
+    else:
+        logging.info("Logging in to site")
+        with span("login"):
+            login_seconds = login_to_icampus(driver, username, password, site)
+        logging.info(f"Logged in to IC: {driver.title}")
+        log_to_google_sheets(sheet, f"INFO: Logged in to IC in {login_seconds:.2f} seconds: {driver.title}")
+        # Saving is only a shortcut for the next run; a failure here must not fail the report
+        try:
+            save_session(driver)
+        except Exception as e:
+            logging.warning(f"Could not save IC session: {e}")
+        with span("data_viewer_navigation"):
+            driver.get(reports)
     logging.info(f"Site Name: {driver.title}")
     log_to_google_sheets(sheet, f"INFO: Site name after login: {driver.title}")
 
-    WebDriverWait(driver, 60).until(EC.title_is(report_page))
+    with span("report_page_load"):
+        WebDriverWait(driver, 60).until(EC.title_is(report_page))
 
     logging.info("Entering report options")
-    end_date = driver.find_element(By.ID, html_elements["end_date"])
-    end_date.send_keys(Keys.CONTROL + "a")
-    end_date.send_keys(Keys.DELETE)
-    end_date.send_keys(first_day)
-
-    end_date = driver.find_element(By.ID, html_elements["end_date"])
-    end_date.send_keys(Keys.CONTROL + "a")
-    end_date.send_keys(Keys.DELETE)
-    end_date.send_keys(yesterday)
-
-    detail_button = driver.find_element(By.CSS_SELECTOR, html_elements["detail_button"])
-    detail_button.click()
-
-    calc_button = driver.find_element(By.XPATH, html_elements["calc_button"])
-    calc_button.click()
-
-    dropdown_element = driver.find_element(By.ID, html_elements["dropdown_element"])
-    format_drop = Select(dropdown_element)
-    format_drop.select_by_value('csv')
-
-    school_list = driver.find_element(By.ID, html_elements["school_list"])
-    select = Select(school_list)
-    for value in school_options:
-        select.select_by_value(value)
+    with span("option_setting", report="adm_ada"):
+        end_date = driver.find_element(By.ID, html_elements["end_date"])
+        end_date.send_keys(Keys.CONTROL + "a")
+        end_date.send_keys(Keys.DELETE)
+        end_date.send_keys(first_day)
+
+        end_date = driver.find_element(By.ID, html_elements["end_date"])
+        end_date.send_keys(Keys.CONTROL + "a")
+        end_date.send_keys(Keys.DELETE)
+        end_date.send_keys(yesterday)
+
+        detail_button = driver.find_element(By.CSS_SELECTOR, html_elements["detail_button"])
+        detail_button.click()
+
+        calc_button = driver.find_element(By.XPATH, html_elements["calc_button"])
+        calc_button.click()
+
+        dropdown_element = driver.find_element(By.ID, html_elements["dropdown_element"])
+        format_drop = Select(dropdown_element)
+        format_drop.select_by_value('csv')
+
+        school_list = driver.find_element(By.ID, html_elements["school_list"])
+        select = Select(school_list)
+        for value in school_options:
+            select.select_by_value(value)
     logging.info("Options set")
     log_to_google_sheets(sheet, "INFO: Report options set")
 
     initial_window_handles = driver.window_handles
     handle_length = len(initial_window_handles)
 
-    generate_button = driver.find_element(By.ID, html_elements["generate_button"])
-    generate_button.click()
+    with span("report_click", report="adm_ada"):
+        generate_button = driver.find_element(By.ID, html_elements["generate_button"])
+        generate_button.click()
 
-    WebDriverWait(driver, 180).until(lambda driver: len(driver.window_handles) > handle_length)
+        WebDriverWait(driver, 180).until(lambda driver: len(driver.window_handles) > handle_length)
     logging.info("Report window opened")
     log_to_google_sheets(sheet, "INFO: Report window opened")
-    time.sleep(60)
+    with span("generation_wait", report="adm_ada"):
+        time.sleep(60)
+        found = wait_for_file(FILE_PATH, MAX_ATTEMPTS, WAIT_TIME, sheet)
 
-    if not wait_for_file(FILE_PATH, MAX_ATTEMPTS, WAIT_TIME, sheet):
+    if not found:
         logging.error(f'DID NOT FIND: {FILE_PATH} after {MAX_ATTEMPTS} attempts. Closing browser and exiting script.')
         log_to_google_sheets(sheet, f"ERROR: DID NOT FIND: {FILE_PATH} after {MAX_ATTEMPTS} attempts. Exiting script.")
         driver.close()
+        note(outcome="failed")
         sys.exit()
 
     driver.close()
     logging.info("Driver Closed")
     log_to_google_sheets(sheet, "INFO: Driver closed")
 
-    df = pd.read_csv(FILE_PATH, skiprows=range(1, 36), header=0, index_col=False, engine='python')
-    num_rows = df.shape[0]
-    num_cols = df.shape[1]
-    logging.info(f"Columns: {num_cols}")
-    logging.info(f"Rows: {num_rows}")
-    logging.info(df.head(10))
-    log_to_google_sheets(sheet, f"INFO: CSV Columns: {num_cols}, Rows: {num_rows}")
-
-    df = df.drop('Student Count', axis=1)
-    logging.info("\nDataFrame after dropping 'Student Count':")
-    logging.info(df)
-
-    df.to_csv(CLEANED_CSV_PATH, index=False)
+    # Drop 'Student Count' and build the per-school/grade/day summaries, one chunk at a time
+    with span("parse", report="adm_ada") as parse_span:
+        result = process_adm_report(FILE_PATH, CLEANED_CSV_PATH)
+        parse_span.update(rows=result["rows"], bytes=os.path.getsize(FILE_PATH))
+    logging.info(f"Columns: {result['columns']}")
+    logging.info(f"Rows: {result['rows']}")
+    log_to_google_sheets(sheet, f"INFO: CSV Columns: {result['columns']}, Rows: {result['rows']}")
     logging.info(f"Cleaned file saved to {CLEANED_CSV_PATH}")
     log_to_google_sheets(sheet, f"INFO: Cleaned file saved to {CLEANED_CSV_PATH}")
+    if result["summaries"]:
+        log_to_google_sheets(sheet, f"INFO: Summary tables saved to {', '.join(result['summaries'])}")
 
     end_time = time.time()
     elapsed_time = end_time - start_time
@@ -203,7 +198,7 @@ def main():
     log_to_google_sheets(sheet, f"INFO: Script finished in {elapsed_time:.2f} seconds.")
 
 if __name__ == "__main__":
-    main()
+    run_script("ic_ada_adm", main, report="adm_ada")
 
 # import os
 # import sys
@@ -4,139 +4,265 @@ import os
 import glob
 import time
 import json
+import queue
 import logging
-import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from selenium import webdriver
+from concurrent.futures import ThreadPoolExecutor
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support.select import Select
-from selenium.webdriver.support import expected_conditions as EC
-from navigator import go_to_reports_id, go_to_settings, get_chrome_options, enable_download_headless
+from sheets_logger import setup_google_sheets, log_to_google_sheets
+from selenium.common.exceptions import WebDriverException
+from navigator import go_to_reports_id, go_to_settings, setup_chromedriver, wait_for_download_complete
+from report_index import find_report_xpath
+from report_output import publish_report
+from snapshot_store import prune
+from tracing import span
+from run_history import record_report, run_script
+from extract_parser import EXTRACT_FORMATS, convert_extract, profile_parse, record_parse_stats
+from ic_session import SessionBroker, login_to_icampus
+from session_store import restore_session, save_session
+from ic_http_export import session_from_driver, export_reports
 
 # Configure logging
 logging.basicConfig(
-    filename='/home/KIPPNashvilleData/infinite_campus/icampus_reports.log',
+    filename=os.environ.get("IC_LOG_FILE", '/home/KIPPNashvilleData/infinite_campus/icampus_reports.log'),
     level=logging.INFO,
     format='%(asctime)s:%(levelname)s:%(message)s'
 )
 
-# Set up Google Sheets credentials and client
-def setup_google_sheets(spreadsheet_name, sheet_name):
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name('/home/KIPPNashvilleData/creds.json', scope)
-    client = gspread.authorize(creds)
-    sheet = client.open(spreadsheet_name).worksheet(sheet_name)
-    return sheet
+# Paths can be pointed elsewhere, e.g. at benchmarks/ic_stub_server.py's scratch directory
+CONFIG_FILE_PATH = os.environ.get("IC_CONFIG_FILE", "/home/KIPPNashvilleData/credentials_all.json")
+DOWNLOAD_DIR = os.environ.get("IC_DOWNLOAD_DIR", "/home/KIPPNashvilleData/icampus_downloads/")
 
-# Log to Google Sheets
-def log_to_google_sheets(sheet, message):
-    sheet.append_row([time.strftime("%Y-%m-%d %H:%M:%S"), message])
+# Maximum seconds to wait for a generated report to finish downloading
+DOWNLOAD_TIMEOUT = 300
+
+# Number of reports to run at once, each in its own browser and download directory.
+# 1 keeps the original serial run. Keep this low to respect IC server limits.
+MAX_WORKERS = int(os.environ.get("IC_MAX_WORKERS", 1))
+
+# "browser" clicks through the Data Viewer for each report. "http" downloads each export directly with the
+# logged-in session's cookies; it needs "export_url" in the infinitecampus section of credentials_all.json.
+EXPORT_MODE = os.environ.get("IC_EXPORT_MODE", "browser")
+
+# Infinite Campus calendar IDs selected for every report
+SCHOOL_OPTIONS = ["4163", "4164", "4165", "4166", "4166"]
+
+# Output format requested from IC when a report does not set one: "html", "csv" or "tab".
+# A report in icampus_reports can be {"report": <name or XPath>, "format": "csv"} instead of a plain XPath.
+DEFAULT_FORMAT = "html"
+# Parse time, memory and CSV engine per report and format, one JSON line per parse, in the output directory
+PARSE_STATS_FILE = "extract_parse_stats.jsonl"
 
 # Function to retrieve credentials and report configurations from JSON file
 def get_config():
-    config_file_path = os.path.join("/home/KIPPNashvilleData/", "credentials_all.json")
-    with open(config_file_path) as config_file:
+    with open(CONFIG_FILE_PATH) as config_file:
         data = json.load(config_file)
     infinitecampus = data["infinitecampus"]
     icampus_reports = data["icampus_reports"]
-    return infinitecampus["username"], infinitecampus["password"], infinitecampus["ic_url"], infinitecampus["reports_url"], icampus_reports
+    return infinitecampus["username"], infinitecampus["password"], infinitecampus["ic_url"], infinitecampus["reports_url"], icampus_reports, infinitecampus.get("export_url")
+
+# Function to split a report configuration into the report (name or XPath) and its output format
+def report_settings(report_config):
+    if isinstance(report_config, dict):
+        return report_config["report"], report_config.get("format", DEFAULT_FORMAT)
+    return report_config, DEFAULT_FORMAT
 
 # Function to initialize Chrome driver
 def initialize_driver(download_dir):
-    chrome_options = get_chrome_options(download_dir)
-    driver = webdriver.Chrome(options=chrome_options)
-    enable_download_headless(driver, download_dir)
-    return driver
+    return setup_chromedriver(download_dir)
 
-# Function to generate report
-def generate_report(driver, report_xpath, download_dir, base_file_name, sheet):
+# Function to generate report. With raise_driver_errors, WebDriver errors are logged and re-raised so a
+# SessionBroker can log in again and retry the report when the session expired.
+def generate_report(driver, report_xpath, download_dir, base_file_name, sheet, output_dir=None, output_format=DEFAULT_FORMAT, raise_driver_errors=False):
     try:
-        report = driver.find_element(By.XPATH, report_xpath)
-        report.click()
+        with span("report_click", report=base_file_name):
+            report = driver.find_element(By.XPATH, find_report_xpath(driver, report_xpath))
+            report.click()
         logging.info(f"Report clicked for {base_file_name}")
         log_to_google_sheets(sheet, f"INFO: Report clicked for {base_file_name}")
 
         # Set report options
-        go_to_settings(driver)
-        format_drop = driver.find_element(By.ID, "mode")
-        htmlop = Select(format_drop)
-        htmlop.select_by_value("html")
-        school_list = driver.find_element(By.ID, "calendarID")
-        select = Select(school_list)
-        school_options = ["4163", "4164", "4165", "4166", "4166"]
-        for value in school_options:
-            select.select_by_value(value)
+        with span("option_setting", report=base_file_name, format=output_format):
+            go_to_settings(driver)
+            format_drop = driver.find_element(By.ID, "mode")
+            htmlop = Select(format_drop)
+            htmlop.select_by_value(EXTRACT_FORMATS[output_format]["mode"])
+            school_list = driver.find_element(By.ID, "calendarID")
+            select = Select(school_list)
+            for value in SCHOOL_OPTIONS:
+                select.select_by_value(value)
         logging.info(f"Options set for {base_file_name}.")
         log_to_google_sheets(sheet, f"INFO: Options set for {base_file_name}.")
 
         # Generate report
         generate_button = driver.find_element(By.ID, "next")
+        clicked_at = time.time()
         generate_button.click()
         logging.info(f"Generate report button clicked for {base_file_name}.")
         log_to_google_sheets(sheet, f"INFO: Generate report button clicked for {base_file_name}.")
 
         # Wait for report to download
-        time.sleep(60)
-        return wait_for_download(download_dir, base_file_name, sheet)
+        if wait_for_download_complete(download_dir, EXTRACT_FORMATS[output_format]["file_name"], DOWNLOAD_TIMEOUT, started_after=clicked_at) is None:
+            logging.warning(f"Download for {base_file_name} did not finish within {DOWNLOAD_TIMEOUT} seconds.")
+            log_to_google_sheets(sheet, f"WARNING: Download for {base_file_name} did not finish within {DOWNLOAD_TIMEOUT} seconds.")
+        return wait_for_download(download_dir, base_file_name, sheet, output_dir, output_format)
 
     except Exception as e:
         logging.error(f"Error after clicking generate report button for {base_file_name}. Error message: {e}")
         log_to_google_sheets(sheet, f"ERROR: After clicking generate report button for {base_file_name} Error message: {e}")
+        if raise_driver_errors and isinstance(e, WebDriverException):
+            raise
         return False
 
 # Function to wait for report download and process it
-def wait_for_download(download_dir, base_file_name, sheet):
+def wait_for_download(download_dir, base_file_name, sheet, output_dir=None, output_format=DEFAULT_FORMAT):
     wait_time_minutes = 4  # wait time in minutes
+    output_dir = output_dir or download_dir
+    extract_name = EXTRACT_FORMATS[output_format]["file_name"]
     try:
-        html_files = glob.glob(os.path.join(download_dir, 'extract.html'))
-        if html_files:
-            most_recent_html = html_files[0]
-            file_mtime = os.path.getmtime(most_recent_html)
+        extract_files = glob.glob(os.path.join(download_dir, extract_name))
+        if extract_files:
+            most_recent_extract = extract_files[0]
+            file_mtime = os.path.getmtime(most_recent_extract)
             current_time = time.time()
             if current_time - file_mtime <= wait_time_minutes * 60:
-                with open(most_recent_html, 'r') as file:
-                    html_content = file.read()
-                    num_records = html_content.count('<tr>')
-                    if num_records > 2:  # Check if there are more than 2 records
-                        os.rename(most_recent_html, os.path.join(download_dir, f"{base_file_name}.html"))
-                        logging.info(f"Renamed extract.html to '{base_file_name}.html'")
-                        log_to_google_sheets(sheet, f"INFO: Renamed extract.html to '{base_file_name}.html'")
-                        df = pd.read_html(os.path.join(download_dir, f"{base_file_name}.html"), header=1)[0]
-                        df = df[df.iloc[:, 0] != "All Records"]
-                        cleaned_csv_path = os.path.join(download_dir, f"{base_file_name}.csv")
-                        df.to_csv(cleaned_csv_path, index=False)
-                        logging.info(f"Updated file saved to '{cleaned_csv_path}'")
-                        log_to_google_sheets(sheet, f"INFO: Updated file saved to '{cleaned_csv_path}'")
-                        return True
-                    else:
-                        os.remove(most_recent_html)
-                        logging.info(f"Deleted '{most_recent_html}' because the table has no records.")
-                        log_to_google_sheets(sheet, f"INFO: Deleted '{most_recent_html}' because the table has no records.")
-                        return False
+                # Convert to CSV; the HTML probe stops at the third row and the parser streams the file in chunks.
+                # The CSV is written as it is parsed, so the "parse" span covers the CSV write too.
+                cleaned_csv_path = os.path.join(output_dir, f"{base_file_name}.csv")
+                partial_csv_path = f"{cleaned_csv_path}.part"
+                with span("parse", report=base_file_name, format=output_format) as parse_span:
+                    num_rows, seconds, memory = profile_parse(convert_extract, most_recent_extract, partial_csv_path, output_format)
+                    parse_span.update(rows=num_rows, bytes=os.path.getsize(most_recent_extract))
+                record_parse_stats(os.path.join(output_dir, PARSE_STATS_FILE), base_file_name, output_format,
+                                   most_recent_extract, num_rows, seconds, memory)
+                if num_rows is not None:  # None when the table has no records
+                    logging.info(f"Parsed {num_rows} rows from {output_format} in {seconds:.2f} seconds")
+                    return publish_report(most_recent_extract, partial_csv_path, output_dir, base_file_name, sheet)
+                else:
+                    os.remove(most_recent_extract)
+                    logging.info(f"Deleted '{most_recent_extract}' because the table has no records.")
+                    log_to_google_sheets(sheet, f"INFO: Deleted '{most_recent_extract}' because the table has no records.")
+                    return False
             else:
-                logging.warning(f"The file {most_recent_html} is older than 4 minutes. Did not convert to CSV.")
-                log_to_google_sheets(sheet, f"WARNING: The file {most_recent_html} is older than 4 minutes. Did not convert to CSV.")
+                logging.warning(f"The file {most_recent_extract} is older than 4 minutes. Did not convert to CSV.")
+                log_to_google_sheets(sheet, f"WARNING: The file {most_recent_extract} is older than 4 minutes. Did not convert to CSV.")
                 return False
         else:
-            logging.warning("No 'extract.html' file found in the directory.")
-            log_to_google_sheets(sheet, "WARNING: No 'extract.html' file found in the directory.")
+            logging.warning(f"No '{extract_name}' file found in the directory.")
+            log_to_google_sheets(sheet, f"WARNING: No '{extract_name}' file found in the directory.")
             return False
     except Exception as e:
         logging.error(f"Error processing download for {base_file_name}: {e}")
         log_to_google_sheets(sheet, f"ERROR: Unable to processing download for {base_file_name}: {e}")
         return False
 
+# Function to run reports from a shared queue in one worker's own browser and download directory
+def report_worker(worker_id, report_queue, download_dir, username, password, ic_url, reports_url, sheet):
+    worker_dir = os.path.join(download_dir, f"worker_{worker_id}")
+    os.makedirs(worker_dir, exist_ok=True)
+    broker = SessionBroker(worker_dir, username, password, ic_url, reports_url)
+    results = {}
+    try:
+        while True:
+            try:
+                base_file_name, report_config = report_queue.get_nowait()
+                report_xpath, output_format = report_settings(report_config)
+            except queue.Empty:
+                break
+
+            def job(driver):
+                with span("report", report=base_file_name, format=output_format, worker=worker_id) as report_span:
+                    with span("data_viewer_navigation"):
+                        driver.get(reports_url)
+                    go_to_reports_id(driver)
+                    report_span["generated"] = generate_report(driver, report_xpath, worker_dir, base_file_name, sheet, output_dir=download_dir, output_format=output_format, raise_driver_errors=True)
+                    return report_span["generated"]
+
+            try:
+                # Recorded once around the broker, so a report retried after a re-login is one history row
+                with record_report("ic_base_script", base_file_name) as result:
+                    results[base_file_name] = broker.run(base_file_name, job)
+                    result["outcome"] = "ok" if results[base_file_name] else "failed"
+            except Exception as e:
+                logging.error(f"Worker {worker_id} could not run the report for {base_file_name}. Error message: {e}")
+                log_to_google_sheets(sheet, f"ERROR: Worker {worker_id} could not run the report for {base_file_name}. Error message: {e}")
+                results[base_file_name] = False
+    finally:
+        broker.quit()
+    return results
+
+# Function to generate all reports with a pool of MAX_WORKERS browsers
+def run_reports_in_parallel(reports, download_dir, username, password, ic_url, reports_url, sheet, max_workers=MAX_WORKERS):
+    if not reports:
+        logging.warning("No reports configured in icampus_reports; nothing to run")
+        log_to_google_sheets(sheet, "WARNING: No reports configured in icampus_reports; nothing to run")
+        return {}
+    report_queue = queue.Queue()
+    for base_file_name, report_config in reports.items():
+        report_queue.put((base_file_name, report_config))
+
+    num_workers = min(max_workers, len(reports))
+    logging.info(f"Starting {num_workers} report workers for {len(reports)} reports")
+    log_to_google_sheets(sheet, f"INFO: Starting {num_workers} report workers for {len(reports)} reports")
+    results = {}
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(report_worker, worker_id, report_queue, download_dir, username, password, ic_url, reports_url, sheet)
+            for worker_id in range(num_workers)
+        ]
+        for future in futures:
+            results.update(future.result())
+
+    for base_file_name in reports:
+        if results.get(base_file_name):
+            logging.info(f"Report generation and processing completed successfully for {base_file_name}")
+            log_to_google_sheets(sheet, f"INFO: Report generation and processing completed successfully for {base_file_name}")
+        else:
+            logging.warning(f"Did not to generate or process the report for {base_file_name}")
+            log_to_google_sheets(sheet, f"WARNING: Did not to generate or process the report for {base_file_name}")
+    return results
+
+# Function to download every report over HTTP with the logged-in driver's cookies
+def run_reports_over_http(driver, reports, reports_url, download_dir, export_url, sheet, max_workers=MAX_WORKERS):
+    # Turn report names and stale row XPaths into current row XPaths before leaving the browser
+    driver.get(reports_url)
+    go_to_reports_id(driver)
+    exports = {}
+    for base_file_name, report_config in reports.items():
+        report, output_format = report_settings(report_config)
+        exports[base_file_name] = (find_report_xpath(driver, report), output_format)
+
+    session = session_from_driver(driver, pool_size=max(max_workers, len(reports)))
+    logging.info(f"Exporting {len(reports)} reports over HTTP")
+    log_to_google_sheets(sheet, f"INFO: Exporting {len(reports)} reports over HTTP")
+
+    def process_export(export_dir, base_file_name, output_format):
+        # Recorded from the end of the HTTP download; the export itself is not timed here
+        with record_report("ic_base_script", base_file_name) as result:
+            processed = wait_for_download(export_dir, base_file_name, sheet, output_dir=download_dir, output_format=output_format)
+            result["outcome"] = "ok" if processed else "failed"
+        return processed
+
+    results = export_reports(session, export_url, exports, SCHOOL_OPTIONS, download_dir, process_export,
+                             max_workers=max(max_workers, 1))
+    for base_file_name in reports:
+        if results.get(base_file_name):
+            logging.info(f"Report generation and processing completed successfully for {base_file_name}")
+            log_to_google_sheets(sheet, f"INFO: Report generation and processing completed successfully for {base_file_name}")
+        else:
+            logging.warning(f"Did not to generate or process the report for {base_file_name}")
+            log_to_google_sheets(sheet, f"WARNING: Did not to generate or process the report for {base_file_name}")
+    return results
+
 # Main function
 def main():
     # Record the start time
     start_time = time.time()
-    download_dir = "/home/KIPPNashvilleData/icampus_downloads/"
+    download_dir = DOWNLOAD_DIR
 
     # Retrieve credentials and report configurations
     logging.info("Retrieving credentials and report configurations")
-    username, password, ic_url, reports_url, reports = get_config()
+    username, password, ic_url, reports_url, reports, export_url = get_config()
     logging.info("Credentials and configurations retrieved")
 
     # Set up Google Sheets
@@ -145,48 +271,76 @@ def main():
     sheet = setup_google_sheets(spreadsheet_name, sheet_name)
     log_to_google_sheets(sheet, "INFO: Starting process to access Infinite Campus.")
 
+    # Drop archived downloads that are past the retention period
+    try:
+        prune()
+    except Exception as e:
+        logging.warning(f"Could not prune the download archive: {e}")
+
+    # Run the reports in a pool of browsers when more than one worker is configured
+    if MAX_WORKERS > 1:
+        run_reports_in_parallel(reports, download_dir, username, password, ic_url, reports_url, sheet)
+        elapsed_time = time.time() - start_time
+        logging.info(f"Script executed in {elapsed_time:.2f} seconds.")
+        log_to_google_sheets(sheet, f"INFO: Script executed in {elapsed_time:.2f} seconds.")
+        return
+
     # Initialize Chrome driver
     logging.info("Starting Chromedriver set up")
     driver = initialize_driver(download_dir)
     logging.info("Chromedriver set up and initialized")
 
-    # Open IC site and login
+    # Open IC site and login, unless the session saved by the last run is still valid
     logging.info("Opening Chromedriver and navigating to IC site")
-    driver.get(ic_url)
-    logging.info(f"Site opened: {driver.title}")
-    try:
-        WebDriverWait(driver, 60).until(EC.presence_of_element_located((By.ID, "username"))).send_keys(username)
-        WebDriverWait(driver, 60).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password)
-        time.sleep(10)
-        driver.find_element(By.ID, "signinbtn").click()
-        time.sleep(15)
-        logging.info(f"Logged in to IC: {driver.title}")
-        log_to_google_sheets(sheet, f"INFO: Logged in to IC: {driver.title}")
-
-        # Check if login is successful by verifying the title
-        if driver.title != "Infinite Campus":
-            error_message = "ERROR: Login failed! Site title does not match 'Infinite Campus'"
-            logging.error(error_message)
-            log_to_google_sheets(sheet, error_message)
+    with span("session_restore"):
+        restored = restore_session(driver, ic_url, reports_url)
+    if restored:
+        log_to_google_sheets(sheet, "INFO: Restored saved IC session")
+    else:
+        try:
+            with span("login"):
+                login_seconds = login_to_icampus(driver, username, password, ic_url)
+            logging.info(f"Logged in to IC: {driver.title}")
+            log_to_google_sheets(sheet, f"INFO: Logged in to IC in {login_seconds:.2f} seconds: {driver.title}")
+        except Exception as e:
+            logging.error(f"Error logging in to IC: {e}")
+            log_to_google_sheets(sheet, f"ERROR: Unable to log in to IC: {e}")
             driver.quit()
             return
-    except Exception as e:
-        logging.error(f"Error logging in to IC: {e}")
-        log_to_google_sheets(sheet, f"ERROR: Unable to log in to IC: {e}")
-        driver.quit()
+        # Saving is only a shortcut for the next run; a failure here must not fail the run as a login error
+        try:
+            save_session(driver)
+        except Exception as e:
+            logging.warning(f"Could not save IC session: {e}")
+
+    # Download the exports directly instead of clicking through the Data Viewer
+    if EXPORT_MODE == "http" and export_url:
+        try:
+            run_reports_over_http(driver, reports, reports_url, download_dir, export_url, sheet)
+        finally:
+            driver.quit()
+        elapsed_time = time.time() - start_time
+        logging.info(f"Script executed in {elapsed_time:.2f} seconds.")
+        log_to_google_sheets(sheet, f"INFO: Script executed in {elapsed_time:.2f} seconds.")
         return
 
     # Navigate to reports frame
     logging.info("Clicking Link to Data Viewer Frame")
-    driver.get(reports_url)
+    with span("data_viewer_navigation"):
+        driver.get(reports_url)
     logging.info(f"Site opened: {driver.title}")
     log_to_google_sheets(sheet, f"INFO: Site opened: {driver.title}")
 
     # Iterate through each report configuration and generate reports
-    for base_file_name, report_xpath in reports.items():
+    for base_file_name, report_config in reports.items():
         # Go to reports and generate report
-        go_to_reports_id(driver)
-        report_generated = generate_report(driver, report_xpath, download_dir, base_file_name, sheet)
+        report_xpath, output_format = report_settings(report_config)
+        with record_report("ic_base_script", base_file_name) as result, \
+                span("report", report=base_file_name, format=output_format) as report_span:
+            go_to_reports_id(driver)
+            report_generated = generate_report(driver, report_xpath, download_dir, base_file_name, sheet, output_format=output_format)
+            report_span["generated"] = report_generated
+            result["outcome"] = "ok" if report_generated else "failed"
         if report_generated:
             logging.info(f"Report generation and processing completed successfully for {base_file_name}")
             log_to_google_sheets(sheet, f"INFO: Report generation and processing completed successfully for {base_file_name}")
@@ -203,7 +357,7 @@ def main():
     log_to_google_sheets(sheet, f"INFO: Script executed in {elapsed_time:.2f} seconds.")
 
 if __name__ == "__main__":
-    main()
+    run_script("ic_base_script", main)
 
 
 
@@ -16,7 +16,7 @@ SPREADSHEET_NAME = 'PythonAnywhereLogs'  # Name of your Google Sheets workbook
 SHEET_NAME = 'eoq_grades'  # Name of the sheet within the workbook
 aws_folder = 'icampus'
 CONFIG_FILE_PATH = "/home/KIPPNashvilleData/credentials_all.json"  # Path to the configuration file
-cleaning_method = "base"  # Specify the desired cleaning method
+cleaning_method = "base"  # Specify the desired cleaning method (see cleaning.CLEANING_METHODS)
 
 # Set up logging
 setup_logging(LOG_FILE)
@@ -0,0 +1,88 @@
+"""
+Title: Infinite Campus HTTP Export
+File Name: ic_http_export.py
+Purpose: Download Data Viewer exports over HTTP with the cookies of a logged-in Selenium session.
+Dependencies: requests
+Description: After Selenium has logged in, a Data Viewer report is one HTTP request for the export.
+session_from_driver copies the driver's cookies and user agent into a pooled requests.Session. export_report
+then asks for the report by its Data Viewer ID and calendar IDs, with the same fields the settings form posts
+("mode", "calendarID"). It skips the clicks through the report iframes. The export endpoint is set with the
+"export_url" key in the infinitecampus section of credentials_all.json, with a "{report_id}" placeholder.
+"""
+
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from extract_parser import EXTRACT_FORMATS
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def session_from_driver(driver, pool_size=8):
+    """ Build a keep-alive requests.Session carrying the driver's cookies and user agent. """
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=[502, 503, 504], allowed_methods=["GET", "POST"])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = driver.execute_script("return navigator.userAgent;")
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+    return session
+
+
+def report_id_from_xpath(report_xpath):
+    """ Pull the Data Viewer report ID out of a report row XPath like //*[@id="row84450"]/td[3]. """
+    match = re.search(r'row(\d+)', report_xpath)
+    if match is None:
+        raise ValueError(f"No report row ID in XPath: {report_xpath}")
+    return match.group(1)
+
+
+def export_report(session, export_url, report_id, calendar_ids, output_path, mode="html", timeout=600):
+    """ Request one report export and stream it to output_path. Returns the number of bytes written. """
+    url = export_url.format(report_id=report_id)
+    data = {"mode": mode, "calendarID": list(calendar_ids)}
+    tmp_path = f"{output_path}.part"
+    bytes_written = 0
+    with session.post(url, data=data, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        # An expired session is redirected to the login page, which comes back as a 200 HTML page
+        if response.history and "login" in response.url.lower():
+            raise PermissionError(f"Export of report {report_id} was redirected to the login page")
+        with open(tmp_path, "wb") as output_file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                output_file.write(chunk)
+                bytes_written += len(chunk)
+    os.replace(tmp_path, output_path)
+    return bytes_written
+
+
+def export_reports(session, export_url, reports, calendar_ids, download_dir, process_export, max_workers=4):
+    """ Export reports ({base_file_name: (report_xpath, output_format)}) concurrently over the shared session.
+
+    Each export is saved under its extract_parser.EXTRACT_FORMATS file name in its own http_<base_file_name>
+    directory under download_dir, then process_export(export_dir, base_file_name, output_format) is called in
+    the worker thread. Returns {base_file_name: process_export result}, with False for failed exports.
+    """
+    def run(base_file_name, report_xpath, output_format):
+        try:
+            export_dir = os.path.join(download_dir, f"http_{base_file_name}")
+            os.makedirs(export_dir, exist_ok=True)
+            report_id = report_id_from_xpath(report_xpath)
+            extract_format = EXTRACT_FORMATS[output_format]
+            output_path = os.path.join(export_dir, extract_format["file_name"])
+            size = export_report(session, export_url, report_id, calendar_ids, output_path, extract_format["mode"])
+            logging.info(f"Exported report {report_id} for {base_file_name} over HTTP ({size} bytes)")
+            return base_file_name, process_export(export_dir, base_file_name, output_format)
+        except Exception as e:
+            logging.error(f"HTTP export failed for {base_file_name}. Error message: {e}")
+            return base_file_name, False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run, name, xpath, output_format) for name, (xpath, output_format) in reports.items()]
+        return dict(future.result() for future in futures)
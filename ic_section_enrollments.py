@@ -16,158 +16,203 @@ Notes:
 # Rename key variables based on repoart name and copied xpath from Infinite campus
 base_file_name = "section_enrollments"
 report_xpath = '//*[@id="row119086"]/td[3]'
+school_options = ["4163", "4164", "4165", "4166", "4166"]
 
 # Import required libraries
 import os
 import glob
 import time
 import json
-import pandas as pd
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support.select import Select
-from selenium.webdriver.support import expected_conditions as EC
-from navigator import go_to_reports_id, go_to_settings, get_chrome_options, enable_download_headless
-
-print("Current working directory:", os.getcwd())
-# Record the start time
-start_time = time.time()
-
-# Open JSON file with credentials & save credentials as variables
-print("Retrieving credentials...")
-config_file_path = os.path.join("/home/KIPPNashvilleData/", "credentials_all.json")
-with open(config_file_path) as config_file:
-    data = json.load(config_file)
-config = json.load(open(config_file_path))["infinitecampus"]
-username = config["username"]
-password = config["password"]
-site = config["ic_url"]
-reports_frame = config["reports_url"]
-
-print("Credentials retrieved")
-print("Starting Chromedriver set up...")
-download_dir = "/home/KIPPNashvilleData/icampus_downloads/"
-chrome_options = get_chrome_options(download_dir)
-driver = webdriver.Chrome(options=chrome_options)
-enable_download_headless(driver, download_dir)
-# Print Chrome options for debugging
-print("Chrome Options:")
-for option in chrome_options.arguments:
-    print(option)
-print("Chromedriver set up and initialized")
-
-# Opening browser in headless mode. Go to site. Check site name for accuracy"
-print("Opening Chromedriver and navigating to IC site")
-driver.get(site)
-print("Site Name:" + driver.title)
-print("Site Open.")
-
-# Infinite Campus Login Sequence
-print("Logging in to Site")
-WebDriverWait(driver, 60).until(EC.presence_of_element_located((By.ID, "username"))).send_keys(username)
-WebDriverWait(driver, 60).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password)
-time.sleep(10)
-driver.find_element(By.ID, "signinbtn").click()
-time.sleep(15)
-print("Logged in to IC")
-print("Site Name:" + driver.title)
-
-print("Clicking Link to Data Viewer Frame")
-driver.get(reports_frame)
-print("Site Name:" + driver.title)
-
-go_to_reports_id(driver)
-# Find the specific row id for the report
-report = driver.find_element(By.XPATH, report_xpath)
-report.click()
-print("Report Clicked")
-
-# Set the report options
-print("Starting Options...")
-# Call function to navigate to the frame with the settings
-go_to_settings(driver)
-# Set the report type to html
-format_drop = driver.find_element(By.ID, "mode")
-htmlop = Select(format_drop)
-htmlop.select_by_value("html")
-# Select All schools in the list
-school_list = driver.find_element(By.ID, "calendarID")
-select = Select(school_list)
-school_options = ["4163", "4164", "4165", "4166", "4166"]
-for value in school_options:
-    select.select_by_value(value)
-print("Options set")
-
-""""
-####  Ensuring the file downloads before closing the browser   ####
-  1. Create a variable to hold the List of names of browsers open - (only 1 at this time)
-      -example: initial_window_handle = driver.window_handles
-  2. Create a variable that calculated the length of that list ex:
-      -example: handle_length = len(initial_window_handles)
-  3. Click on the Report
-  4. User WebDriverWait until the driver.window_handles>handle_length
-"""
-# Create variables for inequality expression
-initial_window_handles = driver.window_handles
-handle_length = len(initial_window_handles)
-
-# Click on the Generate report button to download
-print("Generating report...")
-# Click on Generate Report Button
-generate_button = driver.find_element(By.ID, "next")
-generate_button.click()
-
-# Wait for the number of window handles to change (indicating the popup)
-WebDriverWait(driver, 180).until(lambda driver: len(driver.window_handles) > handle_length)
-print("Report window opened")
-
-time.sleep(60)
-driver.close()
-print("Driver Closed")
-# Find the most recent "extract.html" file
-
-html_files = glob.glob(os.path.join(download_dir, 'extract.html'))
-
-# Sort the files by modification time (newest first)
-html_files.sort(key=os.path.getmtime, reverse=True)
-
-# Check if any HTML files were found
-if html_files:
-    most_recent_html = html_files[0]
-
-    # Get the modification time of the file
-    file_mtime = os.path.getmtime(most_recent_html)
-
-    # Get the current time
-    current_time = time.time()
-
-    # Check if the file was downloaded in the last 10 minutes
-    if current_time - file_mtime <= 600:  # 600 seconds = 10 minutes
-        # Rename the file to "base_file_name.html"
-        os.rename(most_recent_html, os.path.join(download_dir, f"{base_file_name}.html"))
-        print(f"Renamed extract.html to '{base_file_name}.html'")
-
-        # Read the HTML file into a pandas DataFrame
-        df = pd.read_html(os.path.join(download_dir, f"{base_file_name}.html"), header=1)[0]
-        # dfs = pd.read_html(table_html, header=0)
-        # Remove rows where the first column contains "All records"
-        # df = df.iloc[1:]
-        df = df[df.iloc[:, 0] != "All Records"]
-
-        # Save the cleaned DataFrame to a new CSV file
-        cleaned_csv_path = os.path.join(download_dir, f"{base_file_name}.csv")
-        df.to_csv(cleaned_csv_path, index=False)
-        print(f"Cleaned data saved to '{cleaned_csv_path}'")
-    else:
-        print("The file is older than 10 minutes.")
-else:
-    print("No 'extract.html' file found in the directory.")
+from navigator import go_to_reports_id, go_to_settings, get_chrome_options, enable_download_headless, wait_for_download_complete
+from report_index import find_report_xpath
+from extract_parser import html_extract_to_csv
+from parquet_output import write_parquet
+from change_capture import KeyColumnError, tracks_changes, capture_changes
+from snapshot_store import archive_file
+from tracing import span
+from run_history import note, run_script
+from ic_session import login_to_icampus
 
-end_time = time.time()
+download_dir = "/home/KIPPNashvilleData/icampus_downloads/"
 
-# Calculate the elapsed time
-elapsed_time = end_time - start_time
 
-# Print the elapsed time in seconds
-print(f"Script execution time: {elapsed_time} seconds")
\ No newline at end of file
+def run_report(driver, reports_frame, download_dir=download_dir):
+    """ Generate the report in an already logged-in driver and save it as a CSV. """
+    print("Clicking Link to Data Viewer Frame")
+    with span("data_viewer_navigation"):
+        driver.get(reports_frame)
+    print("Site Name:" + driver.title)
+
+    go_to_reports_id(driver)
+    # Find the specific row id for the report, following it if IC has renumbered the rows
+    with span("report_click", report=base_file_name):
+        report = driver.find_element(By.XPATH, find_report_xpath(driver, report_xpath))
+        report.click()
+    print("Report Clicked")
+
+    # Set the report options
+    print("Starting Options...")
+    with span("option_setting", report=base_file_name):
+        # Call function to navigate to the frame with the settings
+        go_to_settings(driver)
+        # Set the report type to html
+        format_drop = driver.find_element(By.ID, "mode")
+        htmlop = Select(format_drop)
+        htmlop.select_by_value("html")
+        # Select All schools in the list
+        school_list = driver.find_element(By.ID, "calendarID")
+        select = Select(school_list)
+        for value in school_options:
+            select.select_by_value(value)
+    print("Options set")
+
+    """"
+    ####  Ensuring the file downloads before closing the report window   ####
+      1. Create a variable to hold the List of names of browsers open - (only 1 at this time)
+          -example: initial_window_handle = driver.window_handles
+      2. Create a variable that calculated the length of that list ex:
+          -example: handle_length = len(initial_window_handles)
+      3. Click on the Report
+      4. User WebDriverWait until the driver.window_handles>handle_length
+    """
+    # Create variables for inequality expression
+    original_window_handle = driver.current_window_handle
+    initial_window_handles = driver.window_handles
+    handle_length = len(initial_window_handles)
+
+    # Click on the Generate report button to download
+    print("Generating report...")
+    # Click on Generate Report Button
+    generate_button = driver.find_element(By.ID, "next")
+    clicked_at = time.time()
+    generate_button.click()
+
+    with span("generation_wait", report=base_file_name):
+        # Wait for the number of window handles to change (indicating the popup)
+        WebDriverWait(driver, 180).until(lambda driver: len(driver.window_handles) > handle_length)
+        print("Report window opened")
+        downloaded = wait_for_download_complete(download_dir, "extract.html", 600, started_after=clicked_at)
+    if downloaded is None:
+        print("Download did not finish within 10 minutes.")
+
+    # Close the report window and go back to the Data Viewer so the session can be reused
+    for handle in driver.window_handles:
+        if handle != original_window_handle:
+            driver.switch_to.window(handle)
+            driver.close()
+    driver.switch_to.window(original_window_handle)
+    print("Report window closed")
+
+    # Find the most recent "extract.html" file
+    html_files = glob.glob(os.path.join(download_dir, 'extract.html'))
+
+    # Sort the files by modification time (newest first)
+    html_files.sort(key=os.path.getmtime, reverse=True)
+
+    # Check if any HTML files were found
+    if html_files:
+        most_recent_html = html_files[0]
+
+        # Get the modification time of the file
+        file_mtime = os.path.getmtime(most_recent_html)
+
+        # Get the current time
+        current_time = time.time()
+
+        # Check if the file was downloaded in the last 10 minutes
+        if current_time - file_mtime <= 600:  # 600 seconds = 10 minutes
+            # Rename the file to "base_file_name.html"
+            # Keep the raw download in the snapshot store before it is renamed
+            try:
+                archive_file(most_recent_html, base_file_name)
+            except Exception as e:
+                print(f"Could not archive the download: {e}")
+            os.rename(most_recent_html, os.path.join(download_dir, f"{base_file_name}.html"))
+            print(f"Renamed extract.html to '{base_file_name}.html'")
+
+            # Stream the HTML table to a new CSV file, dropping the "All Records" row
+            cleaned_csv_path = os.path.join(download_dir, f"{base_file_name}.csv")
+            with span("parse", report=base_file_name) as parse_span:
+                rows_written = html_extract_to_csv(os.path.join(download_dir, f"{base_file_name}.html"), cleaned_csv_path)[1]
+                parse_span.update(rows=rows_written, bytes=os.path.getsize(os.path.join(download_dir, f"{base_file_name}.html")))
+            print(f"Cleaned data saved to '{cleaned_csv_path}'")
+            # Typed Parquet copy for downstream loads
+            try:
+                parquet_path = write_parquet(cleaned_csv_path, base_file_name)
+                if parquet_path:
+                    print(f"Parquet file saved to '{parquet_path}'")
+            except Exception as e:
+                print(f"Could not write Parquet file: {e}")
+            # Inserts/updates/deletes since the last run, for reports with change capture
+            if tracks_changes(base_file_name):
+                try:
+                    print(f"Changes since last run: {capture_changes(cleaned_csv_path, base_file_name)}")
+                except KeyColumnError as e:
+                    print(f"ERROR: Change capture is misconfigured: {e}")
+                    note(outcome="failed")
+                    return False
+                except Exception as e:
+                    print(f"Could not capture changes: {e}")
+            return True
+        else:
+            print("The file is older than 10 minutes.")
+    else:
+        print("No 'extract.html' file found in the directory.")
+    note(outcome="failed")
+    return False
+
+
+def main():
+    print("Current working directory:", os.getcwd())
+    # Record the start time
+    start_time = time.time()
+
+    # Open JSON file with credentials & save credentials as variables
+    print("Retrieving credentials...")
+    config_file_path = os.path.join("/home/KIPPNashvilleData/", "credentials_all.json")
+    with open(config_file_path) as config_file:
+        config = json.load(config_file)["infinitecampus"]
+    username = config["username"]
+    password = config["password"]
+    site = config["ic_url"]
+    reports_frame = config["reports_url"]
+
+    print("Credentials retrieved")
+    print("Starting Chromedriver set up...")
+    chrome_options = get_chrome_options(download_dir)
+    driver = webdriver.Chrome(options=chrome_options)
+    enable_download_headless(driver, download_dir)
+    # Print Chrome options for debugging
+    print("Chrome Options:")
+    for option in chrome_options.arguments:
+        print(option)
+    print("Chromedriver set up and initialized")
+
+    # Opening browser in headless mode. Go to site and log in. Check site name for accuracy
+    print("Opening Chromedriver and navigating to IC site")
+    print("Logging in to Site")
+    login_to_icampus(driver, username, password, site)
+    print("Logged in to IC")
+    print("Site Name:" + driver.title)
+
+    try:
+        run_report(driver, reports_frame)
+    finally:
+        driver.quit()
+        print("Driver Closed")
+
+    end_time = time.time()
+
+    # Calculate the elapsed time
+    elapsed_time = end_time - start_time
+
+    # Print the elapsed time in seconds
+    print(f"Script execution time: {elapsed_time} seconds")
+
+
+if __name__ == "__main__":
+    run_script("ic_section_enrollments", main, report=base_file_name)
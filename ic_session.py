@@ -0,0 +1,225 @@
+"""
+Title: Infinite Campus Session Broker
+File Name: ic_session.py
+Purpose: Log in to Infinite Campus once and share the logged-in browser across the single report scripts.
+Dependencies: navigator.py, ic_student_data.py and the single report scripts listed in REPORT_MODULES
+Description: Starting Chrome and logging in costs 30-40 seconds per report. The SessionBroker starts one
+Chrome session with navigator.setup_chromedriver, logs in, and hands the driver to each report job in
+turn. It only logs in again when the session has expired (the login form is showing or Chrome died).
+When a check_url is given, a session saved by an earlier run is restored before falling back to a login.
+main records each report in the run history once, around the broker, so a retry after a re-login is one row.
+Usage: python ic_session.py
+"""
+
+import os
+import time
+import json
+import logging
+import importlib
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from navigator import setup_chromedriver
+from session_store import restore_session, save_session
+from run_history import record_report, run_script
+
+DOWNLOAD_DIR = os.environ.get("IC_DOWNLOAD_DIR", "/home/KIPPNashvilleData/icampus_downloads/")
+CONFIG_FILE_PATH = os.environ.get("IC_CONFIG_FILE", "/home/KIPPNashvilleData/credentials_all.json")
+HOME_PAGE_TITLE = "Infinite Campus"
+LOGIN_TIMEOUT = 60
+
+# Alert IC shows when an account has to sign in through the single sign-on button
+SSO_ALERT_TEXT = "requires the use of the login button above"
+# The single sign-on button sits above the username box on the login page
+SSO_BUTTON = (By.XPATH, "//*[@id='username']/preceding::*[self::a or self::button or (self::input and @type='submit')][1]")
+# Error banners the login page shows for a rejected password or a locked account
+ERROR_BANNER = (By.CSS_SELECTOR, ".alert-danger, .error-message, #errorMessage, [role='alert']")
+
+# Single report scripts run by main(). Each one exposes run_report(driver, reports_url, download_dir).
+REPORT_MODULES = [
+    "ic_suspensions",
+    "incidents",
+    "ic_ell_export",
+    "ic_attendance_codes",
+    "ic_section_enrollments",
+    "ic_dc_export",
+]
+
+
+def load_config(config_path=CONFIG_FILE_PATH):
+    """ Return the infinitecampus section of the credentials file. """
+    with open(config_path) as config_file:
+        data = json.load(config_file)
+    return data["infinitecampus"]
+
+
+class LoginError(Exception):
+    """ Raised when the IC login does not reach the home page. """
+
+
+def login_outcome(driver):
+    """ Wait condition for the page after signing in: "alert", "home", "error", or False while still loading. """
+    # An open alert blocks every other call on the page, so it has to be checked first
+    if EC.alert_is_present()(driver):
+        return "alert"
+    if driver.title == HOME_PAGE_TITLE:
+        return "home"
+    if any(banner.is_displayed() and banner.text.strip() for banner in driver.find_elements(*ERROR_BANNER)):
+        return "error"
+    return False
+
+
+def login_with_sso(driver, timeout=LOGIN_TIMEOUT):
+    """ Take the single sign-on path: click the button above the username box and wait for the IC home page. """
+    logging.info("Account requires single sign-on, using the login button above the username box")
+    WebDriverWait(driver, timeout).until(EC.element_to_be_clickable(SSO_BUTTON)).click()
+    try:
+        WebDriverWait(driver, timeout).until(EC.title_is(HOME_PAGE_TITLE))
+    except TimeoutException:
+        raise LoginError(f"Single sign-on did not reach the IC home page. Site title: '{driver.title}'")
+
+
+def login_to_icampus(driver, username, password, ic_url, timeout=LOGIN_TIMEOUT):
+    """ Open the IC login page and sign in, waiting on page events rather than fixed sleeps.
+
+    After the sign-in click it waits for whichever comes first: the IC home page title, a browser alert, or an
+    error banner. The single sign-on alert switches straight to the SSO button path. Returns the login latency
+    in seconds and raises LoginError if the home page is not reached.
+    """
+    start_time = time.time()
+    driver.get(ic_url)
+    logging.info(f"Site opened: {driver.title}")
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.ID, "username"))).send_keys(username)
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password)
+    WebDriverWait(driver, timeout).until(EC.element_to_be_clickable((By.ID, "signinbtn"))).click()
+
+    try:
+        outcome = WebDriverWait(driver, timeout).until(login_outcome)
+    except TimeoutException:
+        raise LoginError(f"Login failed! Site title does not match '{HOME_PAGE_TITLE}': '{driver.title}'")
+
+    if outcome == "alert":
+        alert = driver.switch_to.alert
+        alert_text = alert.text
+        alert.accept()
+        if SSO_ALERT_TEXT not in alert_text:
+            raise LoginError(f"Alert Text: {alert_text}")
+        login_with_sso(driver, timeout)
+    elif outcome == "error":
+        banner_text = " ".join(banner.text.strip() for banner in driver.find_elements(*ERROR_BANNER) if banner.is_displayed())
+        raise LoginError(f"Login failed! {banner_text}")
+
+    login_seconds = time.time() - start_time
+    logging.info(f"Login latency: {login_seconds:.2f} seconds")
+    return login_seconds
+
+
+class SessionBroker:
+    """ Owns one logged-in Chrome session and lends it to report jobs one at a time. """
+
+    def __init__(self, download_dir, username, password, ic_url, check_url=None):
+        self.download_dir = download_dir
+        self.username = username
+        self.password = password
+        self.ic_url = ic_url
+        self.check_url = check_url
+        self.driver = None
+
+    def login(self):
+        """ Start Chrome if needed and log in to IC, reusing a saved session when it is still valid. """
+        if self.driver is None:
+            logging.info("Starting Chromedriver set up")
+            self.driver = setup_chromedriver(self.download_dir)
+            logging.info("Chromedriver set up and initialized")
+        if self.check_url and restore_session(self.driver, self.ic_url, self.check_url):
+            return
+        login_to_icampus(self.driver, self.username, self.password, self.ic_url)
+        logging.info(f"Logged in to IC: {self.driver.title}")
+        # Saving is only a shortcut for the next run; a failure here must not fail the report that needed the login
+        try:
+            save_session(self.driver)
+        except Exception as e:
+            logging.warning(f"Could not save IC session: {e}")
+
+    def session_expired(self):
+        """ True if there is no usable logged-in session: no driver, a dead driver, or the login form is showing. """
+        if self.driver is None:
+            return True
+        try:
+            self.driver.switch_to.default_content()
+            return len(self.driver.find_elements(By.ID, "username")) > 0
+        except WebDriverException:
+            self.quit()
+            return True
+
+    def get_driver(self):
+        """ Return the shared driver, logging in first if the session has expired. """
+        if self.session_expired():
+            self.login()
+        return self.driver
+
+    def run(self, name, job):
+        """ Run job(driver) with the shared driver. Retries once after a re-login if the session expired mid-job. """
+        start_time = time.time()
+        try:
+            result = job(self.get_driver())
+        except WebDriverException as e:
+            if not self.session_expired():
+                raise
+            logging.warning(f"Session expired while running {name}, logging in again: {e}")
+            result = job(self.get_driver())
+        logging.info(f"{name} finished in {time.time() - start_time:.2f} seconds.")
+        return result
+
+    def quit(self):
+        """ Close Chrome. """
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                pass
+            self.driver = None
+
+
+def main():
+    logging.basicConfig(
+        filename=os.environ.get("IC_LOG_FILE", '/home/KIPPNashvilleData/infinite_campus/icampus_reports.log'),
+        level=logging.INFO,
+        format='%(asctime)s:%(levelname)s:%(message)s'
+    )
+    start_time = time.time()
+    config = load_config()
+    reports_url = config["reports_url"]
+    broker = SessionBroker(DOWNLOAD_DIR, config["username"], config["password"], config["ic_url"], reports_url)
+
+    # ic_student_data logs to its own Google Sheet, so it gets a sheet handle alongside the driver
+    import ic_student_data
+    student_data_sheet = ic_student_data.setup_google_sheets('PythonAnywhereLogs', 'ic_student_data')
+    jobs = [("student_data", lambda driver: ic_student_data.run_report(driver, reports_url, DOWNLOAD_DIR, student_data_sheet,
+                                                                     raise_driver_errors=True))]
+    for module_name in REPORT_MODULES:
+        module = importlib.import_module(module_name)
+        jobs.append((module.base_file_name, lambda driver, module=module: module.run_report(driver, reports_url, DOWNLOAD_DIR)))
+
+    try:
+        for name, job in jobs:
+            try:
+                with record_report("ic_session", name) as result:
+                    generated = broker.run(name, job)
+                    result["outcome"] = "ok" if generated else "failed"
+                if generated:
+                    logging.info(f"Report generation and processing completed successfully for {name}")
+                else:
+                    logging.warning(f"Did not generate or process the report for {name}")
+            except Exception as e:
+                logging.error(f"Error running report {name}: {e}")
+    finally:
+        broker.quit()
+
+    elapsed_time = time.time() - start_time
+    logging.info(f"Script executed in {elapsed_time:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    run_script("ic_session", main)
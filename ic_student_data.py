@@ -2,7 +2,7 @@
 Title: Infinite Campus Student Data
 File Name: ic_student_data.py
 Purpose: Pull the grades from Infinite Campus at the end of the quarter for report cards, system reconciliation
-Dependencies: navigator.py, ic_file_mover_headers.py
+Dependencies: navigator.py, report_output.py, ic_file_mover_headers.py
 Description: This file extracts the data viewer reports from Infininte Campus in html format and deposits them into the icampus_downloads directory.
 Notes:
  - If the scripts encounters errors on the iframe functions, the frame names may have changed in Infinite Campus.
@@ -19,15 +19,17 @@ import glob
 import time
 import json
 import logging
-import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support.select import Select
-from selenium.webdriver.support import expected_conditions as EC
-from navigator import go_to_reports_id, go_to_settings, get_chrome_options, enable_download_headless
+from selenium.common.exceptions import WebDriverException
+from sheets_logger import setup_google_sheets, log_to_google_sheets
+from navigator import go_to_reports_id, go_to_settings, setup_chromedriver, wait_for_download_complete
+from report_index import find_report_xpath
+from report_output import publish_report
+from tracing import span
+from run_history import record_report, run_script
+from extract_parser import html_extract_to_csv, open_extract, probe_row_count
+from ic_session import login_to_icampus
 
 # Configure logging
 logging.basicConfig(
@@ -36,17 +38,8 @@ logging.basicConfig(
     format='%(asctime)s:%(levelname)s:%(message)s'
 )
 
-# Set up Google Sheets credentials and client
-def setup_google_sheets(spreadsheet_name, sheet_name):
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name('/home/KIPPNashvilleData/creds.json', scope)
-    client = gspread.authorize(creds)
-    sheet = client.open(spreadsheet_name).worksheet(sheet_name)
-    return sheet
-
-# Log to Google Sheets
-def log_to_google_sheets(sheet, message):
-    sheet.append_row([time.strftime("%Y-%m-%d %H:%M:%S"), message])
+# Maximum seconds to wait for a generated report to finish downloading
+DOWNLOAD_TIMEOUT = 300
 
 # Function to retrieve credentials and report configurations from JSON file
 def get_config():
@@ -59,45 +52,52 @@ def get_config():
 
 # Function to initialize Chrome driver
 def initialize_driver(download_dir):
-    chrome_options = get_chrome_options(download_dir)
-    driver = webdriver.Chrome(options=chrome_options)
-    enable_download_headless(driver, download_dir)
-    return driver
+    return setup_chromedriver(download_dir)
 
-# Function to generate report
-def generate_report(driver, report_xpath, download_dir, base_file_name, sheet):
+# Function to generate report. With raise_driver_errors, WebDriver errors are logged and re-raised so a
+# SessionBroker can log in again and retry the report when the session expired.
+def generate_report(driver, report_xpath, download_dir, base_file_name, sheet, raise_driver_errors=False):
     try:
-        report = driver.find_element(By.XPATH, report_xpath)
-        report.click()
+        with span("report_click", report=base_file_name):
+            report = driver.find_element(By.XPATH, find_report_xpath(driver, report_xpath))
+            report.click()
         logging.info(f"Report clicked for {base_file_name}")
         log_to_google_sheets(sheet, f"INFO: Report clicked for {base_file_name}")
 
         # Set report options
-        go_to_settings(driver)
-        format_drop = driver.find_element(By.ID, "mode")
-        htmlop = Select(format_drop)
-        htmlop.select_by_value("html")
-        school_list = driver.find_element(By.ID, "calendarID")
-        select = Select(school_list)
-        school_options = ["4163", "4164", "4165", "4166", "4166"]
-        for value in school_options:
-            select.select_by_value(value)
+        with span("option_setting", report=base_file_name):
+            go_to_settings(driver)
+            format_drop = driver.find_element(By.ID, "mode")
+            htmlop = Select(format_drop)
+            htmlop.select_by_value("html")
+            school_list = driver.find_element(By.ID, "calendarID")
+            select = Select(school_list)
+            school_options = ["4163", "4164", "4165", "4166", "4166"]
+            for value in school_options:
+                select.select_by_value(value)
         logging.info(f"Options set for {base_file_name}")
         log_to_google_sheets(sheet, f"INFO: Options set for {base_file_name}")
 
         # Generate report
         generate_button = driver.find_element(By.ID, "next")
+        clicked_at = time.time()
         generate_button.click()
         logging.info(f"Report generation initiated for {base_file_name}")
         log_to_google_sheets(sheet, f"INFO: Generate report button clicked for {base_file_name}.")
 
         # Wait for report to download
-        time.sleep(60)
+        with span("generation_wait", report=base_file_name):
+            downloaded = wait_for_download_complete(download_dir, "extract.html", DOWNLOAD_TIMEOUT, started_after=clicked_at)
+        if downloaded is None:
+            logging.warning(f"Download for {base_file_name} did not finish within {DOWNLOAD_TIMEOUT} seconds.")
+            log_to_google_sheets(sheet, f"WARNING: Download for {base_file_name} did not finish within {DOWNLOAD_TIMEOUT} seconds.")
         return process_download(download_dir, base_file_name, sheet)
 
     except Exception as e:
         logging.error(f"Error generating report for {base_file_name}: {e}")
         log_to_google_sheets(sheet, f"ERROR: Unable to generate report for {base_file_name}: {e}")
+        if raise_driver_errors and isinstance(e, WebDriverException):
+            raise
         return False
 
 # Function to process downloaded report
@@ -106,25 +106,22 @@ def process_download(download_dir, base_file_name, sheet):
         html_files = glob.glob(os.path.join(download_dir, 'extract.html'))
         if html_files:
             most_recent_html = html_files[0]
-            with open(most_recent_html, 'r') as file:
-                html_content = file.read()
-                num_records = html_content.count('<tr>')
-                if num_records > 2:  # Check if there are more than 2 records
-                    os.rename(most_recent_html, os.path.join(download_dir, f"{base_file_name}.html"))
-                    logging.info(f"Renamed extract.html to '{base_file_name}.html'")
-                    log_to_google_sheets(sheet, f"INFO: Renamed extract.html to '{base_file_name}.html'")
-                    df = pd.read_html(os.path.join(download_dir, f"{base_file_name}.html"), header=1)[0]
-                    df = df[df.iloc[:, 0] != "All Records"]
-                    cleaned_csv_path = os.path.join(download_dir, f"{base_file_name}.csv")
-                    df.to_csv(cleaned_csv_path, index=False)
-                    logging.info(f"Updated file saved to '{cleaned_csv_path}'")
-                    log_to_google_sheets(sheet, f"INFO: Updated file saved to '{cleaned_csv_path}'")
-                    return True
-                else:
-                    os.remove(most_recent_html)
-                    logging.info(f"Deleted '{most_recent_html}' as it has 2 or fewer records.")
-                    log_to_google_sheets(sheet, f"INFO: Deleted '{most_recent_html}' as it has 2 or fewer records.")
-                    return False
+            # The probe stops at the third row of the mapped extract; the parser then streams the file in chunks
+            cleaned_csv_path = os.path.join(download_dir, f"{base_file_name}.csv")
+            partial_csv_path = f"{cleaned_csv_path}.part"
+            with span("parse", report=base_file_name) as parse_span:
+                with open_extract(most_recent_html) as extract:
+                    num_records = probe_row_count(extract)
+                if num_records > 2:
+                    parse_span.update(rows=html_extract_to_csv(most_recent_html, partial_csv_path)[1],
+                                      bytes=os.path.getsize(most_recent_html))
+            if num_records > 2:  # Check if there are more than 2 records
+                return publish_report(most_recent_html, partial_csv_path, download_dir, base_file_name, sheet)
+            else:
+                os.remove(most_recent_html)
+                logging.info(f"Deleted '{most_recent_html}' as it has 2 or fewer records.")
+                log_to_google_sheets(sheet, f"INFO: Deleted '{most_recent_html}' as it has 2 or fewer records.")
+                return False
         else:
             logging.warning("No 'extract.html' file found in the directory.")
             log_to_google_sheets(sheet, "WARNING: No 'extract.html' file found in the directory.")
@@ -134,6 +131,36 @@ def process_download(download_dir, base_file_name, sheet):
         log_to_google_sheets(sheet, f"ERROR: Unable to process a download for {base_file_name}: {e}")
         return False
 
+# Function to run the report in a logged-in driver
+def run_report(driver, reports_url, download_dir, sheet, raise_driver_errors=False):
+    """ Generate the student_data report in an already logged-in driver. Under a SessionBroker, pass
+    raise_driver_errors=True so an expired session reaches the broker's re-login and retry. """
+    # Navigate to reports frame
+    logging.info("Clicking Link to Data Viewer Frame")
+    with span("data_viewer_navigation"):
+        driver.get(reports_url)
+    logging.info(f"Site opened: {driver.title}")
+    log_to_google_sheets(sheet, f"INFO: Site opened: {driver.title}")
+
+    # Generate the specific report
+    base_file_name = "student_data"
+    report_xpath = '//*[@id="row84446"]/td[3]' # student_data
+
+    # report_xpath = '//*[@id="row84450"]/td[3]' # attendance_codes
+    # base_file_name = "attendance_codes"
+
+
+    # Go to reports and generate report
+    go_to_reports_id(driver)
+    report_generated = generate_report(driver, report_xpath, download_dir, base_file_name, sheet, raise_driver_errors)
+    if report_generated:
+        logging.info(f"Report generation and processing completed successfully for {base_file_name}")
+        log_to_google_sheets(sheet, f"INFO: Report generation and processing completed successfully for {base_file_name}")
+    else:
+        logging.warning(f"Failed to generate or process the report for {base_file_name}")
+        log_to_google_sheets(sheet, f"WARNING: Did not generate or process the report for {base_file_name}")
+    return report_generated
+
 # Main function
 def main():
     # Record the start time
@@ -158,22 +185,10 @@ def main():
 
     # Open IC site and login
     logging.info("Opening Chromedriver and navigating to IC site")
-    driver.get(ic_url)
-    logging.info(f"Site opened: {driver.title}")
     try:
-        WebDriverWait(driver, 60).until(EC.presence_of_element_located((By.ID, "username"))).send_keys(username)
-        WebDriverWait(driver, 60).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password)
-        time.sleep(10)
-        driver.find_element(By.ID, "signinbtn").click()
-        time.sleep(15)
-
-        # Check if login was successful
-        expected_title = "Infinite Campus"
-        if driver.title != expected_title:
-            raise Exception("Login failed: Site title does not match 'Infinite Campus'")
-
+        login_seconds = login_to_icampus(driver, username, password, ic_url)
         logging.info(f"Logged in to IC: {driver.title}")
-        log_to_google_sheets(sheet, f"INFO: Logged in to IC: {driver.title}")
+        log_to_google_sheets(sheet, f"INFO: Logged in to IC in {login_seconds:.2f} seconds: {driver.title}")
 
     except Exception as e:
         logging.error(f"Error logging in to IC: {e}")
@@ -181,29 +196,9 @@ def main():
         driver.quit()
         return
 
-    # Navigate to reports frame
-    logging.info("Clicking Link to Data Viewer Frame")
-    driver.get(reports_url)
-    logging.info(f"Site opened: {driver.title}")
-    log_to_google_sheets(sheet, f"INFO: Site opened: {driver.title}")
-
-    # Generate the specific report
-    base_file_name = "student_data"
-    report_xpath = '//*[@id="row84446"]/td[3]' # student_data
-
-    # report_xpath = '//*[@id="row84450"]/td[3]' # attendance_codes
-    # base_file_name = "attendance_codes"
-
-
-    # Go to reports and generate report
-    go_to_reports_id(driver)
-    report_generated = generate_report(driver, report_xpath, download_dir, base_file_name, sheet)
-    if report_generated:
-        logging.info(f"Report generation and processing completed successfully for {base_file_name}")
-        log_to_google_sheets(sheet, f"INFO: Report generation and processing completed successfully for {base_file_name}")
-    else:
-        logging.warning(f"Failed to generate or process the report for {base_file_name}")
-        log_to_google_sheets(sheet, f"WARNING: Did not generate or process the report for {base_file_name}")
+    # Generate the specific report. ic_session.py records it around its broker instead.
+    with record_report("ic_student_data", "student_data") as result:
+        result["outcome"] = "ok" if run_report(driver, reports_url, download_dir, sheet) else "failed"
 
     # Close Chrome driver
     driver.quit()
@@ -217,7 +212,7 @@ def main():
     log_to_google_sheets(sheet, f"INFO: Script executed in {elapsed_time:.2f} seconds.")
 
 if __name__ == "__main__":
-    main()
+    run_script("ic_student_data", main)
 
 
 # import os
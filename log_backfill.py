@@ -0,0 +1,264 @@
+"""
+Title: Legacy Log Backfill
+File Name: log_backfill.py
+Purpose: Turn the free-text icampus_reports.log into run-history rows and stage latency histograms, so runs from
+before tracing existed give a performance baseline.
+Dependencies: run_history.py
+Description: The log is read as bytes one line at a time, so its size does not matter. NUL bytes are dropped, and
+a log record is found anywhere in the line, so junk in front of a timestamp does not hide the record. Both the
+"time:LEVEL:message" and "time - LEVEL - message" formats are read, and lines without a timestamp (stack
+traces, binary stretches) are skipped.
+Runs start at "Retrieving credentials and report configurations" and end at "Script executed in N seconds".
+A run is also closed by a gap of more than RUN_GAP seconds or by the end of the file. Within a run, the message
+pairs in RUN_STAGES time driver_startup, login and data_viewer_navigation. Each report's timeline is rebuilt
+from its messages:
+ - report_click: the previous report's end (less any "Waiting for N minutes" pause) to "Report clicked for X"
+ - option_setting: to "Options set for X"
+ - generate_click: to "Generate report button clicked for X" / "Report generation initiated for X"
+ - generation_wait: to "Renamed extract.html", "Deleted ..." or an error (generation and download together)
+ - parse: from the rename to "Updated file saved" / "Cleaned data saved"
+The outcome is "ok" after "completed successfully", "failed" after "Did not to generate" / "Failed to generate",
+and "error" after "Error ... for X". Runs get the id "log-<start time>" and the script name LOG_SCRIPT. Loading
+a run replaces the rows of that run id, so the backfill can be rerun.
+Usage:
+    python log_backfill.py [LOG_FILE] [--db run_history.db] [--histograms stage_histograms.csv] [--dry-run]
+"""
+
+import re
+import sys
+import csv
+import json
+import time
+import argparse
+import logging
+from run_history import HISTORY_DB, connect
+
+LOG_FILE = "/home/KIPPNashvilleData/infinite_campus/icampus_reports.log"
+LOG_SCRIPT = "icampus_reports.log"
+RUN_GAP = 2 * 3600  # seconds of silence that end a run
+HISTOGRAM_BUCKETS = [1, 2, 5, 10, 30, 60, 120, 300, 600, 1800]  # upper bounds in seconds; the last bucket is open
+
+RECORD = re.compile(rb"(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3})(?::| - )(DEBUG|INFO|WARNING|ERROR|CRITICAL)(?::| - )(.*)")
+
+RUN_START = re.compile(r"^Retrieving credentials and report configurations")
+RUN_END = re.compile(r"^Script executed in ([\d.]+) seconds")
+LOGIN_ERROR = re.compile(r"^Error logging in to IC")
+# Run-level stages: (stage, start message, end message)
+RUN_STAGES = [
+    ("driver_startup", re.compile(r"^Starting Chromedriver set ?up"), re.compile(r"^Chromedriver set up and initialized")),
+    ("login", re.compile(r"^Opening Chromedriver and navigating to IC site"), re.compile(r"^Logged in to IC")),
+    ("data_viewer_navigation", re.compile(r"^Clicking Link to Data Viewer Frame"), re.compile(r"^Site opened")),
+]
+
+WAITING = re.compile(r"^Waiting for (\d+) minutes")
+REPORT_CLICKED = re.compile(r"^Report clicked for (\w+)")
+OPTIONS_SET = re.compile(r"^Options set for (\w+)")
+GENERATE_CLICKED = re.compile(r"^(?:Generate report button clicked|Report generation initiated) for (\w+)")
+DOWNLOADED = re.compile(r"^(?:Renamed extract\.html|Deleted '.*extract\.html'|No 'extract\.html' file found)")
+SAVED = re.compile(r"^(?:Updated file|Cleaned data) saved to")
+SUCCEEDED = re.compile(r"^Report generation and processing completed successfully for (\w+)")
+FAILED = re.compile(r"^(?:Did not to|Failed to) generate or process the report for (\w+)")
+ERRORED = re.compile(r"^Error (?:generating report for (\w+)|after clicking generate report button for (\w+))(.*)")
+
+ERROR_CLASSES = [("no such element", "NoSuchElementException"), ("timeout", "TimeoutException"),
+                 ("alert", "UnexpectedAlertPresentException")]
+
+
+def iter_records(path):
+    """ Yield (epoch seconds, level, message) for each log record, skipping NULs, junk and continuation lines. """
+    with open(path, "rb") as f:
+        for raw in f:
+            match = RECORD.search(raw.replace(b"\x00", b""))
+            if match is None:
+                continue
+            stamp, millis, level, message = match.groups()
+            try:
+                epoch = time.mktime(time.strptime(stamp.decode("ascii"), "%Y-%m-%d %H:%M:%S")) + int(millis) / 1000
+            except ValueError:
+                continue
+            yield epoch, level.decode("ascii"), message.decode("utf-8", errors="replace").strip()
+
+
+def error_class(message):
+    lowered = message.lower()
+    return next((name for text, name in ERROR_CLASSES if text in lowered), "Error")
+
+
+class RunBuilder:
+    """ Rebuilds one run's stage timeline from its log records. """
+
+    def __init__(self, start):
+        self.run_id = "log-" + time.strftime("%Y%m%dT%H%M%S", time.localtime(start))
+        self.start = start
+        self.last = start
+        self.stages = {}
+        self.stage_starts = {}
+        self.reports = []
+        self.report = None
+        self.anchor = start  # Where the next report's report_click stage starts
+        self.outcome = "incomplete"
+        self.error_class = None
+
+    def add(self, epoch, message):
+        self.last = epoch
+        for stage, start, end in RUN_STAGES:
+            if start.search(message):
+                self.stage_starts[stage] = epoch
+            elif end.search(message) and stage in self.stage_starts:
+                self.stages[stage] = round(epoch - self.stage_starts.pop(stage), 3)
+                self.anchor = epoch
+        if LOGIN_ERROR.search(message):
+            self.outcome, self.error_class = "error", "LoginError"
+            return
+        waiting = WAITING.search(message)
+        if waiting:
+            self.anchor = epoch + int(waiting.group(1)) * 60
+            return
+        clicked = REPORT_CLICKED.search(message)
+        if clicked:
+            self.close_report("incomplete", "Incomplete")
+            start = min(self.anchor, epoch)  # A pause can end early, so the anchor may be after the click
+            self.report = {"report": clicked.group(1), "started_at": start, "stages": {"report_click": round(epoch - start, 3)},
+                           "mark": epoch, "outcome": None, "error_class": None}
+            return
+        if self.report is None:
+            return
+        for stage, pattern in (("option_setting", OPTIONS_SET), ("generate_click", GENERATE_CLICKED)):
+            if pattern.search(message):
+                self.stage(stage, epoch)
+                return
+        if DOWNLOADED.search(message) and "generation_wait" not in self.report["stages"]:
+            self.stage("generation_wait", epoch)
+            return
+        if SAVED.search(message) and "generation_wait" in self.report["stages"]:
+            self.stage("parse", epoch)
+            return
+        if SUCCEEDED.search(message):
+            self.close_report("ok", None, epoch)
+        elif FAILED.search(message):
+            self.close_report("failed", None, epoch)
+        else:
+            errored = ERRORED.search(message)
+            if errored:
+                if "generation_wait" not in self.report["stages"] and "generate_click" in self.report["stages"]:
+                    self.stage("generation_wait", epoch)
+                self.close_report("error", error_class(errored.group(3)), epoch)
+
+    def stage(self, name, epoch):
+        self.report["stages"][name] = round(epoch - self.report["mark"], 3)
+        self.report["mark"] = epoch
+
+    def close_report(self, outcome, error, epoch=None):
+        if self.report is None:
+            return
+        end = epoch or self.report["mark"]
+        self.report.update(outcome=outcome, error_class=error, seconds=round(end - self.report["started_at"], 3))
+        self.reports.append(self.report)
+        self.report = None
+        self.anchor = end
+
+    def finish(self, script_seconds=None):
+        self.close_report("incomplete", "Incomplete")
+        if script_seconds is not None and self.outcome == "incomplete":
+            self.outcome = "ok"
+        self.seconds = round(script_seconds if script_seconds is not None else self.last - self.start, 3)
+        return self
+
+
+def parse_runs(path):
+    """ Yield a finished RunBuilder for every run in the log. """
+    run = None
+    for epoch, level, message in iter_records(path):
+        if run is not None and (epoch - run.last > RUN_GAP or epoch < run.start):
+            yield run.finish()
+            run = None
+        if RUN_START.search(message):
+            if run is not None:
+                yield run.finish()
+            run = RunBuilder(epoch)
+            continue
+        if run is None:
+            continue
+        run.add(epoch, message)
+        ended = RUN_END.search(message)
+        if ended:
+            yield run.finish(float(ended.group(1)))
+            run = None
+    if run is not None:
+        yield run.finish()
+
+
+def load_runs(runs, db_path=HISTORY_DB):
+    """ Replace each run's rows in the run-history database. Returns (runs, reports) loaded. """
+    run_count = report_count = 0
+    with connect(db_path) as db:
+        for run in runs:
+            db.execute("DELETE FROM reports WHERE run_id = ?", (run.run_id,))
+            db.execute("INSERT OR REPLACE INTO runs (run_id, script, started_at, seconds, outcome, error_class) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       (run.run_id, LOG_SCRIPT, run.start, run.seconds, run.outcome, run.error_class))
+            for report in run.reports:
+                db.execute("INSERT INTO reports (run_id, script, report, started_at, seconds, stages, rows, bytes, "
+                           "outcome, error_class) VALUES (?, ?, ?, ?, ?, ?, NULL, NULL, ?, ?)",
+                           (run.run_id, LOG_SCRIPT, report["report"], report["started_at"], report["seconds"],
+                            json.dumps(report["stages"]), report["outcome"], report["error_class"]))
+                report_count += 1
+            run_count += 1
+    return run_count, report_count
+
+
+def stage_histograms(runs):
+    """ {stage: [count per HISTOGRAM_BUCKETS bucket, plus one for longer]} over run and report stages. """
+    histograms = {}
+    for run in runs:
+        timings = list(run.stages.items())
+        timings.append(("script", run.seconds))
+        for report in run.reports:
+            timings.extend(report["stages"].items())
+            timings.append(("report_total", report["seconds"]))
+        for stage, seconds in timings:
+            counts = histograms.setdefault(stage, [0] * (len(HISTOGRAM_BUCKETS) + 1))
+            counts[next((i for i, bound in enumerate(HISTOGRAM_BUCKETS) if seconds < bound), len(HISTOGRAM_BUCKETS))] += 1
+    return histograms
+
+
+def bucket_labels():
+    lower = [0] + HISTOGRAM_BUCKETS
+    return [f"{low}-{high}s" for low, high in zip(lower, HISTOGRAM_BUCKETS)] + [f"{HISTOGRAM_BUCKETS[-1]}s+"]
+
+
+def write_histograms(histograms, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["stage"] + bucket_labels())
+        for stage, counts in sorted(histograms.items()):
+            writer.writerow([stage] + counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill run history and stage histograms from icampus_reports.log.")
+    parser.add_argument("log_file", nargs="?", default=LOG_FILE)
+    parser.add_argument("--db", default=HISTORY_DB, help="Run-history database to load")
+    parser.add_argument("--histograms", help="Write per-stage latency histograms to this CSV")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and summarize without loading the database")
+    args = parser.parse_args(argv)
+
+    runs = list(parse_runs(args.log_file))
+    if not args.dry_run:
+        run_count, report_count = load_runs(runs, args.db)
+        logging.info(f"Loaded {run_count} runs and {report_count} reports from {args.log_file} into {args.db}")
+        print(f"Loaded {run_count} runs and {report_count} reports into {args.db}")
+
+    histograms = stage_histograms(runs)
+    if args.histograms:
+        write_histograms(histograms, args.histograms)
+        print(f"Histograms saved to {args.histograms}")
+    labels = bucket_labels()
+    print(f"{'stage':<24}" + "".join(f"{label:>10}" for label in labels))
+    for stage, counts in sorted(histograms.items()):
+        print(f"{stage:<24}" + "".join(f"{count:>10}" for count in counts))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,44 @@
 import os
+import glob
 import time
+import json
+import tempfile
+import threading
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from tracing import span, traced, record_span
 
+# Lean profile: block page weight the bots never look at. Turn on with IC_LEAN_PROFILE=1.
+LEAN_PROFILE = os.environ.get("IC_LEAN_PROFILE") == "1"
+LEAN_WINDOW_SIZE = "1024,768"
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.webp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.css",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*hotjar.com*",
+    "*newrelic.com*", "*nr-data.net*", "*pendo.io*", "*walkme.com*",
+]
 
+# Frame chains found by resolve_frame_path, keyed by target ("reports", "settings")
+FRAME_CACHE_FILE = os.environ.get("IC_FRAME_CACHE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "frame_paths.json"))
+# Serializes read-modify-write of the cache between worker threads
+_frame_cache_lock = threading.Lock()
+# Known frame chains, tried when there is no cached chain
+REPORT_FRAMES = ["frameWorkspace", "frameWorkspaceWrapper", "frameWorkspaceDetail", "reportList"]
+SETTINGS_FRAMES = ["frameWorkspace", "frameWorkspaceWrapper", "frameWorkspaceDetail"]
+# Seconds to wait for each frame in a known chain before rediscovering
+FRAME_TIMEOUT = 10
+# Seconds to keep rediscovering while the page loads
+DISCOVERY_TIMEOUT = 60
 
-def get_chrome_options(download_dir):
-    """ Sets the chrome drive options """
+
+
+def get_chrome_options(download_dir, lean=None):
+    """ Sets the chrome drive options. lean (default LEAN_PROFILE) adds the lean profile arguments and prefs. """
     chrome_options = Options()
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--disable-gpu")
@@ -27,9 +55,29 @@ def get_chrome_options(download_dir):
         "w3c": True,
         "safebrowsing.enabled": True
         }
+    if LEAN_PROFILE if lean is None else lean:
+        chrome_options.add_argument(f"--window-size={LEAN_WINDOW_SIZE}")
+        chrome_options.add_argument("--disable-background-networking")
+        chrome_options.add_argument("--disable-component-update")
+        chrome_options.add_argument("--disable-default-apps")
+        chrome_options.add_argument("--disable-sync")
+        chrome_options.add_argument("--disable-remote-fonts")
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        prefs.update({
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.stylesheets": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+            "profile.default_content_setting_values.notifications": 2,
+            "safebrowsing.enabled": False,
+        })
     chrome_options.add_experimental_option('prefs', prefs)
     return chrome_options
 
+def enable_lean_mode(browser, blocked_urls=LEAN_BLOCKED_URLS):
+    """ Block images, fonts, stylesheets and trackers for every request the browser makes. """
+    browser.execute_cdp_cmd("Network.enable", {})
+    browser.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_urls})
+
 def enable_download_headless(browser,download_dir):
     # """ Enable and define how files ar downloaded """
      browser.command_executor._commands["send_command"] = ("POST", '/session/$sessionId/chromium/send_command')
@@ -48,10 +96,47 @@ def enable_download_headless1(browser, download_dir):
     print(f"Downloads enabled. Files will be saved to: {download_path}")
     return filename
 
-def setup_chromedriver(download_dir):
-    chrome_options = get_chrome_options(download_dir)
+def wait_for_download_complete(download_dir, file_name, timeout=300, started_after=None, poll_interval=1):
+    """ Wait for a download to finish writing and return its path, or None once the timeout passes.
+
+    Chrome writes downloads to a ".crdownload" partial and renames it when done, so the file only
+    counts as complete when no partials remain in the directory and its size is stable between two
+    polls. Pass started_after (a time.time() value) to ignore a stale copy left by an earlier run.
+    The time until the first bytes appear is traced as "generation_wait" and the rest as "download".
+    """
+    file_path = os.path.join(download_dir, file_name)
+    started = started_after or time.time()
+    deadline = time.time() + timeout
+    first_seen = None
+    last_size = None
+    while time.time() < deadline:
+        partials = glob.glob(os.path.join(download_dir, "*.crdownload"))
+        if first_seen is None and (partials or os.path.exists(file_path) and os.path.getmtime(file_path) >= started):
+            first_seen = time.time()
+            record_span("generation_wait", started, first_seen - started, file=file_name)
+        if os.path.exists(file_path) and not partials:
+            stat = os.stat(file_path)
+            if started_after is None or stat.st_mtime >= started_after:
+                if stat.st_size > 0 and stat.st_size == last_size:
+                    first_seen = first_seen or started  # A copy that was already there when the wait began
+                    record_span("download", first_seen, time.time() - first_seen, file=file_name, bytes=stat.st_size)
+                    return file_path
+                last_size = stat.st_size
+        time.sleep(poll_interval)
+    if first_seen is None:
+        record_span("generation_wait", started, time.time() - started, status="error", error="Timeout", file=file_name)
+    else:
+        record_span("download", first_seen, time.time() - first_seen, status="error", error="Timeout", file=file_name)
+    return None
+
+@traced("driver_startup")
+def setup_chromedriver(download_dir, lean=None):
+    lean = LEAN_PROFILE if lean is None else lean
+    chrome_options = get_chrome_options(download_dir, lean)
     driver = webdriver.Chrome(options=chrome_options)
     enable_download_headless(driver, download_dir)
+    if lean:
+        enable_lean_mode(driver)
     return driver
 
 
@@ -82,19 +167,10 @@ def go_to_reports(driver):
         except:
             print(f"Timeout: {iframe_name} iframe not found")
 
+@traced("go_to_reports")
 def go_to_reports_id(driver):
     """ Move to the browser to the reports iframe. """
-    driver.switch_to.default_content()
-    iframe_ids = ["frameWorkspace", "frameWorkspaceWrapper", "frameWorkspaceDetail", "reportList"]
-    #iframe_names = ["frameWorkspaceWrapper", "frameWorkspaceDetail", "reportList"]
-    for iframe_id in iframe_ids:
-        try:
-            # Wait for the iframe to be present before switching to it
-            iframe = WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.NAME, iframe_id)))
-            driver.switch_to.frame(iframe)
-            print(f"Switched to iframe: {iframe_id}")
-        except:
-            print(f"Timeout: {iframe_id} iframe not found")
+    resolve_frame_path(driver, "reports", By.CSS_SELECTOR, 'tr[id^="row"]', REPORT_FRAMES)
 
 # def go_to_reports(driver):
 
@@ -104,35 +180,110 @@ def go_to_reports_id(driver):
 #         driver.switch_to.frame(iframe_name)
 #         print(f"Switched to iframe: {iframe_name}")
 
+@traced("go_to_settings")
 def go_to_settings(driver):
     """ Move the browser to the iframe with the report settings. """
-    driver.switch_to.default_content()
-    iframe_names = ["frameWorkspace", "frameWorkspaceWrapper", "frameWorkspaceDetail"]
-    for iframe_name in iframe_names:
-        try:
-            # Wait for the iframe to be present before switching to it
-            iframe = WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.NAME, iframe_name)))
-            driver.switch_to.frame(iframe)
-            print(f"Switched to iframe: {iframe_name}")
-        except TimeoutException:
-            print(f"Timeout: {iframe_name} iframe not found")
+    resolve_frame_path(driver, "settings", By.ID, "mode", SETTINGS_FRAMES)
+
 
+def traverse_iframes_by_index(driver, by=None, value=None):
+    """ Use to find the names of the iframes in the infinite campus site page
 
-def traverse_iframes_by_index(driver):
-    """ Use to find the names of the iframes in the infinite campus site page """
+    Walks every nested iframe from the current frame and prints its index and name. If a target element
+    (by, value) is given, stops at the first frame containing it and returns the chain of frames leading there,
+    using each frame's name, or its index when it has no name. Returns None if the target was not found.
+    """
     def print_iframe_details(index, iframe_name):
         print(f"Switched to iframe with index {index}: {iframe_name}")
 
-    def traverse_iframes_recursive(driver, iframes, index=0):
-        if index < len(iframes):
-            iframe_element = iframes[index]
-            driver.switch_to.frame(iframe_element)
+    def traverse_iframes_recursive(driver, path):
+        iframes = driver.find_elements(By.TAG_NAME, "iframe")
+        for index in range(len(iframes)):
+            driver.switch_to.frame(iframes[index])
             iframe_name = driver.execute_script("return window.name;")
             print_iframe_details(index, iframe_name)
-            nested_iframes = driver.find_elements(By.TAG_NAME, "iframe")
-            traverse_iframes_recursive(driver, nested_iframes)
+            frame_path = path + [iframe_name or index]
+            if by is not None and driver.find_elements(by, value):
+                return frame_path
+            found = traverse_iframes_recursive(driver, frame_path)
+            if found is not None:
+                return found
             driver.switch_to.parent_frame()
-            traverse_iframes_recursive(driver, iframes, index+1)
+        return None
+
+    return traverse_iframes_recursive(driver, [])
+
+
+def load_frame_cache(cache_file=FRAME_CACHE_FILE):
+    """ Read the cached frame chains, or an empty dict if there are none. """
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_frame_path(key, frame_path, cache_file=FRAME_CACHE_FILE):
+    """ Store the frame chain for key in the cache file. """
+    with _frame_cache_lock:
+        cache = load_frame_cache(cache_file)
+        cache[key] = frame_path
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(cache_file) or ".", suffix=".tmp", delete=False) as f:
+            json.dump(cache, f, indent=2)
+        os.replace(f.name, cache_file)
+
+
+def switch_to_frame_path(driver, frame_path, timeout=FRAME_TIMEOUT):
+    """ Switch from the top of the page down a chain of frame names/indexes. Returns False if a frame is missing. """
+    driver.switch_to.default_content()
+    for frame in frame_path:
+        try:
+            with span("iframe_switch", frame=frame):
+                WebDriverWait(driver, timeout).until(EC.frame_to_be_available_and_switch_to_it(frame))
+            print(f"Switched to iframe: {frame}")
+        except TimeoutException:
+            print(f"Timeout: {frame} iframe not found")
+            return False
+    return True
+
+
+def resolve_frame_path(driver, key, by, value, known_path, timeout=DISCOVERY_TIMEOUT):
+    """ Switch to the frame holding the element (by, value).
+
+    Tries the cached chain for key first, then known_path, and only walks the frame tree with
+    traverse_iframes_by_index when both miss. A chain that works is written back to the cache, so a renamed
+    frame costs one discovery instead of a timeout on every run. Returns the chain, or None if not found.
+    """
+    cached_path = load_frame_cache().get(key)
+    candidates = [cached_path] if cached_path else []
+    if known_path != cached_path:
+        candidates.append(known_path)
+    for frame_path in candidates:
+        if switch_to_frame_path(driver, frame_path):
+            try:
+                WebDriverWait(driver, FRAME_TIMEOUT).until(EC.presence_of_element_located((by, value)))
+                if frame_path != cached_path:
+                    save_frame_path(key, frame_path)
+                return frame_path
+            except TimeoutException:
+                pass
+        print(f"Frame path {frame_path} missed the {key} target, trying the next option")
+
+    # Rediscover the frame chain while the page is still loading
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        driver.switch_to.default_content()
+        try:
+            frame_path = traverse_iframes_by_index(driver, by, value)
+        except WebDriverException:
+            frame_path = None
+        if frame_path is not None:
+            print(f"Discovered {key} frame path: {frame_path}")
+            save_frame_path(key, frame_path)
+            return frame_path
+        time.sleep(1)
+    print(f"Timeout: no frame holds the {key} target {value}")
+    return None
 
 if __name__ == "__main__":
     print("This code is being run directly.")
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Title: Typed Parquet Output
+File Name: parquet_output.py
+Purpose: Write a typed Parquet copy of every report CSV so downstream loads do not re-parse untyped text.
+Dependencies: pandas, pyarrow (optional; without it no Parquet file is written)
+Description: Column types come from a per-report schema registry. Each schema lists "dates", "ids" and
+"categories" columns. Dates become Parquet dates, IDs become int64 (nullable), and categories become
+dictionary-encoded strings. Columns the schema does not name are typed by DEFAULT_RULES, which match the
+column name: dates by a "date" word or "Date" suffix or "birth", IDs by an "ID"/"Number" word or camelCase suffix
+(not "paid", "grid" or phone numbers), and categories by school, grade or code. The name only nominates a column:
+a date column is converted only when every non-blank value parses as a date, and an ID column only when every
+non-blank value is an integer without a leading zero, so codes like "A123" and student numbers like "000123" stay
+text. Otherwise the column is written as text, never with values replaced by nulls.
+Per-report schemas can be added to SCHEMA_REGISTRY or to the JSON file SCHEMA_FILE, which has the same shape:
+    {"student_data": {"dates": ["birthDate"], "ids": ["personID"], "categories": ["schoolName", "grade"]}}
+Compression is set with IC_PARQUET_COMPRESSION ("snappy", "zstd", "gzip", or "none").
+"""
+
+import os
+import re
+import json
+import logging
+import importlib.util
+import pandas as pd
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parquet_schemas.json")
+PARQUET_COMPRESSION = os.environ.get("IC_PARQUET_COMPRESSION", "snappy")
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+LEADING_ZERO = re.compile(r"^\s*0\d")
+
+DEFAULT_RULES = {
+    # "date" as a word or camelCase suffix, so names like "candidate" or "mandate" stay text
+    "dates": re.compile(r"(?i:(^|_|\s)date|birth|dob$)|Date$"),
+    # "id"/"number" as the last word or camelCase part, so names like "paid" or "valid" stay text
+    "ids": re.compile(r"^(?!(?i:.*phone))(?:(?i:.*(?:^|_|\s)(?:id|number))|.*[a-z](?:ID|Id|Number))$"),
+    "categories": re.compile(r"school|grade|code", re.IGNORECASE),
+}
+
+SCHEMA_REGISTRY = {}
+
+
+def get_schema(report, schema_file=SCHEMA_FILE):
+    """ Return the registered schema for a report: SCHEMA_REGISTRY first, then SCHEMA_FILE, else empty. """
+    if report in SCHEMA_REGISTRY:
+        return SCHEMA_REGISTRY[report]
+    try:
+        with open(schema_file) as f:
+            return json.load(f).get(report, {})
+    except (OSError, ValueError):
+        return {}
+
+
+def column_types(columns, schema):
+    """ Map each column to "dates", "ids", "categories" or None. Named columns win over the name rules. """
+    types = {}
+    for column in columns:
+        types[column] = next((kind for kind in ("dates", "ids", "categories") if column in schema.get(kind, [])), None)
+        if types[column] is None:
+            types[column] = next((kind for kind, rule in DEFAULT_RULES.items() if rule.search(column)), None)
+    return types
+
+
+def apply_schema(df, schema):
+    """ Convert the text columns of a report DataFrame to their schema types, column by column. """
+    for column, kind in column_types(df.columns, schema).items():
+        values = df[column]
+        if kind == "dates":
+            filled = values.notna() & values.str.strip().ne("")
+            if not filled.any():
+                continue
+            parsed = pd.to_datetime(values.where(filled), errors="coerce", format="mixed")
+            # Keep the text if any value is not a date, rather than turn it into a null
+            if parsed[filled].notna().all():
+                df[column] = parsed.dt.date
+        elif kind == "ids":
+            if values.dropna().str.match(LEADING_ZERO).any():
+                continue  # Zero-padded IDs would lose their padding as integers
+            numbers = pd.to_numeric(values, errors="coerce")
+            if numbers.notna().sum() == values.notna().sum() and (numbers.dropna() % 1 == 0).all():
+                df[column] = numbers.astype("Int64")
+        elif kind == "categories":
+            df[column] = values.astype("category")
+    return df
+
+
+def write_parquet(csv_path, report, parquet_path=None, compression=PARQUET_COMPRESSION):
+    """ Write a typed Parquet copy of a report CSV next to it. Returns the Parquet path, or None without pyarrow. """
+    if not PARQUET_AVAILABLE:
+        logging.warning("pyarrow is not installed; skipped Parquet output.")
+        return None
+    parquet_path = parquet_path or f"{os.path.splitext(csv_path)[0]}.parquet"
+    df = pd.read_csv(csv_path, dtype=str)
+    df = apply_schema(df, get_schema(report))
+    tmp_path = f"{parquet_path}.part"
+    df.to_parquet(tmp_path, engine="pyarrow", compression=None if compression == "none" else compression, index=False)
+    os.replace(tmp_path, parquet_path)
+    logging.info(f"Parquet file saved to '{parquet_path}'")
+    return parquet_path
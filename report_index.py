@@ -0,0 +1,101 @@
+"""
+Title: Data Viewer Report Index
+File Name: report_index.py
+Purpose: Look up Data Viewer report rows by report name instead of hard-coded row XPaths.
+Dependencies: selenium
+Description: IC renumbers the Data Viewer rows from time to time, and a hard-coded XPath like
+//*[@id="row84450"]/td[3] then fails with "no such element" after a full wait. The index scrapes the report
+list once (row id and report name for every row) in one JavaScript call. It is cached in memory and in
+REPORT_INDEX_FILE, and refreshed when it is older than INDEX_TTL or when a row it points to is gone from the page.
+Report configs may give either a report name or a legacy row XPath. For an XPath, the name of the row is taken
+from earlier scrapes, so the report is still found after IC renumbers it.
+Usage: call find_report_xpath(driver, report) while the driver is in the report list frame (navigator.go_to_reports_id).
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import tempfile
+import threading
+from selenium.webdriver.common.by import By
+
+REPORT_INDEX_FILE = os.environ.get("IC_REPORT_INDEX_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_index.json"))
+INDEX_TTL = 24 * 60 * 60  # Seconds before the index is scraped again
+
+SCRAPE_SCRIPT = """
+return Array.from(document.querySelectorAll('tr[id^="row"]')).map(function (row) {
+    return [row.id, row.cells.length > 2 ? row.cells[2].textContent.trim() : ""];
+});
+"""
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def load_report_index(index_file=REPORT_INDEX_FILE):
+    """ Read the saved index: {"scraped_at": time, "rows": {name: row_id}, "names": {row_id: name}}. """
+    try:
+        with open(index_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"scraped_at": 0, "rows": {}, "names": {}}
+
+
+def save_report_index(index, index_file=REPORT_INDEX_FILE):
+    """ Write the index atomically, through a temp file of its own so concurrent writers never share one. """
+    with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(index_file) or ".", suffix=".tmp", delete=False) as f:
+        json.dump(index, f, indent=2)
+    os.replace(f.name, index_file)
+
+
+def scrape_report_index(driver, previous=None):
+    """ Scrape every report row in the current frame. Names of rows seen in earlier scrapes are kept for XPath lookups. """
+    rows = {}
+    names = dict(previous["names"]) if previous else {}
+    for row_id, name in driver.execute_script(SCRAPE_SCRIPT):
+        if name:
+            rows[name] = row_id
+            names[row_id] = name
+    logging.info(f"Indexed {len(rows)} Data Viewer reports")
+    return {"scraped_at": time.time(), "rows": rows, "names": names}
+
+
+def get_report_index(driver, refresh=False, index_file=REPORT_INDEX_FILE, ttl=INDEX_TTL):
+    """ Return the report index, scraping it again if asked, if it is missing, or if it is older than ttl. """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = load_report_index(index_file)
+        if refresh or not _index["rows"] or time.time() - _index["scraped_at"] > ttl:
+            # Keep row names another process saved since this one loaded the file
+            previous = {"names": {**load_report_index(index_file)["names"], **_index["names"]}}
+            _index = scrape_report_index(driver, previous)
+            save_report_index(_index, index_file)
+        return _index
+
+
+def find_report_xpath(driver, report, index_file=REPORT_INDEX_FILE, ttl=INDEX_TTL):
+    """ Return the XPath of the clickable cell for a report given by name or by a (possibly stale) row XPath. """
+    match = re.search(r'@id="(row\d+)"', report)
+    index = get_report_index(driver, index_file=index_file, ttl=ttl)
+    if match:
+        row_id = match.group(1)
+        if driver.find_elements(By.ID, row_id):
+            return report
+        name = index["names"].get(row_id)
+        if name is None:
+            # Nothing known about this row; leave the XPath as configured
+            return report
+    else:
+        name = report
+
+    row_id = index["rows"].get(name)
+    if row_id is None or not driver.find_elements(By.ID, row_id):
+        # IC renumbered or renamed the rows since the last scrape
+        index = get_report_index(driver, refresh=True, index_file=index_file, ttl=ttl)
+        row_id = index["rows"].get(name)
+        if row_id is None:
+            raise KeyError(f"No Data Viewer report named '{name}'")
+    return f'//*[@id="{row_id}"]/td[3]'
@@ -0,0 +1,68 @@
+"""
+Title: Report Output
+File Name: report_output.py
+Purpose: Publish a converted report download the same way in every script that produces one.
+Dependencies: snapshot_store.py, parquet_output.py, change_capture.py, tracing.py, sheets_logger.py
+Description: Once a download has been parsed into <report>.csv.part, publish_report runs the steps that follow:
+ 1. archive the raw download in the snapshot store (a failure is logged and skipped)
+ 2. rename the download to <report><ext> in the output directory
+ 3. move the CSV into place as <report>.csv
+ 4. write the typed Parquet copy (a failure is logged and skipped)
+ 5. write the change files for reports with change capture (change_capture.CDC_DIR under the output directory)
+A report whose CSV lacks a configured key column fails, logged as an error to the log and the sheet, because
+its change files would be wrong. Rows dropped for a repeated key are reported to the sheet as a warning.
+"""
+
+import os
+import logging
+from sheets_logger import log_to_google_sheets
+from snapshot_store import archive_file
+from parquet_output import write_parquet
+from change_capture import KeyColumnError, tracks_changes, capture_changes
+from tracing import span
+
+
+def publish_report(extract_path, partial_csv_path, output_dir, base_file_name, sheet):
+    """ Archive, rename and move a parsed download into place, then write its Parquet copy and change files.
+
+    Returns False if change capture failed on a missing key column, else True.
+    """
+    extract_name = os.path.basename(extract_path)
+    extract_ext = os.path.splitext(extract_name)[1]
+    # Keep the raw download in the snapshot store before it is renamed
+    try:
+        with span("archive", report=base_file_name):
+            archive_file(extract_path, base_file_name)
+    except Exception as e:
+        logging.warning(f"Could not archive the download for {base_file_name}: {e}")
+    os.rename(extract_path, os.path.join(output_dir, f"{base_file_name}{extract_ext}"))
+    logging.info(f"Renamed {extract_name} to '{base_file_name}{extract_ext}'")
+    log_to_google_sheets(sheet, f"INFO: Renamed {extract_name} to '{base_file_name}{extract_ext}'")
+    cleaned_csv_path = os.path.join(output_dir, f"{base_file_name}.csv")
+    os.replace(partial_csv_path, cleaned_csv_path)
+    logging.info(f"Updated file saved to '{cleaned_csv_path}'")
+    log_to_google_sheets(sheet, f"INFO: Updated file saved to '{cleaned_csv_path}'")
+
+    # Typed Parquet copy for downstream loads; a failure here does not fail the report
+    try:
+        with span("parquet_write", report=base_file_name):
+            write_parquet(cleaned_csv_path, base_file_name)
+    except Exception as e:
+        logging.warning(f"Could not write Parquet file for {base_file_name}: {e}")
+
+    # Inserts/updates/deletes since the last run, for reports with change capture
+    if tracks_changes(base_file_name):
+        try:
+            with span("change_capture", report=base_file_name):
+                counts = capture_changes(cleaned_csv_path, base_file_name)
+        except KeyColumnError as e:
+            logging.error(f"Change capture for {base_file_name} is misconfigured: {e}")
+            log_to_google_sheets(sheet, f"ERROR: Change capture for {base_file_name} is misconfigured: {e}")
+            return False
+        except Exception as e:
+            logging.warning(f"Could not capture changes for {base_file_name}: {e}")
+        else:
+            if counts["duplicates"]:
+                log_to_google_sheets(sheet, f"WARNING: {counts['duplicates']} rows of {base_file_name} repeat the "
+                                            f"key of an earlier row and were left out of the change files")
+    return True
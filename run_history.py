@@ -0,0 +1,180 @@
+"""
+Title: Run History
+File Name: run_history.py
+Purpose: Keep a structured history of every script run and report, so timeouts and concurrency can be tuned from data.
+Dependencies: None (standard library sqlite3)
+Description: Runs and reports are written to the SQLite database HISTORY_DB.
+ - runs: one row per script run (run id, script, start, seconds, outcome, error class)
+ - reports: one row per report in a run (run id, script, report, start, seconds, stage durations as JSON,
+   rows, bytes, outcome, error class)
+run_script wraps a script's main() in tracing.trace_run and records the run. record_report wraps one report.
+While it is open, every tracing span that ends on the same thread adds its seconds to the report's stages,
+and a span's "rows" and "bytes" attributes become the report's rows and bytes. note() sets them directly for
+code that is not traced. The outcome is "ok", "failed" (the report ran but produced nothing), or "error" (it
+raised).
+The run id is tracing.RUN_ID, so a report row can be matched to its spans in the trace file.
+Usage:
+    python run_history.py [--days 30] [--by day|week|month] [--stages]
+prints runs, failure rate, and p50/p95 seconds per report, overall or per period, and per stage with --stages.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from tracing import RUN_ID, add_listener, trace_run
+
+HISTORY_DB = os.environ.get("IC_HISTORY_DB", "/home/KIPPNashvilleData/infinite_campus/run_history.db")
+PERIOD_FORMATS = {"day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m"}
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY, script TEXT, started_at REAL, seconds REAL, outcome TEXT, error_class TEXT
+);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY, run_id TEXT, script TEXT, report TEXT, started_at REAL, seconds REAL,
+    stages TEXT, rows INTEGER, bytes INTEGER, outcome TEXT, error_class TEXT
+);
+CREATE INDEX IF NOT EXISTS reports_by_report ON reports (report, started_at);
+"""
+
+
+def connect(db_path=None):
+    db = sqlite3.connect(db_path or HISTORY_DB, timeout=30)
+    db.executescript(SCHEMA)
+    return db
+
+
+def insert(table, row, db_path=None):
+    """ Write one row. History is best effort and never fails a run. """
+    try:
+        with connect(db_path) as db:
+            columns = ", ".join(row)
+            db.execute(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({', '.join('?' * len(row))})",
+                       list(row.values()))
+    except sqlite3.Error as e:
+        logging.warning(f"Could not record {table} history: {e}")
+
+
+def collect_span(record):
+    """ Tracing listener: add a finished span to the report open on this thread. """
+    current = getattr(_local, "report", None)
+    if current is None or record["name"] == "report":
+        return
+    current["stages"][record["name"]] = round(current["stages"].get(record["name"], 0) + record["seconds"], 3)
+    for key in ("rows", "bytes"):
+        if record.get(key) is not None:
+            current[key] = record[key]
+
+
+add_listener(collect_span)
+
+
+def note(**values):
+    """ Set rows/bytes (or outcome) on the report open on this thread. """
+    current = getattr(_local, "report", None)
+    if current is not None:
+        current.update(values)
+
+
+@contextmanager
+def record_report(script, report, run_id=RUN_ID):
+    """ Record one report. Yields a dict; set result["outcome"] = "failed" if the report produced nothing. """
+    current = {"stages": {}, "rows": None, "bytes": None, "outcome": "ok"}
+    previous = getattr(_local, "report", None)
+    _local.report = current
+    start = time.time()
+    error_class = None
+    try:
+        yield current
+    except BaseException as e:
+        error_class = type(e).__name__
+        if not (isinstance(e, SystemExit) and current["outcome"] == "failed"):
+            current["outcome"] = "error"
+        raise
+    finally:
+        _local.report = previous
+        insert("reports", {
+            "run_id": run_id, "script": script, "report": report, "started_at": start,
+            "seconds": round(time.time() - start, 3), "stages": json.dumps(current["stages"]),
+            "rows": current["rows"], "bytes": current["bytes"], "outcome": current["outcome"],
+            "error_class": error_class,
+        })
+
+
+def run_script(script, main, report=None, run_id=RUN_ID):
+    """ Run a script's main() with tracing and record the run. Pass report for a script that runs one report. """
+    start = time.time()
+    outcome, error_class = "ok", None
+    try:
+        if report is None:
+            return trace_run(script, main)
+
+        def main_report():
+            with record_report(script, report, run_id):
+                return main()
+        return trace_run(script, main_report)
+    except BaseException as e:
+        outcome, error_class = "error", type(e).__name__
+        raise
+    finally:
+        insert("runs", {"run_id": run_id, "script": script, "started_at": start,
+                        "seconds": round(time.time() - start, 3), "outcome": outcome, "error_class": error_class})
+
+
+def percentile(values, fraction):
+    """ Nearest-rank percentile of a list of numbers. """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def report_stats(days=30, by=None, stages=False, db_path=None):
+    """ Rows of (report, period, stage, runs, failure rate, p50, p95) over the last `days` days. """
+    since = time.time() - days * 86400
+    with connect(db_path) as db:
+        records = db.execute("SELECT report, started_at, seconds, stages, outcome FROM reports WHERE started_at >= ?",
+                             (since,)).fetchall()
+    groups = {}
+    for report, started_at, seconds, stage_json, outcome in records:
+        period = time.strftime(PERIOD_FORMATS[by], time.localtime(started_at)) if by else "all"
+        timings = json.loads(stage_json or "{}") if stages else {}
+        timings["total"] = seconds
+        for stage, stage_seconds in timings.items():
+            group = groups.setdefault((report, period, stage), {"seconds": [], "failures": 0})
+            group["seconds"].append(stage_seconds)
+            group["failures"] += outcome != "ok"
+    return [(report, period, stage, len(group["seconds"]), group["failures"] / len(group["seconds"]),
+             percentile(group["seconds"], 0.5), percentile(group["seconds"], 0.95))
+            for (report, period, stage), group in sorted(groups.items())]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency and failure rates per report from the run history.")
+    parser.add_argument("--days", type=int, default=30, help="How far back to look")
+    parser.add_argument("--by", choices=sorted(PERIOD_FORMATS), help="Break the numbers down by period")
+    parser.add_argument("--stages", action="store_true", help="Also show each stage's durations")
+    parser.add_argument("--db", default=HISTORY_DB)
+    args = parser.parse_args(argv)
+
+    rows = report_stats(args.days, args.by, args.stages, args.db)
+    if not rows:
+        print(f"No reports recorded in the last {args.days} days")
+        return 1
+    print(f"{'report':<24}{'period':<12}{'stage':<20}{'runs':>6}{'failed':>8}{'p50 s':>9}{'p95 s':>9}")
+    for report, period, stage, runs, failure_rate, p50, p95 in rows:
+        print(f"{report:<24}{period:<12}{stage:<20}{runs:>6}{failure_rate * 100:>7.1f}%{p50:>9.1f}{p95:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
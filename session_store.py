@@ -0,0 +1,121 @@
+"""
+Title: Infinite Campus Session Store
+File Name: session_store.py
+Purpose: Save the IC login cookies after a login and restore them on the next run to skip the login sequence.
+Dependencies: cryptography (optional), requests
+Description: Cookies are encrypted with Fernet and written to SESSION_FILE. The key is kept in KEY_FILE and
+created on first use with owner-only permissions. Both are written to a unique temp file first, so parallel
+workers saving at the same moment never share a temp file or see a half-written key. Before a saved session is
+loaded into Chrome it is checked with one GET of an authenticated page. If that request is redirected to the login page, the caller falls back
+to a full login. If cryptography is not installed nothing is saved and every run logs in.
+"""
+
+import os
+import json
+import logging
+import tempfile
+import requests
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+SESSION_FILE = os.environ.get("IC_SESSION_FILE", "/home/KIPPNashvilleData/ic_session.enc")
+KEY_FILE = os.environ.get("IC_SESSION_KEY_FILE", "/home/KIPPNashvilleData/ic_session.key")
+
+
+def write_private_temp(target_path, data):
+    """ Write data to a new owner-only temp file next to target_path and return its path. """
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(target_path)}.", suffix=".tmp",
+                                    dir=os.path.dirname(target_path) or ".")
+    with os.fdopen(fd, "wb") as tmp_file:
+        tmp_file.write(data)
+    return tmp_path
+
+
+def load_key(key_path=KEY_FILE):
+    """ Read the session key, creating it with owner-only permissions if it does not exist. """
+    if not os.path.exists(key_path):
+        # Linking a complete temp file publishes the key atomically; if another worker got there first, use theirs
+        tmp_path = write_private_temp(key_path, Fernet.generate_key())
+        try:
+            os.link(tmp_path, key_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(key_path, "rb") as key_file:
+        return key_file.read()
+
+
+def save_session(driver, session_path=SESSION_FILE, key_path=KEY_FILE):
+    """ Encrypt the driver's cookies and write them to disk. Returns False if the session was not saved. """
+    if Fernet is None:
+        logging.warning("cryptography is not installed; the IC session will not be saved.")
+        return False
+    try:
+        token = Fernet(load_key(key_path)).encrypt(json.dumps(driver.get_cookies()).encode("utf-8"))
+        tmp_path = write_private_temp(session_path, token)
+        try:
+            os.replace(tmp_path, session_path)
+        except OSError:
+            os.remove(tmp_path)
+            raise
+    except OSError as e:
+        logging.warning(f"Could not save IC session to {session_path}: {e}")
+        return False
+    logging.info(f"Saved IC session to {session_path}")
+    return True
+
+
+def load_cookies(session_path=SESSION_FILE, key_path=KEY_FILE):
+    """ Return the saved cookies, or None if there is no readable saved session. """
+    if Fernet is None or not os.path.exists(session_path) or not os.path.exists(key_path):
+        return None
+    with open(session_path, "rb") as session_file:
+        token = session_file.read()
+    try:
+        return json.loads(Fernet(load_key(key_path)).decrypt(token))
+    except (InvalidToken, ValueError) as e:
+        logging.warning(f"Could not read saved IC session: {e}")
+        return None
+
+
+def session_is_valid(cookies, check_url, timeout=15):
+    """ Check saved cookies with one request. An authenticated page answers 200; an expired session redirects to login. """
+    session = requests.Session()
+    for cookie in cookies:
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+    try:
+        response = session.get(check_url, allow_redirects=False, timeout=timeout)
+    except requests.RequestException as e:
+        logging.warning(f"Could not check saved IC session: {e}")
+        return False
+    return response.status_code == 200 and 'id="username"' not in response.text
+
+
+def restore_session(driver, ic_url, check_url, session_path=SESSION_FILE, key_path=KEY_FILE):
+    """ Load a still-valid saved session into the driver and open check_url. Returns False if a full login is needed. """
+    cookies = load_cookies(session_path, key_path)
+    if not cookies:
+        return False
+    if not session_is_valid(cookies, check_url):
+        logging.info("Saved IC session has expired")
+        return False
+
+    # Chrome only accepts cookies for the domain of the page that is open
+    driver.get(ic_url)
+    for cookie in cookies:
+        try:
+            driver.add_cookie(cookie)
+        except WebDriverException as e:
+            logging.warning(f"Skipped saved cookie {cookie.get('name')}: {e}")
+    driver.get(check_url)
+    if driver.find_elements(By.ID, "username"):
+        logging.info("Saved IC session was rejected by the site")
+        return False
+    logging.info("Restored saved IC session")
+    return True
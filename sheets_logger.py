@@ -0,0 +1,278 @@
+"""
+Title: Batched Google Sheets Logger
+File Name: sheets_logger.py
+Purpose: Log script progress to the PythonAnywhereLogs workbook without blocking the report loop on Sheets calls.
+Dependencies: gspread, oauth2client
+Description: setup_google_sheets returns a SheetLogger at once and never raises. It opens the worksheet on its
+own background thread. log_to_google_sheets stamps the message with the current time and puts it on a queue.
+The thread sends queued rows with one append_rows call when BATCH_SIZE rows are waiting or when the oldest has
+waited FLUSH_INTERVAL seconds. Anything left is sent when the script exits.
+If Sheets cannot be reached, or the worksheet could not be opened, the batch is written to a spool file in
+SPOOL_DIR. Spooled rows are sent ahead of the next batch that gets through, so they keep their original
+timestamps and order.
+Every script writes to the same workbook, and Sheets allows about 60 writes a minute per user. Each append takes
+a token from a TokenBucket shared by all processes through the SQLite file QUOTA_DB. While no token is free, the
+thread keeps collecting rows and sends them all in one append when a token frees up. A 429 or 5xx response is
+retried with exponential backoff, up to MAX_RETRIES times.
+Set IC_SHEETS_DISABLED=1 to keep every row in the spool file instead of writing to Sheets, e.g. for benchmark
+runs, and IC_SHEETS_CREDENTIALS_FILE or IC_SHEETS_SPREADSHEET to use another service account or workbook.
+An unexpected error in the thread is logged and the rows it was holding are spooled, so one bad spool line or
+unwritable directory does not stop logging for the rest of the run.
+"""
+
+import os
+import json
+import time
+import fcntl
+import queue
+import atexit
+import random
+import sqlite3
+import logging
+import threading
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+
+CREDENTIALS_FILE = os.environ.get("IC_SHEETS_CREDENTIALS_FILE", '/home/KIPPNashvilleData/creds.json')
+SPREADSHEET_OVERRIDE = os.environ.get("IC_SHEETS_SPREADSHEET")  # Replaces every script's workbook name when set
+SHEETS_DISABLED = os.environ.get("IC_SHEETS_DISABLED", "") not in ("", "0")
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+SPOOL_DIR = os.environ.get("IC_SHEETS_SPOOL_DIR", "/home/KIPPNashvilleData/sheets_spool/")
+BATCH_SIZE = 20
+FLUSH_INTERVAL = 10  # seconds
+CLOSE_TIMEOUT = 30  # seconds to wait for the last flush at exit
+QUOTA_DB = os.environ.get("IC_SHEETS_QUOTA_DB", "/home/KIPPNashvilleData/sheets_quota.db")
+WRITES_PER_MINUTE = 50  # Under the 60/minute user quota, leaving room for other clients
+MAX_RETRIES = 5
+RETRY_STATUS = {429, 500, 502, 503}
+
+_STOP = object()
+
+
+class TokenBucket:
+    """ A write rate limit shared by every process that opens the same SQLite file. """
+
+    def __init__(self, db_path=QUOTA_DB, rate_per_minute=WRITES_PER_MINUTE, name="sheets"):
+        self.db_path = db_path
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.name = name
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self.connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS bucket (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def try_acquire(self):
+        """ Take a token if one is free. Returns 0, or the seconds until the next token. """
+        db = self.connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")  # Lock out other processes between the read and the write
+            row = db.execute("SELECT tokens, updated FROM bucket WHERE name = ?", (self.name,)).fetchone()
+            now = time.time()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            if not wait:
+                tokens -= 1
+            db.execute("INSERT OR REPLACE INTO bucket (name, tokens, updated) VALUES (?, ?, ?)", (self.name, tokens, now))
+            db.execute("COMMIT")
+            return wait
+        finally:
+            db.close()
+
+    def acquire(self, timeout=None):
+        """ Wait for a token. Returns False if none was free within timeout seconds. """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def retry_status(error):
+    """ HTTP status of a Sheets error that is worth retrying, else None. """
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if status in RETRY_STATUS else None
+
+
+def load_spooled(spool, spool_path):
+    """ Rows from an open spool file. Lines that are not valid JSON rows, e.g. from a crash mid-write, are skipped. """
+    rows = []
+    skipped = 0
+    for line in spool:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            skipped += 1
+            continue
+        if isinstance(row, list):
+            rows.append(row)
+        else:
+            skipped += 1
+    if skipped:
+        logging.warning(f"Skipped {skipped} unreadable lines in {spool_path}")
+    return rows
+
+
+class SheetLogger:
+    """ Queues log rows for one worksheet and appends them in batches from a background thread. """
+
+    def __init__(self, spreadsheet_name, sheet_name, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 spool_dir=SPOOL_DIR, bucket=None):
+        self.spreadsheet_name = spreadsheet_name
+        self.sheet_name = sheet_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = os.path.join(spool_dir, f"{spreadsheet_name}_{sheet_name}.jsonl")
+        self.worksheet = None
+        self.bucket = bucket
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name=f"sheets-{sheet_name}", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, message):
+        """ Queue a message; returns immediately. """
+        self.queue.put([time.strftime("%Y-%m-%d %H:%M:%S"), message])
+
+    def flush(self, timeout=CLOSE_TIMEOUT):
+        """ Send everything queued so far and wait for it (up to timeout seconds). """
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """ Send what is left and stop the thread. """
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+
+    def connect(self):
+        """ Open the worksheet, or return None if Sheets cannot be reached or is disabled. """
+        if self.worksheet is None and not SHEETS_DISABLED:
+            try:
+                creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, SCOPE)
+                client = gspread.authorize(creds)
+                self.worksheet = client.open(self.spreadsheet_name).worksheet(self.sheet_name)
+            except Exception as e:
+                logging.warning(f"Could not open Google Sheet {self.spreadsheet_name}/{self.sheet_name}: {e}")
+        return self.worksheet
+
+    def get_bucket(self):
+        if self.bucket is None:
+            try:
+                self.bucket = TokenBucket()
+            except (sqlite3.Error, OSError) as e:
+                logging.warning(f"Could not open the Sheets quota database {QUOTA_DB}: {e}")
+        return self.bucket
+
+    def run(self):
+        pending = []
+        deadline = None
+        throttled_until = 0
+        while True:
+            timeout = None if not pending else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # The oldest pending row has waited flush_interval
+            if isinstance(item, list):
+                pending.append(item)
+                if len(pending) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(pending) < self.batch_size or time.monotonic() < throttled_until:
+                    continue
+            if pending:
+                try:
+                    if item is None or isinstance(item, list):
+                        # Throttled: keep collecting and send everything in one write when a token is free
+                        wait = self.take_token()
+                        if wait:
+                            deadline = throttled_until = time.monotonic() + wait
+                            continue
+                    elif not self.take_token(CLOSE_TIMEOUT):
+                        self.spool(pending)  # Flushing or exiting and still out of quota
+                        pending = []
+                    if pending:
+                        self.send(pending)
+                        pending = []
+                except Exception as e:
+                    logging.error(f"Google Sheets logger error; spooling {len(pending)} rows: {e}")
+                    try:
+                        self.spool(pending, "Google Sheets logger error")
+                    except Exception as spool_error:
+                        logging.error(f"Could not spool {len(pending)} Google Sheets rows; dropped them: {spool_error}")
+                    pending = []
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
+
+    def take_token(self, timeout=None):
+        """ With no timeout, return 0 if a write token was taken, else the seconds to wait for one.
+        With a timeout, wait up to that long and return True if a token was taken. """
+        bucket = self.get_bucket()
+        try:
+            if timeout is not None:
+                return bucket is None or bucket.acquire(timeout)
+            return 0 if bucket is None else bucket.try_acquire()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not check the Sheets quota database; writing anyway: {e}")
+            return True if timeout is not None else 0
+
+    def append(self, worksheet, rows):
+        """ append_rows, retrying 429 and 5xx responses with exponential backoff. """
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                worksheet.append_rows(rows, value_input_option="RAW")
+                return
+            except Exception as e:
+                status = retry_status(e)
+                if status is None or attempt == MAX_RETRIES:
+                    raise
+                delay = 2 ** attempt + random.uniform(0, 1)
+                logging.warning(f"Google Sheets returned {status}; retrying {len(rows)} rows in {delay:.1f} seconds")
+                time.sleep(delay)
+                self.take_token(CLOSE_TIMEOUT)
+
+    def send(self, rows):
+        """ Append spooled rows and then rows in one call; spool them all if the call fails. """
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        with open(self.spool_path, "a+") as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            spool.seek(0)
+            spooled = load_spooled(spool, self.spool_path)
+            worksheet = self.connect()
+            if worksheet is not None:
+                try:
+                    self.append(worksheet, spooled + rows)
+                    spool.truncate(0)
+                    return
+                except Exception as e:
+                    logging.warning(f"Could not log {len(rows)} rows to Google Sheets; spooled to {self.spool_path}: {e}")
+            for row in rows:
+                spool.write(json.dumps(row) + "\n")
+
+    def spool(self, rows, reason="Out of Google Sheets quota"):
+        """ Save rows for a later run to send. """
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        with open(self.spool_path, "a") as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            for row in rows:
+                spool.write(json.dumps(row) + "\n")
+        logging.warning(f"{reason}; spooled {len(rows)} rows to {self.spool_path}")
+
+
+def setup_google_sheets(spreadsheet_name, sheet_name):
+    """ Return a SheetLogger for a worksheet. The worksheet is opened in the background, so this never raises. """
+    return SheetLogger(SPREADSHEET_OVERRIDE or spreadsheet_name, sheet_name)
+
+
+def log_to_google_sheets(sheet, message):
+    sheet.log(message)
@@ -0,0 +1,238 @@
+"""
+Title: Raw Download Snapshot Store
+File Name: snapshot_store.py
+Purpose: Keep every night's raw report download, stored once per distinct content, retrievable by date and report.
+Dependencies: tracing.py (run id), zstandard (optional; gzip is used without it)
+Description: Before extract.html is renamed over <report>.html, archive_file stores it under its SHA-256 hash
+in ARCHIVE_DIR/objects/<first two hex chars>/<hash>.zst. The file is compressed with zstd, and identical
+extracts are only stored once. Each download is recorded in the manifest for its date,
+ARCHIVE_DIR/manifests/<YYYY-MM-DD>.json, under its report name with the run id and hash. A past night's
+report is then one manifest read and one object read away. prune drops manifests older than RETENTION_DAYS
+and deletes objects that no remaining manifest refers to. Objects written or reused in the last
+PRUNE_GRACE_SECONDS and in-flight .part files are left alone, since another bot may be archiving them and not
+have added them to its manifest yet.
+Usage:
+    python snapshot_store.py get 2024-10-10 student_data student_data_2024-10-10.html
+    python snapshot_store.py prune [--days 90]
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from tracing import RUN_ID
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_DIR = os.environ.get("IC_ARCHIVE_DIR", "/home/KIPPNashvilleData/icampus_archive/")
+RETENTION_DAYS = int(os.environ.get("IC_ARCHIVE_RETENTION_DAYS", 90))
+CHUNK_SIZE = 1024 * 1024
+PRUNE_GRACE_SECONDS = 24 * 60 * 60  # Unreferenced objects younger than this may still be waiting for a manifest entry
+
+
+def object_path(digest, archive_dir=ARCHIVE_DIR, suffix=None):
+    """ Where an object with this hash is stored. """
+    suffix = suffix or (".zst" if zstandard is not None else ".gz")
+    return os.path.join(archive_dir, "objects", digest[:2], f"{digest}{suffix}")
+
+
+def find_object(digest, archive_dir=ARCHIVE_DIR):
+    """ Path of a stored object in either compression, or None. """
+    for suffix in (".zst", ".gz"):
+        path = object_path(digest, archive_dir, suffix)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def file_digest(path):
+    """ SHA-256 of a file, read in chunks. """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compress_to(source_path, target_path):
+    """ Compress a file to target_path with zstd, or gzip if zstandard is not installed. """
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    # A temp file of its own per call, so worker threads archiving the same content do not share one
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(target_path)}.", suffix=".part",
+                                    dir=os.path.dirname(target_path))
+    try:
+        with os.fdopen(fd, "wb") as target, open(source_path, "rb") as source:
+            if target_path.endswith(".zst"):
+                zstandard.ZstdCompressor(level=10).copy_stream(source, target)
+            else:
+                with gzip.GzipFile(fileobj=target, mode="wb") as gz:
+                    shutil.copyfileobj(source, gz, CHUNK_SIZE)
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        remove_if_present(tmp_path)
+        raise
+
+
+def decompress_to(object_file, target_path):
+    """ Write an object's original bytes to target_path. """
+    with open(object_file, "rb") as source, open(target_path, "wb") as target:
+        if object_file.endswith(".zst"):
+            zstandard.ZstdDecompressor().copy_stream(source, target)
+        else:
+            with gzip.GzipFile(fileobj=source, mode="rb") as gz:
+                shutil.copyfileobj(gz, target, CHUNK_SIZE)
+
+
+def manifest_path(date, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, "manifests", f"{date}.json")
+
+
+def update_manifest(date, report, entry, archive_dir=ARCHIVE_DIR):
+    """ Append an entry for a report to a date's manifest. Locked so parallel workers do not lose entries. """
+    path = manifest_path(date, archive_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = load_manifest(date, archive_dir)
+        manifest.setdefault(report, []).append(entry)
+        tmp_path = f"{path}.part"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def load_manifest(date, archive_dir=ARCHIVE_DIR):
+    """ {report: [entries in run order]} for a date, or {} if nothing was archived that day. """
+    try:
+        with open(manifest_path(date, archive_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def archive_file(path, report, archive_dir=ARCHIVE_DIR, run_id=RUN_ID):
+    """ Store a raw download by content hash and record it in today's manifest. Returns the hash. """
+    digest = file_digest(path)
+    stored = find_object(digest, archive_dir)
+    if stored is not None:
+        try:
+            os.utime(stored)  # Reused objects count as new, so prune does not remove them before the manifest entry
+        except FileNotFoundError:  # Pruned since find_object
+            stored = None
+    if stored is None:
+        stored = object_path(digest, archive_dir)
+        compress_to(path, stored)
+        logging.info(f"Archived {os.path.basename(path)} for {report} as {digest[:12]}")
+    else:
+        logging.info(f"{os.path.basename(path)} for {report} is unchanged since {digest[:12]} was archived")
+    entry = {
+        "run_id": run_id,
+        "hash": digest,
+        "file_name": os.path.basename(path),
+        "size": os.path.getsize(path),
+        "archived_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    update_manifest(time.strftime("%Y-%m-%d"), report, entry, archive_dir)
+    return digest
+
+
+def retrieve(date, report, target_path, run_id=None, archive_dir=ARCHIVE_DIR):
+    """ Restore a report's download from a date (the last run that day unless run_id is given). Returns the entry. """
+    entries = load_manifest(date, archive_dir).get(report)
+    if not entries:
+        raise KeyError(f"No archived {report} for {date}")
+    if run_id is not None:
+        entries = [entry for entry in entries if entry["run_id"] == run_id]
+        if not entries:
+            raise KeyError(f"No archived {report} for run {run_id} on {date}")
+    entry = entries[-1]
+    object_file = find_object(entry["hash"], archive_dir)
+    if object_file is None:
+        raise FileNotFoundError(f"Archived object {entry['hash']} for {report} on {date} is missing")
+    decompress_to(object_file, target_path)
+    return entry
+
+
+def remove_if_present(path):
+    """ Delete a file. Returns False if it was already gone, e.g. removed by another prune. """
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def prune(retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, grace_seconds=PRUNE_GRACE_SECONDS):
+    """ Remove manifests older than retention_days, then objects no remaining manifest refers to.
+
+    In-flight .part files and objects modified in the last grace_seconds are kept, because a running bot may have
+    written them without recording them in a manifest yet.
+    """
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+    manifest_dir = os.path.join(archive_dir, "manifests")
+    if not os.path.isdir(manifest_dir):
+        return 0, 0
+    removed_manifests = 0
+    referenced = set()
+    for name in os.listdir(manifest_dir):
+        if not name.endswith(".json"):
+            continue
+        date = name[:-len(".json")]
+        if date < cutoff:
+            removed_manifests += remove_if_present(os.path.join(manifest_dir, name))
+            continue
+        for entries in load_manifest(date, archive_dir).values():
+            referenced.update(entry["hash"] for entry in entries)
+
+    removed_objects = 0
+    fresh_after = time.time() - grace_seconds
+    for root, _, files in os.walk(os.path.join(archive_dir, "objects")):
+        for name in files:
+            digest = name.split(".")[0]
+            if digest in referenced or name.endswith(".part"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) > fresh_after:
+                    continue
+            except FileNotFoundError:
+                continue
+            removed_objects += remove_if_present(path)
+    logging.info(f"Pruned {removed_manifests} manifests and {removed_objects} objects older than {retention_days} days")
+    return removed_manifests, removed_objects
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retrieve or prune archived IC report downloads.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    get = commands.add_parser("get", help="Restore a report's raw download from a date")
+    get.add_argument("date", help="YYYY-MM-DD")
+    get.add_argument("report", help="Report name, e.g. student_data")
+    get.add_argument("target", help="Where to write the file")
+    get.add_argument("--run-id", help="A specific run that day (default: the last one)")
+    prune_command = commands.add_parser("prune", help="Apply the retention policy")
+    prune_command.add_argument("--days", type=int, default=RETENTION_DAYS)
+    args = parser.parse_args(argv)
+
+    if args.command == "get":
+        entry = retrieve(args.date, args.report, args.target, args.run_id)
+        print(f"Restored {args.report} from run {entry['run_id']} ({entry['size']} bytes) to {args.target}")
+    else:
+        removed_manifests, removed_objects = prune(args.days)
+        print(f"Removed {removed_manifests} manifests and {removed_objects} objects")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
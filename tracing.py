@@ -0,0 +1,191 @@
+"""
+Title: Pipeline Tracing
+File Name: tracing.py
+Purpose: Time every stage of a report run (driver startup, login, frame switches, report steps, parsing) so
+slow runs can be broken down by where the time went.
+Dependencies: None (standard library)
+Description: span(name, **attrs) is a context manager that times a block and appends one JSON line to TRACE_FILE
+when the block exits. The line has the run id, span and parent ids, start time, seconds, thread, status, the
+error class if the block raised, and any attributes. traced(name) does the same for a whole function. Spans
+nest per thread, so a "report" span holds its "report_click", "option_setting", "generation_wait", "download"
+and "parse" spans. record_span writes a span whose timing was measured elsewhere. add_listener lets another
+module see each span as it ends (run_history uses it to collect stage durations).
+trace_run wraps a script's main() in a "run" span and then logs a summary table for the run. For each span
+name it shows the count, total, mean and max seconds, and its share of the run. The table can also be printed
+later:
+    python tracing.py [--run RUN_ID] [--file TRACE_FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+TRACE_FILE = os.environ.get("IC_TRACE_FILE", "/home/KIPPNashvilleData/infinite_campus/ic_traces.jsonl")
+RUN_ID = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+
+_span_ids = itertools.count(1)
+_local = threading.local()
+_write_lock = threading.Lock()
+_listeners = []
+
+
+def current_stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def add_listener(listener):
+    """ Call listener(record) in the span's thread each time a span ends. """
+    _listeners.append(listener)
+
+
+def write_record(record, trace_file=None):
+    """ Append one span as a JSON line and pass it to the listeners. Tracing never fails the pipeline. """
+    for listener in _listeners:
+        try:
+            listener(record)
+        except Exception as e:
+            logging.warning(f"Trace listener failed on span {record['name']}: {e}")
+    try:
+        with _write_lock, open(trace_file or TRACE_FILE, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+    except OSError as e:
+        logging.warning(f"Could not write trace span {record['name']}: {e}")
+
+
+def record_span(name, start, seconds, status="ok", error=None, **attrs):
+    """ Write a span measured by the caller. start is a time.time() value. """
+    stack = current_stack()
+    write_record({
+        "run_id": RUN_ID,
+        "span_id": next(_span_ids),
+        "parent_id": stack[-1] if stack else None,
+        "name": name,
+        "start": round(start, 3),
+        "seconds": round(seconds, 3),
+        "thread": threading.current_thread().name,
+        "status": status,
+        "error": error,
+        **attrs,
+    })
+
+
+@contextmanager
+def span(name, **attrs):
+    """ Time a block as a span. Yields the attribute dict, so the block can add results such as row counts. """
+    stack = current_stack()
+    span_id = next(_span_ids)
+    record = {"run_id": RUN_ID, "span_id": span_id, "parent_id": stack[-1] if stack else None, "name": name}
+    start = time.time()
+    started = time.perf_counter()
+    status, error = "ok", None
+    stack.append(span_id)
+    try:
+        yield attrs
+    except BaseException as e:
+        status, error = "error", type(e).__name__
+        raise
+    finally:
+        stack.pop()
+        record.update(start=round(start, 3), seconds=round(time.perf_counter() - started, 3),
+                      thread=threading.current_thread().name, status=status, error=error, **attrs)
+        write_record(record)
+
+
+def traced(name=None):
+    """ Decorator: run each call of the function in a span (named after the function by default). """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def iter_spans(trace_file=None):
+    """ Yield the spans in a trace file, skipping damaged lines. """
+    try:
+        with open(trace_file or TRACE_FILE, errors="replace") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    except OSError:
+        return
+
+
+def last_run_id(trace_file=None):
+    run_id = None
+    for record in iter_spans(trace_file):
+        run_id = record.get("run_id", run_id)
+    return run_id
+
+
+def run_summary(run_id=None, trace_file=None):
+    """ Rows of (name, count, total, mean, max, share of run) for a run, slowest total first. """
+    run_id = run_id or last_run_id(trace_file)
+    totals = {}
+    run_seconds = None
+    for record in iter_spans(trace_file):
+        if record.get("run_id") != run_id:
+            continue
+        seconds = record.get("seconds", 0)
+        stats = totals.setdefault(record["name"], [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        if record["name"] == "run":
+            run_seconds = seconds
+    run_seconds = run_seconds or max((stats[1] for stats in totals.values()), default=0)
+    rows = [(name, count, total, total / count, longest, total / run_seconds if run_seconds else 0)
+            for name, (count, total, longest) in totals.items()]
+    return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+def format_summary(rows, run_id=RUN_ID):
+    lines = [f"Trace summary for run {run_id}",
+             f"{'span':<24}{'count':>7}{'total s':>10}{'mean s':>9}{'max s':>9}{'% run':>8}"]
+    for name, count, total, mean, longest, share in rows:
+        lines.append(f"{name:<24}{count:>7}{total:>10.2f}{mean:>9.2f}{longest:>9.2f}{share * 100:>7.1f}%")
+    return "\n".join(lines)
+
+
+def log_run_summary(run_id=RUN_ID):
+    for line in format_summary(run_summary(run_id), run_id).splitlines():
+        logging.info(line)
+
+
+def trace_run(script, main):
+    """ Run a script's main() in a "run" span and log the run's summary table afterwards. """
+    try:
+        with span("run", script=script):
+            return main()
+    finally:
+        log_run_summary()
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the stage timings of a traced report run.")
+    parser.add_argument("--run", help="Run id (default: the last run in the trace file)")
+    parser.add_argument("--file", default=TRACE_FILE, help="Trace file")
+    args = parser.parse_args(argv)
+    run_id = args.run or last_run_id(args.file)
+    if run_id is None:
+        print(f"No spans in {args.file}")
+        return 1
+    print(format_summary(run_summary(run_id, args.file), run_id))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())